@@ -6,6 +6,7 @@ import brewtils.rest
 import bartender._version
 from bartender.app import BartenderApp
 from bartender.errors import ConfigurationError
+from bartender.connection_pool import HttpPool
 from bartender.specification import get_default_logging_config
 from brewtils.errors import ValidationError
 from brewtils.rest.easy_client import EasyClient
@@ -16,11 +17,12 @@ __version__ = bartender._version.__version__
 application = None
 config = None
 logger = None
+http_pool = None
 bv_client = None
 
 
 def setup_bartender(spec, cli_args):
-    global application, config, logger, bv_client
+    global application, config, logger, http_pool, bv_client
 
     config = bg_utils.load_application_config(spec, cli_args)
     config.web.url_prefix = brewtils.rest.normalize_url_prefix(config.web.url_prefix)
@@ -29,7 +31,10 @@ def setup_bartender(spec, cli_args):
     bg_utils.setup_application_logging(config, log_default)
     logger = logging.getLogger(__name__)
 
+    http_pool = HttpPool(**config.http)
+
     bv_client = EasyClient(**config.web)
+    http_pool.mount(bv_client.client.session)
 
     application = BartenderApp()
 
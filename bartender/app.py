@@ -10,6 +10,8 @@ from requests.exceptions import RequestException
 
 import bartender
 import bg_utils
+from bartender.catalog import shared_generation, SystemCatalog
+from bartender.fair_scheduler import FairScheduler
 from bartender.local_plugins.loader import LocalPluginLoader
 from bartender.local_plugins.manager import LocalPluginsManager
 from bartender.local_plugins.monitor import LocalPluginMonitor
@@ -17,10 +19,14 @@ from bartender.local_plugins.registry import LocalPluginRegistry
 from bartender.local_plugins.validator import LocalPluginValidator
 from bartender.mongo_pruner import MongoPruner
 from bartender.monitor import PluginStatusMonitor
+from bartender.outbox import OutboxPublisher, RequestOutbox
 from bartender.pika import PikaClient
+from bartender.publish_filter import PublishFilter
+from bartender.spool import PublishSpool
 from bartender.pyrabbit import PyrabbitClient
 from bartender.request_validator import RequestValidator
-from bartender.thrift.handler import BartenderHandler
+from bartender.thrift.handler import BartenderHandler, ForwardingHandler, METHOD_POOLS
+from bartender.thrift.processes import ThriftProcessPool, ThriftSupervisor
 from bartender.thrift.server import make_server
 from bg_utils.mongo.models import Event, Request
 from brewtils.models import Events
@@ -33,37 +39,59 @@ class BartenderApp(StoppableThread):
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
-        self.request_validator = RequestValidator()
+        # Thrift processes empty their catalogs whenever any of them invalidates
+        self.catalog_generation = (
+            shared_generation() if bartender.config.thrift.processes > 1 else None
+        )
+
+        thrift_kwargs = dict(
+            service=bg_utils.bg_thrift.BartenderBackend,
+            host=bartender.config.thrift.host,
+            port=bartender.config.thrift.port,
+            backlog=bartender.config.thrift.backlog,
+            tcp_nodelay=bartender.config.thrift.tcp_nodelay,
+            client_timeout=bartender.config.thrift.client_timeout,
+            idle_timeout=bartender.config.thrift.idle_timeout,
+            queue_depth=bartender.config.thrift.queue_depth,
+            max_wait=bartender.config.thrift.max_wait,
+            stats_interval=bartender.config.thrift.stats_interval,
+            pools={
+                "lifecycle": bartender.config.thrift.pools.lifecycle.max_workers,
+                "admin": bartender.config.thrift.pools.admin.max_workers,
+            },
+            method_pools=METHOD_POOLS,
+            cert_file=bartender.config.thrift.ssl.cert_file,
+            handshake_timeout=bartender.config.thrift.ssl.handshake_timeout,
+            session_tickets=bartender.config.thrift.ssl.session_tickets,
+            transport=bartender.config.thrift.transport,
+            protocol=bartender.config.thrift.protocol,
+        )
+
+        # Forked before anything here starts a thread (the publish spool's
+        # replayer, say), so the thrift processes it forks never inherit a lock
+        # one of them was holding
+        self.thrift_supervisor = None
+        if bartender.config.thrift.processes > 1:
+            self.thrift_supervisor = ThriftSupervisor(
+                processes=bartender.config.thrift.processes,
+                make_handler=self._make_process_handler,
+                ipc_socket=bartender.config.thrift.ipc_socket,
+                **thrift_kwargs
+            )
+            self.thrift_supervisor.start()
+
+        self.request_validator = RequestValidator(catalog=self._make_catalog())
+        self.scheduler = FairScheduler(**bartender.config.scheduler)
         self.plugin_registry = LocalPluginRegistry()
         self.plugin_validator = LocalPluginValidator()
 
         self.plugin_loader = LocalPluginLoader(
-            validator=self.plugin_validator, registry=self.plugin_registry
+            validator=self.plugin_validator,
+            registry=self.plugin_registry,
+            catalog=self.request_validator.catalog,
         )
 
-        self.clients = {
-            "pika": PikaClient(
-                host=bartender.config.amq.host,
-                port=bartender.config.amq.connections.message.port,
-                ssl=bartender.config.amq.connections.message.ssl,
-                user=bartender.config.amq.connections.admin.user,
-                password=bartender.config.amq.connections.admin.password,
-                virtual_host=bartender.config.amq.virtual_host,
-                connection_attempts=bartender.config.amq.connection_attempts,
-                blocked_connection_timeout=bartender.config.amq.blocked_connection_timeout,
-                exchange=bartender.config.amq.exchange,
-            ),
-            "pyrabbit": PyrabbitClient(
-                host=bartender.config.amq.host,
-                virtual_host=bartender.config.amq.virtual_host,
-                **bartender.config.amq.connections.admin
-            ),
-            "public": PikaClient(
-                host=bartender.config.publish_hostname,
-                virtual_host=bartender.config.amq.virtual_host,
-                **bartender.config.amq.connections.message
-            ),
-        }
+        self.clients = self._make_clients()
 
         self.plugin_manager = LocalPluginsManager(
             loader=self.plugin_loader,
@@ -77,16 +105,26 @@ class BartenderApp(StoppableThread):
             clients=self.clients,
             plugin_manager=self.plugin_manager,
             request_validator=self.request_validator,
+            scheduler=self.scheduler,
+            publish_filter=PublishFilter(**bartender.config.publish_filter),
+            outbox=self._make_outbox(),
         )
 
-        self.helper_threads = [
-            HelperThread(
-                make_server,
-                service=bg_utils.bg_thrift.BartenderBackend,
+        if bartender.config.thrift.processes > 1:
+            # Local plugins (and the monitors) stay in this process, the
+            # thrift processes forward calls that need them back to us
+            thrift_thread = HelperThread(
+                ThriftProcessPool,
+                supervisor=self.thrift_supervisor,
                 handler=self.handler,
-                host=bartender.config.thrift.host,
-                port=bartender.config.thrift.port,
-            ),
+            )
+        else:
+            thrift_thread = HelperThread(
+                make_server, handler=self.handler, **thrift_kwargs
+            )
+
+        self.helper_threads = [
+            thrift_thread,
             HelperThread(
                 LocalPluginMonitor,
                 plugin_manager=self.plugin_manager,
@@ -100,6 +138,18 @@ class BartenderApp(StoppableThread):
             ),
         ]
 
+        if self.handler.outbox is not None:
+            self.helper_threads.append(
+                HelperThread(
+                    OutboxPublisher,
+                    outbox=self.handler.outbox,
+                    pika_client=self.clients["pika"],
+                    batch_size=bartender.config.outbox.batch_size,
+                    poll_interval=bartender.config.outbox.poll_interval,
+                    retry_delay=bartender.config.outbox.retry_delay,
+                )
+            )
+
         # Only want to run the MongoPruner if it would do anything
         tasks, run_every = self._setup_pruning_tasks()
         if run_every:
@@ -164,6 +214,13 @@ class BartenderApp(StoppableThread):
         for helper_thread in reversed(self.helper_threads):
             helper_thread.stop()
 
+        self.request_validator.shutdown()
+        self.clients["pika"].close()
+        self.scheduler.log_stats()
+
+        if bartender.http_pool is not None:
+            bartender.http_pool.log_stats()
+
         try:
             bartender.bv_client.publish_event(name=Events.BARTENDER_STOPPED.name)
         except RequestException:
@@ -171,6 +228,74 @@ class BartenderApp(StoppableThread):
 
         self.logger.info("Successfully shut down Bartender")
 
+    @staticmethod
+    def _make_clients():
+        return {
+            "pika": PikaClient(
+                host=bartender.config.amq.host,
+                port=bartender.config.amq.connections.message.port,
+                ssl=bartender.config.amq.connections.message.ssl,
+                user=bartender.config.amq.connections.admin.user,
+                password=bartender.config.amq.connections.admin.password,
+                virtual_host=bartender.config.amq.virtual_host,
+                connection_attempts=bartender.config.amq.connection_attempts,
+                blocked_connection_timeout=bartender.config.amq.blocked_connection_timeout,
+                exchange=bartender.config.amq.exchange,
+                spool=BartenderApp._make_spool(),
+                spool_retry_interval=bartender.config.amq.spool.retry_interval,
+                **bartender.config.amq.publisher
+            ),
+            "pyrabbit": PyrabbitClient(
+                host=bartender.config.amq.host,
+                virtual_host=bartender.config.amq.virtual_host,
+                **bartender.config.amq.connections.admin
+            ),
+            "public": PikaClient(
+                host=bartender.config.publish_hostname,
+                virtual_host=bartender.config.amq.virtual_host,
+                **bartender.config.amq.connections.message
+            ),
+        }
+
+    def _make_process_handler(self, ipc_socket):
+        """Build the handler for a thrift server process, in that process"""
+        return ForwardingHandler(
+            ipc_socket=ipc_socket,
+            clients=self._make_clients(),
+            request_validator=RequestValidator(catalog=self._make_catalog()),
+            scheduler=FairScheduler(**bartender.config.scheduler),
+            publish_filter=PublishFilter(**bartender.config.publish_filter),
+            outbox=self._make_outbox(),
+        )
+
+    def _make_catalog(self):
+        return SystemCatalog(
+            ttl=bartender.config.validator.catalog.ttl,
+            generation=self.catalog_generation,
+        )
+
+    @staticmethod
+    def _make_spool():
+        if not bartender.config.amq.spool.directory:
+            return None
+
+        return PublishSpool(
+            bartender.config.amq.spool.directory,
+            segment_size=bartender.config.amq.spool.segment_size,
+            max_size=bartender.config.amq.spool.max_size,
+            fsync=bartender.config.amq.spool.fsync,
+        )
+
+    @staticmethod
+    def _make_outbox():
+        if not bartender.config.outbox.enabled:
+            return None
+
+        return RequestOutbox(
+            collection=bartender.config.outbox.collection,
+            lease=bartender.config.outbox.lease,
+        )
+
     @staticmethod
     def _setup_pruning_tasks():
 
@@ -0,0 +1,192 @@
+import logging
+import time
+from threading import BoundedSemaphore, Lock
+
+from bartender.errors import BulkheadFullError, CircuitOpenError
+
+
+class CircuitBreaker(object):
+    """Stops calling a backend that keeps failing
+
+    After ``failure_threshold`` consecutive failures the breaker opens and calls
+    are rejected. Once ``reset_timeout`` seconds have passed a single probe call
+    is allowed through (half-open). If it succeeds the breaker closes, otherwise
+    it opens again.
+
+    :param name: Name of the backend, used in messages
+    :param failure_threshold: Consecutive failures needed to open the breaker
+    :param reset_timeout: Seconds to wait before allowing a probe call
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """Check if a call may be made
+
+        :raises CircuitOpenError: The breaker is open, or half-open with a probe
+            call already in progress
+        :return: None
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+
+            if (
+                self._state == self.OPEN
+                and time.time() - self._opened_at >= self._reset_timeout
+            ):
+                self.logger.info("Probing backend %s", self.name)
+                self._state = self.HALF_OPEN
+                return
+
+        raise CircuitOpenError(
+            "Backend %s is unavailable after %d consecutive failures"
+            % (self.name, self._failure_threshold)
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.logger.info("Backend %s has recovered", self.name)
+
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self._failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    self.logger.warning(
+                        "Backend %s has failed %d times, no longer calling it",
+                        self.name,
+                        self._failures,
+                    )
+
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+
+class Bulkhead(object):
+    """Limits the number of calls in progress to a backend
+
+    :param name: Name of the backend, used in messages
+    :param max_concurrent: Maximum number of calls in progress
+    """
+
+    def __init__(self, name, max_concurrent=5):
+        self.name = name
+        self._max_concurrent = max_concurrent
+        self._semaphore = BoundedSemaphore(max_concurrent)
+
+    def acquire(self):
+        """Reserve a call slot without waiting
+
+        :raises BulkheadFullError: All slots are in use
+        :return: None
+        """
+        if not self._semaphore.acquire(False):
+            raise BulkheadFullError(
+                "Backend %s already has %d calls in progress"
+                % (self.name, self._max_concurrent)
+            )
+
+    def release(self):
+        self._semaphore.release()
+
+
+class BackendGuard(object):
+    """Circuit breakers and bulkheads for a set of named backends
+
+    A breaker and bulkhead are created for each backend the first time it is
+    called, so a slow or failing backend can only affect calls to itself.
+
+    :param failure_threshold: Consecutive failures needed to open a breaker
+    :param reset_timeout: Seconds to wait before probing an open breaker
+    :param max_concurrent: Maximum number of calls in progress per backend
+    :param ignore: Exception types that don't count as backend failures
+    """
+
+    def __init__(
+        self, failure_threshold=5, reset_timeout=30, max_concurrent=5, ignore=()
+    ):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._max_concurrent = max_concurrent
+        self._ignore = tuple(ignore)
+
+        self._backends = {}
+        self._lock = Lock()
+
+    def call(self, backend, func, *args, **kwargs):
+        """Call a function on behalf of a backend
+
+        :param backend: Name of the backend
+        :param func: The function to call
+        :raises BackendUnavailableError: The call was rejected
+        :return: The function's return value
+        """
+        breaker, bulkhead = self._get(backend)
+
+        breaker.before_call()
+        try:
+            bulkhead.acquire()
+        except BulkheadFullError:
+            # A rejected probe must not leave the breaker stuck half-open
+            if breaker.state == CircuitBreaker.HALF_OPEN:
+                breaker.record_failure()
+            raise
+
+        try:
+            result = func(*args, **kwargs)
+        except self._ignore:
+            breaker.record_success()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            bulkhead.release()
+
+        breaker.record_success()
+        return result
+
+    def state(self, backend):
+        """Current circuit breaker state for a backend"""
+        return self._get(backend)[0].state
+
+    def _get(self, backend):
+        with self._lock:
+            if backend not in self._backends:
+                self._backends[backend] = (
+                    CircuitBreaker(
+                        backend,
+                        failure_threshold=self._failure_threshold,
+                        reset_timeout=self._reset_timeout,
+                    ),
+                    Bulkhead(backend, max_concurrent=self._max_concurrent),
+                )
+
+            return self._backends[backend]
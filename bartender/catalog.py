@@ -0,0 +1,385 @@
+import logging
+import multiprocessing
+import time
+from collections import namedtuple
+from threading import RLock, Thread
+
+from bartender.validation_plan import fingerprint
+from bg_utils.mongo.models import Command, Instance, System
+
+CachedChoices = namedtuple(
+    "CachedChoices", ["type", "display", "value", "strict", "details"]
+)
+
+CachedParameter = namedtuple(
+    "CachedParameter",
+    [
+        "key",
+        "type",
+        "multi",
+        "display_name",
+        "optional",
+        "default",
+        "description",
+        "choices",
+        "nullable",
+        "maximum",
+        "minimum",
+        "regex",
+        "form_input_type",
+        "parameters",
+    ],
+)
+
+CachedCommand = namedtuple(
+    "CachedCommand",
+    ["name", "command_type", "output_type", "parameters", "fingerprint"],
+)
+
+
+class CachedSystem(object):
+    """Read-only view of the parts of a System needed to validate Requests
+
+    Also keeps the content type each Instance's Requests are published in, as
+    negotiated when the Instance was initialized.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "version",
+        "instance_names",
+        "content_types",
+        "commands",
+        "command_index",
+        "loaded_at",
+        "partial",
+    )
+
+    def __init__(
+        self,
+        id,
+        name,
+        version,
+        instance_names,
+        commands,
+        loaded_at,
+        partial=False,
+        content_types=None,
+    ):
+        self.id = id
+        self.name = name
+        self.version = version
+        self.instance_names = frozenset(instance_names)
+        self.content_types = content_types or {}
+        self.commands = tuple(commands)
+        self.command_index = dict((command.name, command) for command in commands)
+        self.loaded_at = loaded_at
+        self.partial = partial
+
+    def __repr__(self):
+        return "<CachedSystem: name=%s, version=%s>" % (self.name, self.version)
+
+    @classmethod
+    def from_system(cls, system):
+        """Create a CachedSystem from a System
+
+        :param system: The System to convert
+        :return: The CachedSystem
+        """
+        return cls(
+            id=system.id,
+            name=system.name,
+            version=system.version,
+            instance_names=system.instance_names,
+            commands=[_freeze_command(command) for command in system.commands],
+            loaded_at=time.time(),
+            content_types=dict(
+                (instance.name, _content_type(instance.queue_info))
+                for instance in system.instances
+            ),
+        )
+
+    @classmethod
+    def load_for_command(cls, name, version, command_name):
+        """Load just enough of a System to validate Requests for one command
+
+        Only the System's instance names and the single matching command are
+        fetched, so the rest of the System's commands are never decoded.
+
+        :param name: The System name
+        :param version: The System version
+        :param command_name: The command name
+        :return: A partial CachedSystem, or None if no such System exists
+        """
+        document = (
+            System.objects(name=name, version=version)
+            .only("id", "instances")
+            .as_pymongo()
+            .first()
+        )
+        if document is None:
+            return None
+
+        instances = Instance.objects(id__in=document.get("instances", [])).scalar(
+            "name", "queue_info"
+        )
+        command = Command.objects(system=document["_id"], name=command_name).first()
+
+        return cls(
+            id=document["_id"],
+            name=name,
+            version=version,
+            instance_names=[name for name, _ in instances],
+            commands=[_freeze_command(command)] if command else [],
+            loaded_at=time.time(),
+            partial=True,
+            content_types=dict(
+                (name, _content_type(queue_info)) for name, queue_info in instances
+            ),
+        )
+
+
+class SystemCatalog(object):
+    """Thread-safe, in-process cache of System definitions
+
+    Entries are keyed by System name and version. Entries older than ``ttl``
+    seconds are reloaded on their next lookup so that changes made by other
+    processes (brew-view registering a System, for example) are picked up.
+    An entry that is missing the command or instance asked for is reloaded
+    straight away (at most once every ``MISS_RELOAD_INTERVAL`` seconds), so a
+    command or instance added since it was loaded isn't rejected.
+
+    Changes made by this process should be announced by calling ``invalidate``.
+    Catalogs in several processes can share a ``generation`` counter, created
+    with ``shared_generation`` before the processes are started, so that an
+    invalidation in any of them empties all of them.
+
+    :param ttl: Number of seconds an entry may be used before it is reloaded
+    :param generation: Counter shared with other processes' catalogs
+    """
+
+    # Minimum seconds between reloads of an entry caused by lookups it can't
+    # answer, so requests for a command that really doesn't exist can't make
+    # every lookup go to the database
+    MISS_RELOAD_INTERVAL = 1
+
+    def __init__(self, ttl=10, generation=None):
+        self.logger = logging.getLogger(__name__)
+        self._ttl = ttl
+        self._entries = {}
+        self._loading = set()
+        self._generation = 0
+        self._lock = RLock()
+
+        self._shared = generation
+        self._shared_seen = generation.value if generation is not None else None
+
+    def get(self, name, version, command_name=None, instance_name=None):
+        """Get the catalog entry for a System
+
+        :param name: The System name
+        :param version: The System version
+        :param command_name: A command the entry should have, if there is one
+        :param instance_name: An instance the entry should have, if there is one
+        :return: The CachedSystem, or None if no such System exists
+        """
+        entry, generation = self._fresh(name, version, command_name, instance_name)
+        if entry is not None:
+            return entry
+
+        return self._load(name, version, generation)
+
+    def get_for_command(self, name, version, command_name, instance_name=None):
+        """Get enough of a System to validate Requests for one command
+
+        If the catalog has a usable entry it is returned. Otherwise only the parts
+        of the System needed for the command are loaded, and the full entry is
+        loaded in the background for later lookups.
+
+        :param name: The System name
+        :param version: The System version
+        :param command_name: The command name
+        :param instance_name: An instance the entry should have, if there is one
+        :return: The CachedSystem (possibly partial), or None if no such System
+            exists
+        """
+        entry, _ = self._fresh(name, version, command_name, instance_name)
+        if entry is not None:
+            return entry
+
+        entry = CachedSystem.load_for_command(name, version, command_name)
+        if entry is None:
+            self.invalidate(name, version)
+            return None
+
+        # Validation errors list every command, so that needs the full System
+        if command_name not in entry.command_index:
+            return self.get(name, version, command_name)
+
+        if self._ttl > 0:
+            self._load_in_background(name, version)
+
+        return entry
+
+    def invalidate(self, name=None, version=None):
+        """Remove entries from the catalog
+
+        :param name: The System name. If None every entry is removed.
+        :param version: The System version. If None every version of the named
+            System is removed.
+        :return: None
+        """
+        with self._lock:
+            if self._shared is not None:
+                with self._shared.get_lock():
+                    previous = self._shared.value
+                    self._shared.value += 1
+
+                # Only skip clearing everything if nobody else invalidated since
+                if previous == self._shared_seen:
+                    self._shared_seen = previous + 1
+
+            self._generation += 1
+
+            if name is None:
+                self._entries.clear()
+            else:
+                for key in list(self._entries):
+                    if key[0] == name and (version is None or key[1] == version):
+                        del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _fresh(self, name, version, command_name=None, instance_name=None):
+        """Get a usable entry, if there is one, and the current generation"""
+        with self._lock:
+            self._check_shared()
+            entry = self._entries.get((name, version))
+            generation = self._generation
+
+        if entry is None:
+            return None, generation
+
+        age = time.time() - entry.loaded_at
+        if age >= self._ttl:
+            return None, generation
+
+        missing = (
+            command_name is not None and command_name not in entry.command_index
+        ) or (instance_name is not None and instance_name not in entry.instance_names)
+        if missing and age >= self.MISS_RELOAD_INTERVAL:
+            return None, generation
+
+        return entry, generation
+
+    def _check_shared(self):
+        """Empty the catalog if another process has invalidated (lock held)"""
+        if self._shared is None:
+            return
+
+        seen = self._shared.value
+        if seen != self._shared_seen:
+            self._shared_seen = seen
+            self._generation += 1
+            self._entries.clear()
+
+    def _load(self, name, version, generation):
+        system = System.find_unique(name, version)
+        if system is None:
+            self.invalidate(name, version)
+            return None
+
+        entry = CachedSystem.from_system(system)
+        self.logger.debug("Loaded System %s-%s into the catalog", name, version)
+
+        # Don't store an entry loaded before an invalidation finished
+        with self._lock:
+            if generation == self._generation:
+                self._entries[(name, version)] = entry
+
+        return entry
+
+    def _load_in_background(self, name, version):
+        """Load a full entry on a daemon thread, unless one is already loading"""
+        key = (name, version)
+
+        with self._lock:
+            if key in self._loading:
+                return
+            self._loading.add(key)
+            generation = self._generation
+
+        def target():
+            try:
+                self._load(name, version, generation)
+            except Exception as ex:
+                self.logger.warning(
+                    "Error loading System %s-%s into the catalog: %s", name, version, ex
+                )
+            finally:
+                with self._lock:
+                    self._loading.discard(key)
+
+        thread = Thread(target=target, name="SystemCatalogLoad")
+        thread.daemon = True
+        thread.start()
+
+
+def shared_generation():
+    """Counter letting SystemCatalogs in several processes invalidate together
+
+    Must be created before the processes sharing it are started.
+    """
+    return multiprocessing.Value("L", 0)
+
+
+def _freeze_choices(choices):
+    if choices is None:
+        return None
+
+    return CachedChoices(
+        type=choices.type,
+        display=choices.display,
+        value=choices.value,
+        strict=choices.strict,
+        details=choices.details,
+    )
+
+
+def _freeze_parameter(parameter):
+    return CachedParameter(
+        key=parameter.key,
+        type=parameter.type,
+        multi=parameter.multi,
+        display_name=parameter.display_name,
+        optional=parameter.optional,
+        default=parameter.default,
+        description=parameter.description,
+        choices=_freeze_choices(parameter.choices),
+        nullable=parameter.nullable,
+        maximum=parameter.maximum,
+        minimum=parameter.minimum,
+        regex=parameter.regex,
+        form_input_type=parameter.form_input_type,
+        parameters=tuple(_freeze_parameter(p) for p in parameter.parameters or []),
+    )
+
+
+def _content_type(queue_info):
+    """Content type negotiated for an Instance, or None if it never was"""
+    return (queue_info or {}).get("content_type")
+
+
+def _freeze_command(command):
+    parameters = tuple(_freeze_parameter(p) for p in command.parameters or [])
+
+    return CachedCommand(
+        name=command.name,
+        command_type=command.command_type,
+        output_type=command.output_type,
+        parameters=parameters,
+        fingerprint=fingerprint(parameters),
+    )
@@ -0,0 +1,157 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+
+
+class _Entry(object):
+    __slots__ = ("value", "expires", "stale_until")
+
+    def __init__(self, value, expires, stale_until):
+        self.value = value
+        self.expires = expires
+        self.stale_until = stale_until
+
+
+class _Call(object):
+    """A lookup in progress that other threads can wait on"""
+
+    __slots__ = ("_event", "_value", "_exception")
+
+    def __init__(self):
+        self._event = Event()
+        self._value = None
+        self._exception = None
+
+    def set_result(self, value):
+        self._value = value
+        self._event.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class ChoicesCache(object):
+    """Bounded LRU / TTL cache for dynamic choices lookups
+
+    Concurrent lookups of the same key are coalesced so only one of them calls
+    the loader; the others wait for and share its result (or exception). Failed
+    lookups are never cached.
+
+    Once an entry's TTL has passed it may still be served for ``stale_ttl``
+    seconds while a single background refresh runs.
+
+    :param max_size: Maximum number of entries to keep
+    :param ttl: Default number of seconds an entry is fresh. 0 disables caching,
+        though concurrent lookups are still coalesced.
+    :param stale_ttl: Number of seconds past its TTL that an entry may be served
+        while it is being refreshed
+    """
+
+    def __init__(self, max_size=1000, ttl=0, stale_ttl=0):
+        self.logger = logging.getLogger(__name__)
+        self._max_size = max_size
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def get(self, key, loader, ttl=None):
+        """Get a value, calling loader if there is no usable cached value
+
+        :param key: Hashable cache key
+        :param loader: Callable taking no arguments that produces the value
+        :param ttl: Number of seconds the value is fresh. If None the cache's
+            default TTL is used.
+        :return: The value
+        """
+        ttl = self._ttl if ttl is None else ttl
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if now < entry.stale_until:
+                    self._entries[key] = entry
+
+                if now < entry.expires:
+                    return entry.value
+
+                if now < entry.stale_until:
+                    if key not in self._in_flight:
+                        self.run_in_background(self._load, key, loader, ttl)
+                    return entry.value
+
+        return self._load(key, loader, ttl)
+
+    def invalidate(self, key=None):
+        """Remove one entry, or every entry if key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def run_in_background(self, func, *args):
+        """Run a function on a daemon thread, logging any exception it raises"""
+
+        def target():
+            try:
+                func(*args)
+            except Exception as ex:
+                self.logger.warning("Background choices lookup failed: %s", ex)
+
+        thread = Thread(target=target, name="ChoicesCacheRefresh")
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _load(self, key, loader, ttl):
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is not None:
+                leader = False
+            else:
+                leader = True
+                call = self._in_flight[key] = _Call()
+
+        if not leader:
+            return call.wait()
+
+        try:
+            value = loader()
+        except Exception as ex:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.set_exception(ex)
+            raise
+
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+            if ttl > 0:
+                now = time.time()
+                self._entries.pop(key, None)
+                self._entries[key] = _Entry(
+                    value, now + ttl, now + ttl + self._stale_ttl
+                )
+
+                while len(self._entries) > self._max_size:
+                    self._entries.popitem(last=False)
+
+        call.set_result(value)
+        return value
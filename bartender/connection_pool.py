@@ -0,0 +1,157 @@
+import logging
+import random
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+
+class JitterRetry(Retry):
+    """Retry whose exponential backoff is randomized
+
+    Each backoff is scaled by a random factor between ``1 - jitter`` and
+    ``1 + jitter`` so that clients that failed together don't retry together.
+
+    :param jitter: Fraction of the backoff to randomize by, between 0 and 1
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.jitter = kwargs.pop("jitter", 0)
+        super(JitterRetry, self).__init__(*args, **kwargs)
+
+    def new(self, **kw):
+        retry = super(JitterRetry, self).new(**kw)
+        retry.jitter = self.jitter
+        return retry
+
+    def get_backoff_time(self):
+        backoff = super(JitterRetry, self).get_backoff_time()
+        if backoff <= 0 or not self.jitter:
+            return backoff
+
+        return backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class PooledAdapter(HTTPAdapter):
+    """Transport adapter meant to be shared by every HTTP client in the process
+
+    :param pool_connections: Number of hosts to keep connection pools for
+    :param pool_maxsize: Maximum number of connections kept per host
+    :param keep_alive: Reuse connections between requests. If False every
+        request asks the server to close its connection.
+    :param retries: Number of times to retry failed connections, and idempotent
+        requests that fail with a 502, 503 or 504
+    :param backoff_factor: Base of the exponential backoff between retries
+    :param backoff_jitter: Fraction of each backoff to randomize by
+    """
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        keep_alive=True,
+        retries=3,
+        backoff_factor=0.5,
+        backoff_jitter=0.5,
+    ):
+        self.keep_alive = keep_alive
+
+        super(PooledAdapter, self).__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=JitterRetry(
+                total=retries,
+                read=False,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+                backoff_factor=backoff_factor,
+                jitter=backoff_jitter,
+            ),
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            # Stop idle pooled connections from being silently dropped
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+
+        super(PooledAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if not self.keep_alive:
+            request.headers["Connection"] = "close"
+
+        return super(PooledAdapter, self).send(request, **kwargs)
+
+    def stats(self):
+        """Connection reuse statistics for each host
+
+        :return: Dictionary mapping "scheme://host:port" to a dictionary with the
+            number of connections opened and requests made
+        """
+        stats = {}
+        pools = self.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            name = "%s://%s:%s" % (pool.scheme, pool.host, pool.port)
+            host_stats = stats.setdefault(name, {"connections": 0, "requests": 0})
+            host_stats["connections"] += pool.num_connections
+            host_stats["requests"] += pool.num_requests
+
+        return stats
+
+
+class HttpPool(object):
+    """The shared connection pool layer for outgoing HTTP requests
+
+    Sessions are normally given an adapter that retries failed connections.
+    Sessions whose requests are already bounded by a timeout, circuit breaker or
+    bulkhead are given one that never retries instead, so each request is a
+    single attempt that those bounds account for.
+
+    :param kwargs: Passed to PooledAdapter
+    """
+
+    def __init__(self, **kwargs):
+        self.logger = logging.getLogger(__name__)
+        self.adapter = PooledAdapter(**kwargs)
+        self.single_attempt_adapter = PooledAdapter(**dict(kwargs, retries=0))
+
+    def mount(self, session, retries=True):
+        """Make a requests Session use the shared pool
+
+        :param session: The Session
+        :param retries: Retry failed connections (see PooledAdapter)
+        :return: The Session
+        """
+        adapter = self.adapter if retries else self.single_attempt_adapter
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
+
+    def stats(self):
+        """Connection reuse statistics for each host, see PooledAdapter.stats"""
+        stats = self.adapter.stats()
+
+        for host, host_stats in self.single_attempt_adapter.stats().items():
+            totals = stats.setdefault(host, {"connections": 0, "requests": 0})
+            totals["connections"] += host_stats["connections"]
+            totals["requests"] += host_stats["requests"]
+
+        return stats
+
+    def log_stats(self):
+        for host, host_stats in sorted(self.stats().items()):
+            self.logger.debug(
+                "HTTP pool for %s: %d requests over %d connections",
+                host,
+                host_stats["requests"],
+                host_stats["connections"],
+            )
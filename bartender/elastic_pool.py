@@ -0,0 +1,191 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from threading import Condition, current_thread, Thread, Timer
+
+
+class _WorkItem(object):
+    __slots__ = ("future", "fn", "args", "kwargs", "enqueued_at")
+
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.time()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as ex:
+            self.future.set_exception(ex)
+        else:
+            self.future.set_result(result)
+
+
+class ElasticThreadPool(Executor):
+    """Executor that grows and shrinks its threads with load
+
+    The pool never runs fewer than ``min_workers`` threads. When work is
+    queued and no thread is idle, a thread is added (up to ``max_workers``)
+    once the oldest queued item has waited ``grow_wait`` seconds. Threads
+    beyond ``min_workers`` retire after sitting idle for ``keep_alive``
+    seconds. Every size change is kept in a short history for ``stats()``.
+
+    Args:
+        min_workers: Threads kept alive even when idle (capped at
+            ``max_workers``)
+        max_workers: Upper bound on the number of threads
+        keep_alive: Seconds an extra thread may idle before it retires
+        grow_wait: Seconds work may wait for a thread before one is added
+            (0 to add one as soon as no thread is idle)
+        name: Prefix for thread names
+        history_size: Number of size changes to remember
+    """
+
+    def __init__(
+        self,
+        min_workers=1,
+        max_workers=10,
+        keep_alive=60,
+        grow_wait=0,
+        name="ElasticPool",
+        history_size=100,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.logger = logging.getLogger(__name__)
+        self.min_workers = min(max(min_workers, 0), max_workers)
+        self.max_workers = max_workers
+        self.keep_alive = keep_alive
+        self.grow_wait = grow_wait
+        self.name = name
+
+        # Referenced (and cleared) by owners that need to orphan hung workers
+        self._threads = set()
+
+        self._cond = Condition()
+        self._work = deque()
+        self._idle = 0
+        self._peak = 0
+        self._counter = 0
+        self._shutdown = False
+        self._grow_timer = None
+        self._history = deque(maxlen=history_size)
+
+        with self._cond:
+            for _ in range(self.min_workers):
+                self._spawn("minimum")
+
+    @property
+    def size(self):
+        return len(self._threads)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+
+            future = Future()
+            self._work.append(_WorkItem(future, fn, args, kwargs))
+
+            self._cond.notify()
+            self._maybe_grow()
+
+            return future
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            if self._grow_timer:
+                self._grow_timer.cancel()
+            self._cond.notify_all()
+            threads = list(self._threads)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": len(self._threads),
+                "idle": self._idle,
+                "queued": len(self._work),
+                "peak": self._peak,
+                "min_workers": self.min_workers,
+                "max_workers": self.max_workers,
+                "history": list(self._history),
+            }
+
+    def log_stats(self):
+        self.logger.info("%s pool stats: %s", self.name, self.stats())
+
+    def _maybe_grow(self):
+        """Add a thread if queued work has waited long enough (lock held)"""
+        if len(self._work) <= self._idle or len(self._threads) >= self.max_workers:
+            return
+
+        waited = time.time() - self._work[0].enqueued_at
+        if waited >= self.grow_wait:
+            self._spawn("waited %.3fs" % waited)
+        elif self._grow_timer is None:
+            self._grow_timer = Timer(self.grow_wait - waited, self._grow_check)
+            self._grow_timer.daemon = True
+            self._grow_timer.start()
+
+    def _grow_check(self):
+        with self._cond:
+            self._grow_timer = None
+            if not self._shutdown:
+                self._maybe_grow()
+
+    def _spawn(self, reason):
+        self._counter += 1
+        thread = Thread(target=self._worker, name="%s-%d" % (self.name, self._counter))
+        thread.daemon = True
+        self._threads.add(thread)
+        self._resized(reason)
+        thread.start()
+
+    def _resized(self, reason):
+        size = len(self._threads)
+        self._peak = max(self._peak, size)
+        self._history.append((time.time(), size, reason))
+        self.logger.debug("%s pool is now %d workers (%s)", self.name, size, reason)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                idle_since = time.time()
+                while not self._work and not self._shutdown:
+                    remaining = None
+                    if len(self._threads) > self.min_workers:
+                        remaining = idle_since + self.keep_alive - time.time()
+                        if remaining <= 0:
+                            self._retire("idle %ss" % self.keep_alive)
+                            return
+
+                    self._idle += 1
+                    self._cond.wait(remaining)
+                    self._idle -= 1
+
+                if not self._work:
+                    self._retire("shutdown")
+                    return
+
+                item = self._work.popleft()
+                self._maybe_grow()
+
+            item.run()
+            del item
+
+    def _retire(self, reason):
+        """Remove the calling thread from the pool (lock held)"""
+        self._threads.discard(current_thread())
+        self._resized(reason)
@@ -0,0 +1,45 @@
+import simplejson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Requests have always been published as JSON with this content type
+JSON = "text/plain"
+
+MSGPACK = "application/msgpack"
+
+
+def supported():
+    """Content types, other than JSON, that can be encoded here"""
+    return [MSGPACK] if msgpack is not None else []
+
+
+def negotiate(accepted, enabled):
+    """Pick the content type to publish an Instance's Requests in
+
+    :param accepted: Content types the Instance advertises it can decode, in
+        order of preference
+    :param enabled: Content types that are allowed to be used
+    :return: The first accepted content type that is enabled and supported,
+        otherwise JSON
+    """
+    for content_type in accepted or ():
+        if content_type in enabled and content_type in supported():
+            return content_type
+
+    return JSON
+
+
+def dumps(message, content_type):
+    """Encode a serialized Request
+
+    :param message: The Request, as a dictionary
+    :param content_type: The content type to encode it as
+    :return: The message body
+    """
+    if content_type == MSGPACK:
+        return msgpack.packb(message, use_bin_type=True)
+
+    return simplejson.dumps(message)
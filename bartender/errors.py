@@ -20,3 +20,33 @@ class ShutdownError(Exception):
     """Backend has been shut down"""
 
     pass
+
+
+class BackendUnavailableError(Exception):
+    """A call to a backend was rejected without being attempted"""
+
+    pass
+
+
+class CircuitOpenError(BackendUnavailableError):
+    """Backend has failed too many times and is not being called"""
+
+    pass
+
+
+class BulkheadFullError(BackendUnavailableError):
+    """Backend already has the maximum number of calls in progress"""
+
+    pass
+
+
+class SystemThrottledError(Exception):
+    """Work for a System was refused to keep it from starving other Systems"""
+
+    pass
+
+
+class SpoolFullError(Exception):
+    """A message could not be spooled because the spool is at its size limit"""
+
+    pass
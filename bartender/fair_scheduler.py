@@ -0,0 +1,192 @@
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from threading import Event, Lock
+
+from bartender.errors import SystemThrottledError
+
+
+class _Waiter(object):
+    __slots__ = ("key", "start", "tag", "seq", "event", "granted")
+
+    def __init__(self, key, start, tag, seq):
+        self.key = key
+        self.start = start
+        self.tag = tag
+        self.seq = seq
+        self.event = Event()
+        self.granted = False
+
+
+class FairScheduler(object):
+    """Shares a fixed number of execution slots fairly between keys
+
+    Callers wait for a slot with ``slot(key)``. When a slot frees up it goes
+    to the waiter with the smallest virtual finish tag (weighted fair
+    queuing), so a key with weight 2 gets twice the slots of a key with
+    weight 1 while both are busy, and a key that floods the scheduler only
+    delays its own work. A key can also be capped to a number of concurrent
+    slots.
+
+    Waiting callers hold on to the thread they are running on, so the number
+    of slots plus the callers that may wait should stay below the number of
+    threads available to callers.
+
+    Args:
+        max_concurrent: Total number of slots (0 disables scheduling)
+        max_wait: Seconds a caller may wait for a slot (0 for no limit)
+        max_queued: Maximum number of callers waiting per key (0 for no
+            limit)
+        systems: Per-key settings, each a mapping with ``name`` and
+            optionally ``weight`` and ``max_concurrent``
+        stats_interval: Seconds between logging stats while slots are being
+            released (0 to never log them on its own)
+    """
+
+    def __init__(
+        self, max_concurrent=0, max_wait=0, max_queued=0, systems=None, stats_interval=0
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.max_queued = max_queued
+        self.stats_interval = stats_interval
+
+        self._weights = {}
+        self._caps = {}
+        for system in systems or ():
+            self._weights[system["name"]] = float(system.get("weight") or 1)
+            self._caps[system["name"]] = system.get("max_concurrent") or 0
+
+        self._lock = Lock()
+        self._queues = defaultdict(deque)
+        self._running = defaultdict(int)
+        self._finish = {}
+        self._total_running = 0
+        self._virtual_time = 0.0
+        self._seq = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._stats_logged = time.time()
+
+    @contextmanager
+    def slot(self, key):
+        """Hold one of the scheduler's slots on behalf of ``key``"""
+        if not self.max_concurrent:
+            yield
+            return
+
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def acquire(self, key):
+        with self._lock:
+            queue = self._queues[key]
+            if self.max_queued and len(queue) >= self.max_queued:
+                self._rejected += 1
+                raise SystemThrottledError(
+                    "%s already has %d requests waiting to be processed"
+                    % (key, len(queue))
+                )
+
+            start = max(self._virtual_time, self._finish.get(key, 0.0))
+            tag = start + 1.0 / self._weights.get(key, 1.0)
+            self._finish[key] = tag
+            self._seq += 1
+
+            waiter = _Waiter(key, start, tag, self._seq)
+            queue.append(waiter)
+            self._dispatch()
+
+        if waiter.event.wait(self.max_wait or None):
+            return
+
+        with self._lock:
+            # The slot may have been granted right as the wait timed out
+            if waiter.granted:
+                return
+
+            self._queues[key].remove(waiter)
+            self._timed_out += 1
+            self._forget(key)
+
+        raise SystemThrottledError(
+            "Timed out after %ss waiting to process a request for %s"
+            % (self.max_wait, key)
+        )
+
+    def release(self, key):
+        with self._lock:
+            self._running[key] -= 1
+            self._total_running -= 1
+            self._dispatch()
+            self._forget(key)
+
+            log_stats = (
+                self.stats_interval
+                and time.time() - self._stats_logged >= self.stats_interval
+            )
+            if log_stats:
+                self._stats_logged = time.time()
+
+        if log_stats:
+            self.log_stats()
+
+    def depths(self):
+        """Number of callers waiting for a slot, by key"""
+        with self._lock:
+            return {key: len(queue) for key, queue in self._queues.items() if queue}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._total_running,
+                "max_concurrent": self.max_concurrent,
+                "queued": {k: len(q) for k, q in self._queues.items() if q},
+                "running_by_key": {k: n for k, n in self._running.items() if n},
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+    def log_stats(self):
+        self.logger.info("Request scheduler stats: %s", self.stats())
+
+    def _dispatch(self):
+        """Hand free slots to the eligible waiters with the lowest tags"""
+        while self._total_running < self.max_concurrent:
+            best = None
+            for key, queue in self._queues.items():
+                if not queue:
+                    continue
+
+                cap = self._caps.get(key)
+                if cap and self._running[key] >= cap:
+                    continue
+
+                head = queue[0]
+                if best is None or (head.tag, head.seq) < (best.tag, best.seq):
+                    best = head
+
+            if best is None:
+                return
+
+            self._queues[best.key].popleft()
+            self._running[best.key] += 1
+            self._total_running += 1
+            self._virtual_time = max(self._virtual_time, best.start)
+            best.granted = True
+            best.event.set()
+
+    def _forget(self, key):
+        """Drop bookkeeping for a key with nothing queued or running"""
+        if self._queues[key] or self._running[key]:
+            return
+
+        del self._queues[key]
+        del self._running[key]
+        if self._finish.get(key, 0.0) <= self._virtual_time:
+            self._finish.pop(key, None)
@@ -14,9 +14,10 @@ class LocalPluginLoader(object):
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, validator, registry):
+    def __init__(self, validator, registry, catalog=None):
         self.validator = validator
         self.registry = registry
+        self.catalog = catalog
 
     def load_plugins(self):
         """Load all plugins
@@ -136,6 +137,9 @@ class LocalPluginLoader(object):
         # instance object which we need to change to satisfy
         plugin_system.deep_save()
 
+        if self.catalog is not None:
+            self.catalog.invalidate(plugin_name, plugin_version)
+
         plugin_list = []
         plugin_log_directory = bartender.config.plugin.local.log_directory
         for instance_name in plugin_instances:
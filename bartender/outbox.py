@@ -0,0 +1,301 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from threading import Event
+
+import pika.spec
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from bartender.raw_request import RawRequest
+from bg_utils.mongo.models import Request
+from brewtils.stoppable_thread import StoppableThread
+
+
+class RequestOutbox(object):
+    """Validated Requests waiting to be published
+
+    Each entry holds a Request's ID, the status it was validated in and the
+    fields validation changed. Adding an entry is the only write needed to
+    accept a Request: the publisher applies the fields when it publishes, so a
+    crash between the two never loses a validated Request.
+
+    Entries are leased by a publisher before it publishes them, so several
+    publishers (in different processes, say) never publish the same entry
+    at once. A lease that isn't released (the publisher died) runs out after
+    ``lease`` seconds.
+
+    :param collection: Name of the Mongo collection holding the entries
+    :param lease: Seconds a publisher may hold a batch of entries
+    """
+
+    def __init__(self, collection="bartender_request_outbox", lease=30):
+        self.logger = logging.getLogger(__name__)
+        self.collection_name = collection
+        self.lease = lease
+
+        self._collection = None
+        self._added = Event()
+
+    def add(self, request_id, status, fields):
+        """Queue a validated Request to be published
+
+        Adding a Request that is already queued replaces its entry.
+
+        :param request_id: The Request ID (an ObjectId)
+        :param status: The status the Request was validated in. It's only
+            published if it still has this status.
+        :param fields: The Request fields to set when it is published
+        """
+        self._get_collection().replace_one(
+            {"_id": request_id},
+            {
+                "_id": request_id,
+                "status": status,
+                "fields": fields,
+                "queued_at": datetime.utcnow(),
+                "leased_until": datetime.min,
+                "owner": None,
+            },
+            upsert=True,
+        )
+        self._added.set()
+
+    def wait(self, timeout):
+        """Wait for an entry to be added by this process since the last ``take``
+
+        :param timeout: Seconds to wait
+        :return: True if an entry was added
+        """
+        return self._added.wait(timeout)
+
+    def wake(self):
+        """Wake anything waiting for an entry"""
+        self._added.set()
+
+    def take(self, batch_size):
+        """Lease the oldest entries that no one else holds
+
+        :param batch_size: Maximum number of entries to lease
+        :return: List of leased entries, oldest first
+        """
+        # Cleared before looking, so anything added after this wakes ``wait``
+        self._added.clear()
+
+        collection = self._get_collection()
+        now = datetime.utcnow()
+        available = {"leased_until": {"$lt": now}}
+
+        ids = [
+            entry["_id"]
+            for entry in collection.find(available, {"_id": True})
+            .sort("queued_at", ASCENDING)
+            .limit(batch_size)
+        ]
+        if not ids:
+            return []
+
+        owner = uuid.uuid4().hex
+        available["_id"] = {"$in": ids}
+        collection.update_many(
+            available,
+            {
+                "$set": {
+                    "leased_until": now + timedelta(seconds=self.lease),
+                    "owner": owner,
+                }
+            },
+        )
+
+        return list(
+            collection.find({"_id": {"$in": ids}, "owner": owner}).sort(
+                "queued_at", ASCENDING
+            )
+        )
+
+    def remove(self, entries):
+        """Remove entries that were published (or dropped)"""
+        if entries:
+            self._get_collection().delete_many(
+                {
+                    "_id": {"$in": [e["_id"] for e in entries]},
+                    "owner": entries[0]["owner"],
+                }
+            )
+
+    def retry_later(self, entries, delay):
+        """Release leased entries so they are published again after a delay"""
+        if entries:
+            self._get_collection().update_many(
+                {
+                    "_id": {"$in": [e["_id"] for e in entries]},
+                    "owner": entries[0]["owner"],
+                },
+                {
+                    "$set": {
+                        "leased_until": datetime.utcnow() + timedelta(seconds=delay),
+                        "owner": None,
+                    }
+                },
+            )
+
+    def _get_collection(self):
+        if self._collection is None:
+            collection = Request._get_db()[self.collection_name]
+            collection.create_index([("leased_until", ASCENDING)])
+            self._collection = collection
+
+        return self._collection
+
+
+class OutboxPublisher(StoppableThread):
+    """Publishes the Requests in a RequestOutbox in batches
+
+    Each batch is applied to the Requests with one bulk write and published
+    over this thread's (persistent) publishing channel with publisher
+    confirms. Entries are removed once their Request is confirmed. Requests
+    whose status changed after they were validated are dropped, and entries
+    that fail to publish are retried after ``retry_delay`` seconds.
+
+    :param outbox: The RequestOutbox
+    :param pika_client: The PikaClient to publish with
+    :param batch_size: Maximum number of Requests published at once
+    :param poll_interval: Seconds between checks for entries added by other
+        processes
+    :param retry_delay: Seconds before failed entries are published again
+    """
+
+    def __init__(
+        self, outbox, pika_client, batch_size=100, poll_interval=1.0, retry_delay=5
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.display_name = "Outbox Publisher"
+        self.outbox = outbox
+        self.pika_client = pika_client
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+        super(OutboxPublisher, self).__init__(logger=self.logger, name="Outbox")
+
+    def run(self):
+        self.logger.info(self.display_name + " is started")
+
+        while not self.stopped():
+            try:
+                published = self.publish_batch()
+            except PyMongoError as ex:
+                self.logger.warning("Unable to publish outbox batch: %s", ex)
+                published = 0
+
+            # A full batch means there are probably more waiting
+            if published < self.batch_size:
+                self.outbox.wait(self.poll_interval)
+
+        self.logger.info(self.display_name + " is stopped")
+
+    def stop(self):
+        super(OutboxPublisher, self).stop()
+        self.outbox.wake()
+
+    def publish_batch(self):
+        """Lease, apply and publish one batch of entries
+
+        :return: Number of entries in the batch
+        """
+        entries = self.outbox.take(self.batch_size)
+        if not entries:
+            return 0
+
+        documents = {
+            document["_id"]: document
+            for document in Request._get_collection().find(
+                {"_id": {"$in": [entry["_id"] for entry in entries]}}
+            )
+        }
+
+        to_publish, dropped = [], []
+        for entry in entries:
+            document = documents.get(entry["_id"])
+            if document is None or document.get("status") != entry["status"]:
+                self.logger.info(
+                    "Request %s is no longer %s, not publishing it",
+                    entry["_id"],
+                    entry["status"],
+                )
+                dropped.append(entry)
+            else:
+                document.update(entry["fields"])
+                to_publish.append((entry, RawRequest(document)))
+
+        if to_publish:
+            result = Request._get_collection().bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": entry["_id"], "status": entry["status"]},
+                        {"$set": entry["fields"]},
+                    )
+                    for entry, _ in to_publish
+                ],
+                ordered=False,
+            )
+
+            # Some statuses changed since they were read, find out which
+            if result.matched_count < len(to_publish):
+                unchanged = self._unchanged(to_publish)
+                for entry, _ in to_publish:
+                    if entry["_id"] not in unchanged:
+                        self.logger.info(
+                            "Request %s is no longer %s, not publishing it",
+                            entry["_id"],
+                            entry["status"],
+                        )
+                        dropped.append(entry)
+
+                to_publish = [
+                    (entry, request)
+                    for entry, request in to_publish
+                    if entry["_id"] in unchanged
+                ]
+
+        results = self.pika_client.publish_requests(
+            [
+                request if request.parent is None else request.to_model()
+                for _, request in to_publish
+            ],
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+        )
+
+        failed = []
+        for entry, _ in to_publish:
+            error = results.get(str(entry["_id"]))
+            if error is None:
+                dropped.append(entry)
+            else:
+                self.logger.warning(
+                    "Error publishing request %s, will retry: %s", entry["_id"], error
+                )
+                failed.append(entry)
+
+        self.outbox.remove(dropped)
+        self.outbox.retry_later(failed, self.retry_delay)
+
+        return len(entries)
+
+    @staticmethod
+    def _unchanged(to_publish):
+        """IDs of the Requests that still have the status they were validated in"""
+        return set(
+            document["_id"]
+            for document in Request._get_collection().find(
+                {
+                    "$or": [
+                        {"_id": entry["_id"], "status": entry["status"]}
+                        for entry, _ in to_publish
+                    ]
+                },
+                {"_id": True},
+            )
+        )
@@ -1,14 +1,455 @@
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from threading import current_thread, Event, Lock, Thread, local
+
+from bartender import encoding
+from bartender.raw_request import RawRequest
+from bartender.spool import SpoolReplayer
 from bg_utils.pika import get_routing_key, TransientPikaClient
 from brewtils.models import Request
 from brewtils.schema_parser import SchemaParser
+from pika import BasicProperties, BlockingConnection, SelectConnection
+from pika.adapters.blocking_connection import ReturnedMessage
+from pika.adapters.select_connection import IOLoop
+from pika.exceptions import (
+    AMQPChannelError,
+    AMQPConnectionError,
+    AMQPError,
+    ChannelClosed,
+    ChannelWrongStateError,
+    NackError,
+    UnroutableError,
+)
+from pika.spec import Basic
 
 
 class PikaClient(TransientPikaClient):
-    """Pika client that exposes additional Bartender-specific operations"""
+    """Pika client that exposes additional Bartender-specific operations
+
+    Messages are published over long-lived connections instead of a new
+    connection for every message. BlockingConnections can't be shared between
+    threads, so each publishing thread gets its own connection with one channel
+    for confirmed and one for unconfirmed publishing. Broken connections and
+    channels are replaced on the next publish, and connections left behind by
+    threads that have exited are closed whenever a new one is opened.
+
+    With ``async_confirms`` enabled, confirmed messages are instead handed to a
+    ConfirmingPublisher so that many of them can be awaiting confirmation at
+    once.
+
+    With a ``spool``, messages published with ``spool=True`` are written to it
+    rather than failing while the broker can't be reached (or is blocking
+    publishers), and a SpoolReplayer publishes them in order once it's back.
+    Until the spool is drained later messages are spooled too, to keep them in
+    order.
+
+    :param async_confirms: Track publisher confirms asynchronously
+    :param confirm_timeout: Seconds to wait for a message to be confirmed when
+        ``async_confirms`` is enabled
+    :param spool: PublishSpool for messages that can't be published right now
+    :param spool_retry_interval: Seconds between attempts to publish spooled
+        messages while the broker is unavailable
+    :param kwargs: Passed to TransientPikaClient
+    """
+
+    def __init__(
+        self,
+        async_confirms=False,
+        confirm_timeout=30,
+        spool=None,
+        spool_retry_interval=5,
+        **kwargs
+    ):
+        super(PikaClient, self).__init__(**kwargs)
+
+        self._local = local()
+        # Publishing connection of each thread
+        self._connections = {}
+        self._connections_lock = Lock()
+
+        self._async_confirms = async_confirms
+        self._confirm_timeout = confirm_timeout
+        self._confirmer = None
+        self._confirmer_lock = Lock()
+
+        self._spool = spool
+        self._spool_retry_interval = spool_retry_interval
+        self._replayer = None
+        self._replayer_lock = Lock()
+        self._blocked = False
+
+        # Messages left over from a previous run
+        if self._spool is not None and len(self._spool):
+            self._start_replayer()
+
+    def publish(self, message, **kwargs):
+        """Publish a message.
+
+        If the thread's connection or channel turns out to be broken it is
+        replaced and the message published once more.
+
+        :param message: The message to publish
+        :param kwargs: Additional message properties (see
+            ``TransientPikaClient.publish``). Pass ``spool=True`` to spool the
+            message if the broker is unavailable.
+        """
+        spool = kwargs.pop("spool", False) and self._spool is not None
+
+        if spool and (self._blocked or len(self._spool)):
+            return self._spool_message(message, kwargs)
+
+        try:
+            self._publish(message, kwargs)
+        except AMQPConnectionError as ex:
+            if not spool:
+                raise
+
+            self.logger.warning("Unable to reach the broker (%s), spooling", ex)
+            self._spool_message(message, kwargs)
+
+    def _publish(self, message, kwargs):
+        if kwargs.get("confirm") and self._async_confirms:
+            return self._confirmed_publish(message, kwargs).result(
+                timeout=self._confirm_timeout
+            )
+
+        try:
+            self._basic_publish(self._channel(kwargs.get("confirm")), message, kwargs)
+        except (AMQPConnectionError, ChannelClosed, ChannelWrongStateError) as ex:
+            self.logger.warning("Publishing channel was broken (%s), reconnecting", ex)
+            self._discard(connection_broken=isinstance(ex, AMQPConnectionError))
+
+            self._basic_publish(self._channel(kwargs.get("confirm")), message, kwargs)
+
+    def close(self):
+        """Close every publishing connection
+
+        This should only be called once the threads that publish have stopped.
+        """
+        with self._replayer_lock:
+            replayer, self._replayer = self._replayer, None
+
+        if replayer is not None:
+            replayer.stop()
+            replayer.join(self._spool_retry_interval)
+
+        if self._spool is not None:
+            self._spool.log_stats()
+            self._spool.close()
+
+        with self._confirmer_lock:
+            confirmer, self._confirmer = self._confirmer, None
+
+        if confirmer is not None:
+            confirmer.stop()
+
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+
+        for connection in connections:
+            try:
+                if connection.is_open:
+                    connection.close()
+            except AMQPError as ex:
+                self.logger.warning("Error closing publishing connection: %s", ex)
+
+    def publish_request(self, request, content_type=None, **kwargs):
+        """Publish a Request
+
+        :param request: The Request
+        :param content_type: Content type to encode the Request as (see
+            ``bartender.encoding``). Defaults to JSON.
+        :param kwargs: Additional message properties (see ``publish``)
+        """
+        message, kwargs = self._request_message(request, content_type, kwargs)
+
+        return self.publish(message, **kwargs)
+
+    def publish_requests(self, requests, content_types=None, **kwargs):
+        """Publish several Requests using this thread's publishing channel.
+
+        A failure to publish one Request does not prevent the others from being
+        published. If the connection itself fails, every Request that has not yet
+        been published is marked with that failure.
+
+        :param requests: The Requests to publish
+        :param content_types: Dictionary mapping Request ID to the content type to
+            encode that Request as (see ``bartender.encoding``). Requests that
+            aren't in it are encoded as JSON.
+        :param kwargs: Additional message properties (see ``publish``). Pass
+            ``spool=True`` to spool the Requests that can't be published because
+            the broker is unavailable.
+        :return: Dictionary mapping Request ID to the exception raised while
+            publishing that Request, or None if it was published (or spooled)
+            successfully
+        """
+        if not requests:
+            return {}
+
+        spool = kwargs.pop("spool", False) and self._spool is not None
+        content_types = content_types or {}
+
+        messages = OrderedDict(
+            (
+                str(request.id),
+                self._request_message(
+                    request, content_types.get(str(request.id)), kwargs
+                ),
+            )
+            for request in requests
+        )
+
+        if spool and (self._blocked or len(self._spool)):
+            for message, message_kwargs in messages.values():
+                self._spool_message(message, message_kwargs)
+            return dict.fromkeys(messages)
+
+        if kwargs.get("confirm") and self._async_confirms:
+            results = self._pipelined_publish(messages)
+        else:
+            results = self._channel_publish(messages, kwargs.get("confirm"))
+
+        if spool:
+            for request_id, (message, message_kwargs) in messages.items():
+                if isinstance(results[request_id], AMQPConnectionError):
+                    self.logger.warning(
+                        "Unable to reach the broker (%s), spooling", results[request_id]
+                    )
+                    self._spool_message(message, message_kwargs)
+                    results[request_id] = None
+
+        return results
+
+    def _channel_publish(self, messages, confirm):
+        """Publish messages one after another on this thread's channel"""
+        results = {}
+
+        try:
+            channel = self._channel(confirm)
+
+            for request_id, (message, kwargs) in messages.items():
+                try:
+                    self._basic_publish(channel, message, kwargs)
+                    results[request_id] = None
+                except AMQPChannelError as ex:
+                    results[request_id] = ex
+
+                    # Returned or nacked messages leave the channel usable
+                    if channel.is_closed:
+                        raise
+        except AMQPError as ex:
+            self._discard(connection_broken=isinstance(ex, AMQPConnectionError))
+
+            for request_id in messages:
+                results.setdefault(request_id, ex)
+
+        return results
+
+    def _pipelined_publish(self, messages):
+        """Publish messages without waiting for each confirmation in turn"""
+        futures = []
+        for request_id, (message, kwargs) in messages.items():
+            futures.append((request_id, self._confirmed_publish(message, kwargs)))
+
+        results = {}
+        deadline = time.time() + self._confirm_timeout
+        for request_id, future in futures:
+            try:
+                future.result(timeout=max(deadline - time.time(), 0))
+                results[request_id] = None
+            except Exception as ex:
+                results[request_id] = ex
+
+        return results
+
+    def _confirmed_publish(self, message, kwargs):
+        """Hand a message to the ConfirmingPublisher, starting it if necessary"""
+        confirmer = self._confirmer or self._start_confirmer()
+
+        return confirmer.publish(
+            message,
+            routing_key=kwargs["routing_key"],
+            properties=BasicProperties(
+                app_id="beer-garden",
+                content_type=kwargs.get("content_type") or encoding.JSON,
+                headers=kwargs.get("headers"),
+                expiration=kwargs.get("expiration"),
+                delivery_mode=kwargs.get("delivery_mode"),
+            ),
+            mandatory=kwargs.get("mandatory"),
+        )
+
+    def _start_confirmer(self):
+        """Start a ConfirmingPublisher, unless another thread already has
+
+        Starting waits for the broker, so it's done without holding the lock that
+        every publishing thread needs.
+        """
+        confirmer = ConfirmingPublisher(
+            self._conn_params,
+            self._exchange,
+            on_blocked=self._on_blocked,
+            on_unblocked=self._on_unblocked,
+        )
+        confirmer.start(timeout=self._confirm_timeout)
+
+        with self._confirmer_lock:
+            if self._confirmer is None:
+                self._confirmer = confirmer
+                return confirmer
+
+            winner = self._confirmer
+
+        confirmer.stop()
+        return winner
+
+    def _spool_message(self, message, kwargs):
+        self._spool.append(message, kwargs)
+        self._start_replayer()
+
+    def _start_replayer(self):
+        with self._replayer_lock:
+            if self._replayer is None or not self._replayer.is_alive():
+                self._replayer = SpoolReplayer(
+                    self._spool, self._replay, retry_interval=self._spool_retry_interval
+                )
+                self._replayer.daemon = True
+                self._replayer.start()
+
+    def _replay(self, message, **kwargs):
+        self._publish(message, kwargs)
+
+        # Getting a message through means the broker isn't blocking anymore
+        self._blocked = False
+
+    def _on_blocked(self, connection, method):
+        self.logger.warning("Broker is blocking publishers: %s", method)
+        self._blocked = True
+
+    def _on_unblocked(self, connection, method):
+        self.logger.info("Broker is no longer blocking publishers")
+        self._blocked = False
+
+    def _channel(self, confirm):
+        """Get this thread's publishing channel, opening it if necessary"""
+        confirm = bool(confirm)
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None or not connection.is_open:
+            self._prune()
+
+            connection = BlockingConnection(self._conn_params)
+            connection.add_on_connection_blocked_callback(self._on_blocked)
+            connection.add_on_connection_unblocked_callback(self._on_unblocked)
+            self._local.connection = connection
+            self._local.channels = {}
+
+            with self._connections_lock:
+                self._connections[current_thread()] = connection
+        else:
+            # Blocking connections only handle heartbeats while doing I/O
+            connection.process_data_events(time_limit=0)
+
+        channel = self._local.channels.get(confirm)
+        if channel is None or not channel.is_open:
+            channel = connection.channel()
+            if confirm:
+                channel.confirm_delivery()
 
-    def publish_request(self, request, **kwargs):
-        if "headers" not in kwargs:
-            kwargs["headers"] = {}
+            self._local.channels[confirm] = channel
+
+        return channel
+
+    def _discard(self, connection_broken=False):
+        """Forget this thread's channels, and its connection if it is broken"""
+        self._local.channels = {}
+
+        if connection_broken:
+            connection = getattr(self._local, "connection", None)
+            self._local.connection = None
+
+            if connection is not None:
+                with self._connections_lock:
+                    if self._connections.get(current_thread()) is connection:
+                        del self._connections[current_thread()]
+
+                self._close_quietly(connection)
+
+    def _prune(self):
+        """Close the connections of threads that have exited
+
+        Nothing else uses these connections again (or sends heartbeats on
+        them), so without this the number of connections would keep growing as
+        worker threads come and go.
+        """
+        with self._connections_lock:
+            dead = [thread for thread in self._connections if not thread.is_alive()]
+            connections = [self._connections.pop(thread) for thread in dead]
+
+        for connection in connections:
+            self._close_quietly(connection)
+
+        if connections:
+            self.logger.debug(
+                "Closed %d publishing connections of exited threads", len(connections)
+            )
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            if connection.is_open:
+                connection.close()
+        except AMQPError:
+            pass
+
+    def _basic_publish(self, channel, message, kwargs):
+        channel.basic_publish(
+            exchange=self._exchange,
+            routing_key=kwargs["routing_key"],
+            body=message,
+            properties=BasicProperties(
+                app_id="beer-garden",
+                content_type=kwargs.get("content_type") or encoding.JSON,
+                headers=kwargs.get("headers"),
+                expiration=kwargs.get("expiration"),
+                delivery_mode=kwargs.get("delivery_mode"),
+            ),
+            mandatory=kwargs.get("mandatory"),
+        )
+
+    @staticmethod
+    def _serialize(request, content_type=None):
+        if content_type not in (None, encoding.JSON):
+            if isinstance(request, RawRequest):
+                message = request.to_message()
+            else:
+                message = SchemaParser.serialize_request(request, to_string=False)
+
+            return encoding.dumps(message, content_type)
+
+        if isinstance(request, RawRequest):
+            return request.serialize()
+
+        return SchemaParser.serialize_request(request)
+
+    def _request_message(self, request, content_type, kwargs):
+        """Encode a Request and fill in the properties it's published with"""
+        if content_type is not None:
+            kwargs = dict(kwargs, content_type=content_type)
+
+        return (
+            self._serialize(request, content_type),
+            self._request_kwargs(request, **kwargs),
+        )
+
+    @staticmethod
+    def _request_kwargs(request, **kwargs):
+        """Fill in the headers and routing key used when publishing a Request"""
+        kwargs["headers"] = dict(kwargs.get("headers") or {})
         kwargs["headers"]["request_id"] = str(request.id)
 
         if "routing_key" not in kwargs:
@@ -16,7 +457,7 @@ class PikaClient(TransientPikaClient):
                 request.system, request.system_version, request.instance_name
             )
 
-        return self.publish(SchemaParser.serialize_request(request), **kwargs)
+        return kwargs
 
     def start(self, system=None, version=None, instance=None, clone_id=None):
         self.publish_request(
@@ -47,3 +488,234 @@ class PikaClient(TransientPikaClient):
                 system, version, instance, clone_id, is_admin=True
             ),
         )
+
+
+class ConfirmingPublisher(object):
+    """Publishes messages with publisher confirms tracked asynchronously
+
+    A dedicated thread owns the connection and its confirm-mode channel. Each
+    publish returns a Future that is resolved when the broker acks the message,
+    or fails if the broker nacks or returns it. Callers don't wait for each
+    other, so many messages can be awaiting confirmation at once and a single
+    (multiple) ack can confirm several of them.
+
+    The broker sends a returned message before the ack for it, so a returned
+    message is matched to the oldest pending mandatory message with the same
+    routing key and body. The message's properties are left alone.
+
+    :param connection_parameters: Parameters for the broker connection
+    :param exchange: Exchange to publish to
+    :param reconnect_delay: Seconds to wait before reconnecting
+    :param on_blocked: Called when the broker starts blocking the connection
+    :param on_unblocked: Called when the broker stops blocking the connection
+    """
+
+    def __init__(
+        self,
+        connection_parameters,
+        exchange,
+        reconnect_delay=5,
+        on_blocked=None,
+        on_unblocked=None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self._params = connection_parameters
+        self._exchange = exchange
+        self._reconnect_delay = reconnect_delay
+        self._on_blocked = on_blocked
+        self._on_unblocked = on_unblocked
+
+        self._ioloop = IOLoop()
+        self._connection = None
+        self._channel = None
+        self._pending = OrderedDict()
+        self._returned = {}
+        self._next_tag = 1
+        self._stopping = False
+        self._ready = Event()
+        self._thread = None
+
+    def start(self, timeout=None):
+        """Start the I/O thread and wait for the channel to be ready
+
+        :param timeout: Seconds to wait for the channel
+        :return: True if the channel is ready
+        """
+        self._thread = Thread(target=self._run, name="ConfirmingPublisher")
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self._ready.wait(timeout)
+
+    def stop(self, timeout=5):
+        """Close the connection and stop the I/O thread"""
+        self._ioloop.add_callback_threadsafe(self._shutdown)
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def publish(self, body, routing_key, properties, mandatory=False):
+        """Publish a message. Safe to call from any thread.
+
+        :param body: The message body
+        :param routing_key: The routing key
+        :param properties: The message's BasicProperties
+        :param mandatory: Fail if the message can't be routed to a queue
+        :return: Future resolved with None when the message is confirmed
+        """
+        future = Future()
+        self._ioloop.add_callback_threadsafe(
+            partial(self._publish, future, body, routing_key, properties, mandatory)
+        )
+
+        return future
+
+    def _run(self):
+        self._connect()
+        self._ioloop.start()
+
+    def _connect(self):
+        SelectConnection(
+            self._params,
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._ioloop,
+        )
+
+    def _reconnect_later(self):
+        if not self._stopping:
+            self._ioloop.call_later(self._reconnect_delay, self._connect)
+
+    def _on_connection_open(self, connection):
+        self._connection = connection
+
+        if self._on_blocked is not None:
+            connection.add_on_connection_blocked_callback(self._on_blocked)
+        if self._on_unblocked is not None:
+            connection.add_on_connection_unblocked_callback(self._on_unblocked)
+
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, ex):
+        self.logger.warning("Unable to connect confirming publisher: %s", ex)
+        self._reconnect_later()
+
+    def _on_connection_closed(self, connection, reason):
+        self._connection = None
+        self._channel = None
+        self._ready.clear()
+        self._fail_pending(reason)
+
+        if self._stopping:
+            self._ioloop.stop()
+        else:
+            self.logger.warning("Confirming publisher connection closed: %s", reason)
+            self._reconnect_later()
+
+    def _on_channel_open(self, channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        channel.confirm_delivery(
+            self._on_confirm, callback=partial(self._on_confirm_mode, channel)
+        )
+
+    def _on_confirm_mode(self, channel, _frame):
+        self._channel = channel
+        self._next_tag = 1
+        self._ready.set()
+
+    def _on_channel_closed(self, channel, reason):
+        self._channel = None
+        self._ready.clear()
+        self._fail_pending(reason)
+
+        if not self._stopping and self._connection and self._connection.is_open:
+            self.logger.warning("Confirming publisher channel closed: %s", reason)
+            self._connection.channel(on_open_callback=self._on_channel_open)
+
+    def _publish(self, future, body, routing_key, properties, mandatory):
+        if not future.set_running_or_notify_cancel():
+            return
+
+        if self._channel is None:
+            future.set_exception(
+                AMQPConnectionError("Confirming publisher is not connected")
+            )
+            return
+
+        tag = self._next_tag
+
+        try:
+            self._channel.basic_publish(
+                exchange=self._exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=properties,
+                mandatory=mandatory,
+            )
+        except Exception as ex:
+            future.set_exception(ex)
+            return
+
+        self._next_tag += 1
+        self._pending[tag] = (
+            future,
+            ReturnedMessage(None, properties, body),
+            routing_key if mandatory else None,
+        )
+
+    def _on_return(self, _channel, method, properties, body):
+        # The broker always sends basic.return before the ack for that message,
+        # so the message is still pending
+        for tag, (_, message, routing_key) in self._pending.items():
+            if (
+                tag not in self._returned
+                and routing_key == method.routing_key
+                and message.body == body
+            ):
+                self._returned[tag] = ReturnedMessage(method, properties, body)
+                return
+
+        self.logger.warning("Unable to match returned message %s", properties)
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, Basic.Ack)
+
+        if method.multiple:
+            tags = []
+            for tag in self._pending:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._pending else []
+
+        for tag in tags:
+            future, message, _ = self._pending.pop(tag)
+            returned = self._returned.pop(tag, None)
+
+            if not acked:
+                future.set_exception(NackError([message]))
+            elif returned is not None:
+                future.set_exception(UnroutableError([returned]))
+            else:
+                future.set_result(None)
+
+    def _fail_pending(self, reason):
+        pending, self._pending = self._pending, OrderedDict()
+        self._returned = {}
+
+        for future, _, _ in pending.values():
+            future.set_exception(
+                reason if isinstance(reason, Exception) else AMQPConnectionError(reason)
+            )
+
+    def _shutdown(self):
+        self._stopping = True
+
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+        else:
+            self._ioloop.stop()
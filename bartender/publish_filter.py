@@ -0,0 +1,159 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from bg_utils.mongo.models import Request
+
+
+class PublishFilter(object):
+    """Remembers which Requests were recently published so retries are skipped
+
+    A Request is claimed before it is validated and published, and marked as
+    published once that succeeds. Claims are kept in their own Mongo
+    collection (every thrift process sees the same claims) and published IDs
+    are also remembered in a bounded in-memory LRU, so most duplicates are
+    spotted without a round trip.
+
+    A claim that was never marked published (its publisher died, say) may be
+    taken over once it is ``claim_timeout`` seconds old. Claims expire from
+    Mongo ``window`` seconds after they were made.
+
+    Claiming and marking published are two extra writes for every Request, so
+    the filter is only worth enabling where processRequest calls are retried
+    often enough for duplicate publishes to cost more.
+
+    :param window: Seconds a published Request is remembered (0 disables the
+        filter)
+    :param max_size: Maximum number of Request IDs remembered in memory
+    :param claim_timeout: Seconds before an unpublished claim may be taken over
+    :param collection: Name of the Mongo collection holding the claims
+    """
+
+    def __init__(
+        self,
+        window=0,
+        max_size=10000,
+        claim_timeout=60,
+        collection="bartender_published_requests",
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.window = window
+        self.max_size = max_size
+        self.claim_timeout = claim_timeout
+        self.collection_name = collection
+
+        self._published = OrderedDict()
+        self._lock = Lock()
+        self._collection = None
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def recently_published(self, request_id):
+        """Check the in-memory record of published Requests
+
+        :param request_id: The Request ID
+        :return: True if this process published the Request within the window
+        """
+        if not self.enabled:
+            return False
+
+        request_id = str(request_id)
+        with self._lock:
+            expires = self._published.get(request_id)
+            if expires is None:
+                return False
+
+            if expires < time.time():
+                del self._published[request_id]
+                return False
+
+            return True
+
+    def claim(self, request_id):
+        """Claim a Request for publishing
+
+        :param request_id: The Request ID (an ObjectId)
+        :return: True if the caller should publish the Request, False if it
+            was already published or is being published by someone else
+        """
+        if not self.enabled:
+            return True
+
+        now = datetime.utcnow()
+        try:
+            # The upsert only inserts when there is no usable claim, and the
+            # insert fails if any claim exists
+            self._get_collection().update_one(
+                {
+                    "_id": request_id,
+                    "published": False,
+                    "claimed_at": {"$lt": now - timedelta(seconds=self.claim_timeout)},
+                },
+                {"$set": {"published": False, "claimed_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+
+        return True
+
+    def published(self, request_id):
+        """Record that a claimed Request was published"""
+        if not self.enabled:
+            return
+
+        self._get_collection().update_one(
+            {"_id": request_id},
+            {"$set": {"published": True, "claimed_at": datetime.utcnow()}},
+        )
+
+        with self._lock:
+            self._published.pop(str(request_id), None)
+            self._published[str(request_id)] = time.time() + self.window
+
+            while len(self._published) > self.max_size:
+                self._published.popitem(last=False)
+
+    def release(self, request_id):
+        """Give up a claim so a retry can publish the Request"""
+        if not self.enabled:
+            return
+
+        try:
+            self._get_collection().delete_one({"_id": request_id, "published": False})
+        except Exception as ex:
+            self.logger.warning(
+                "Unable to release claim on Request %s, retries will be skipped "
+                "for %s seconds: %s",
+                request_id,
+                self.claim_timeout,
+                ex,
+            )
+
+    def _get_collection(self):
+        if self._collection is None:
+            db = Request._get_db()
+            try:
+                db[self.collection_name].create_index(
+                    [("claimed_at", ASCENDING)], expireAfterSeconds=self.window
+                )
+            except OperationFailure:
+                # The index exists with a different window
+                db.command(
+                    "collMod",
+                    self.collection_name,
+                    index={
+                        "keyPattern": {"claimed_at": ASCENDING},
+                        "expireAfterSeconds": self.window,
+                    },
+                )
+            self._collection = db[self.collection_name]
+
+        return self._collection
@@ -0,0 +1,135 @@
+import simplejson
+import six
+from bson import ObjectId
+from marshmallow import fields
+
+from bg_utils.mongo.models import Request
+from brewtils.schemas import DateTime, RequestSchema
+
+# Values for fields missing from a document, as the Request model would fill in
+_DEFAULTS = {"status": lambda: "CREATED", "parameters": dict, "metadata": dict}
+
+
+def _identity(value):
+    return value
+
+
+def _converter(field):
+    """How SchemaParser.serialize_request renders a (non-None) field value"""
+    if isinstance(field, fields.DateTime):
+        return DateTime.to_epoch
+    if isinstance(field, fields.Boolean):
+        return bool
+    if isinstance(field, (fields.Dict, fields.Raw)):
+        return _identity
+    if isinstance(field, fields.Nested):
+        return None
+    return six.text_type
+
+
+# Message fields in the order RequestSchema renders them, with their converters
+_MESSAGE_FIELDS = tuple(
+    (name, _converter(field)) for name, field in RequestSchema().fields.items()
+)
+
+
+class RawRequest(object):
+    """A Request backed by its raw Mongo document
+
+    Offers the attributes, ``validate`` and ``to_mongo`` that validating,
+    updating and publishing a Request use, reading and writing the document
+    directly. This skips decoding the document into a model and serializing
+    the model through a schema.
+
+    Requests with a parent are serialized with their parent included, which
+    needs the model to dereference it, so ``parent`` should be checked before
+    relying on ``serialize``.
+
+    :param document: The Request document, as returned by pymongo
+    """
+
+    __slots__ = ("document",)
+
+    # Fields request validation may change, checked like the model would
+    VALIDATED_FIELDS = ("parameters", "command_type", "output_type")
+
+    def __init__(self, document):
+        object.__setattr__(self, "document", document)
+
+    @classmethod
+    def find(cls, request_id):
+        """Load a Request's document
+
+        :param request_id: The Request ID
+        :return: The RawRequest, or None if there is no such Request
+        """
+        if not ObjectId.is_valid(request_id):
+            return None
+
+        document = Request._get_collection().find_one({"_id": ObjectId(request_id)})
+        return cls(document) if document is not None else None
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        if name == "id":
+            return self.document["_id"]
+
+        try:
+            return self.document[name]
+        except KeyError:
+            default = _DEFAULTS.get(name)
+            return self.document.setdefault(name, default()) if default else None
+
+    def __setattr__(self, name, value):
+        self.document["_id" if name == "id" else name] = value
+
+    def __str__(self):
+        return "%s" % self.command
+
+    def __repr__(self):
+        return "<RawRequest: id=%s, command=%s, status=%s>" % (
+            self.id,
+            self.command,
+            self.status,
+        )
+
+    def to_model(self):
+        """The mongoengine Request for this document"""
+        return Request._from_son(self.document)
+
+    def to_mongo(self):
+        return self.document
+
+    def validate(self):
+        """Validate the fields request validation may have changed
+
+        :raises mongoengine.ValidationError: A field is invalid
+        """
+        for name in self.VALIDATED_FIELDS:
+            value = self.document.get(name)
+            if value is not None:
+                Request._fields[name]._validate(value)
+
+    def to_message(self):
+        """The Request as a dictionary, as RequestSchema would dump it
+
+        :return: The message dictionary
+        """
+        if self.parent is not None:
+            raise ValueError("Requests with a parent must be serialized as models")
+
+        message = {}
+        for name, convert in _MESSAGE_FIELDS:
+            value = getattr(self, name)
+            message[name] = None if value is None or convert is None else convert(value)
+
+        return message
+
+    def serialize(self):
+        """Serialize the Request exactly as SchemaParser.serialize_request would
+
+        :return: The JSON message
+        """
+        return simplejson.dumps(self.to_message())
@@ -1,33 +1,85 @@
 import json
 import logging
-from collections import Sequence
+from collections import OrderedDict, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
-import re
 import six
 import urllib3
-from builtins import str
 from requests import Session
+from requests.exceptions import Timeout
+from six.moves.urllib.parse import urlparse
 
 import bartender
-from bg_utils.mongo.models import System, Choices
+from bartender.backend_guard import BackendGuard
+from bartender.choices_cache import ChoicesCache
+from bartender.catalog import CachedCommand, CachedSystem, SystemCatalog
+from bartender.errors import BackendUnavailableError
+from bartender.validation_plan import ParameterPlan, ValidationPlan, collapse_choices
+from bg_utils.mongo.models import Choices
 from brewtils.choices import parse
-from brewtils.errors import ModelValidationError
+from brewtils.errors import ModelValidationError, TimeoutExceededError
+from brewtils.models import Request
 from brewtils.rest.system_client import SystemClient
 
 
 class RequestValidator(object):
-    def __init__(self):
+
+    # Maximum number of compiled validation plans to keep
+    MAX_PLANS = 1024
+
+    def __init__(self, catalog=None):
         self.logger = logging.getLogger(__name__)
 
+        # An empty catalog is falsy
+        if catalog is None:
+            catalog = SystemCatalog(ttl=bartender.config.validator.catalog.ttl)
+        self.catalog = catalog
+        self._plans = OrderedDict()
+        self._plans_lock = Lock()
+
+        choices_config = bartender.config.validator.choices
+        self._choices_prewarm = choices_config.cache.prewarm
+        self._choices_cache = ChoicesCache(
+            max_size=choices_config.cache.max_size,
+            ttl=choices_config.cache.ttl,
+            stale_ttl=choices_config.cache.stale_ttl,
+        )
+        self._choices_pool = ThreadPoolExecutor(max_workers=choices_config.max_workers)
+        self._choices_workers = choices_config.max_workers
+        self._choices_busy = 0
+        self._choices_busy_lock = Lock()
+        self._choices_timeout = choices_config.timeout or None
+        self._choices_guard = BackendGuard(
+            failure_threshold=choices_config.breaker.failure_threshold,
+            reset_timeout=choices_config.breaker.reset_timeout,
+            max_concurrent=choices_config.bulkhead.max_concurrent,
+            ignore=(ModelValidationError,),
+        )
+
         self._client = SystemClient(system_name=None, **bartender.config.web)
 
         self._session = Session()
+        if bartender.http_pool is not None:
+            # Lookups are bounded by the choices timeout, breaker and bulkhead,
+            # which count on each one being a single attempt
+            bartender.http_pool.mount(self._session, retries=False)
+
+            # SystemClient doesn't expose its Session, so reach through its EasyClient
+            bartender.http_pool.mount(
+                self._client._easy_client.client.session, retries=False
+            )
+
         if not bartender.config.web.ca_verify:
             urllib3.disable_warnings()
             self._session.verify = False
         elif bartender.config.web.ca_cert:
             self._session.verify = bartender.config.web.ca_cert
 
+    def shutdown(self):
+        """Stop the threads used to resolve choices lookups"""
+        self._choices_pool.shutdown(wait=False)
+
     def validate_request(self, request):
         """Validation to be called before you save a request from a user
 
@@ -42,14 +94,57 @@ class RequestValidator(object):
 
         return request
 
-    def get_and_validate_system(self, request):
+    def validate_requests(self, requests):
+        """Validate several requests, looking up each System only once
+
+        :param requests: The requests to validate
+        :return: Tuple of (list of validated requests, dictionary mapping request ID
+            to the exception that caused that request to fail validation)
+        """
+        self.logger.debug("Validating %d requests", len(requests))
+
+        systems = {}
+        validated = []
+        failures = {}
+
+        for request in requests:
+            try:
+                key = (
+                    request.system,
+                    request.system_version,
+                    request.command,
+                    request.instance_name,
+                )
+                if key not in systems:
+                    systems[key] = self.catalog.get(*key)
+
+                system = self.get_and_validate_system(request, system=systems[key])
+                command = self.get_and_validate_command_for_system(request, system)
+                request.parameters = self.get_and_validate_parameters(request, command)
+
+                validated.append(request)
+            except Exception as ex:
+                failures[str(request.id)] = ex
+
+        return validated, failures
+
+    def get_and_validate_system(self, request, system=None):
         """Ensure there is a system in the DB that corresponds to this Request.
 
         :param request: The request to validate
+        :param system: Specifies a System to use. If None the System catalog will be
+            consulted for the parts of the System needed by this Request's command.
         :return: The system corresponding to this Request
         :raises ModelValidationError: There is no system that corresponds to this Request
         """
-        system = System.find_unique(request.system, request.system_version)
+        if system is None:
+            system = self.catalog.get_for_command(
+                request.system,
+                request.system_version,
+                request.command,
+                request.instance_name,
+            )
+
         if system is None:
             raise ModelValidationError(
                 "Could not find System named '%s' matching version '%s'"
@@ -85,38 +180,45 @@ class RequestValidator(object):
                 "Could not validate command because it was None."
             )
 
-        self.logger.debug(
-            "Looking through Command Names to find the Command Specified."
-        )
-        command_names = []
-        for command in system.commands:
-            if command.name == request.command:
-                self.logger.debug("Found Command with name: %s" % request.command)
-
-                if request.command_type is None:
-                    request.command_type = command.command_type
-                elif command.command_type != request.command_type:
-                    raise ModelValidationError(
-                        "Command Type for Request was %s but the command specified "
-                        "the type as %s" % (request.command_type, command.command_type)
-                    )
+        if isinstance(system, CachedSystem):
+            command = system.command_index.get(request.command)
+        else:
+            self.logger.debug(
+                "Looking through Command Names to find the Command Specified."
+            )
+            command = next(
+                (c for c in system.commands if c.name == request.command), None
+            )
 
-                if request.output_type is None:
-                    request.output_type = command.output_type
-                elif command.output_type != request.output_type:
-                    raise ModelValidationError(
-                        "Output Type for Request was %s but the command specified "
-                        "the type as %s" % (request.output_type, command.output_type)
-                    )
+        if command is None:
+            raise ModelValidationError(
+                "No Command with name: %s could be found. Valid Commands for %s are: %s"
+                % (
+                    request.command,
+                    system.name,
+                    [command.name for command in system.commands],
+                )
+            )
 
-                return command
+        self.logger.debug("Found Command with name: %s" % request.command)
 
-            command_names.append(command.name)
+        if request.command_type is None:
+            request.command_type = command.command_type
+        elif command.command_type != request.command_type:
+            raise ModelValidationError(
+                "Command Type for Request was %s but the command specified "
+                "the type as %s" % (request.command_type, command.command_type)
+            )
 
-        raise ModelValidationError(
-            "No Command with name: %s could be found. Valid Commands for %s are: %s"
-            % (request.command, system.name, command_names)
-        )
+        if request.output_type is None:
+            request.output_type = command.output_type
+        elif command.output_type != request.output_type:
+            raise ModelValidationError(
+                "Output Type for Request was %s but the command specified "
+                "the type as %s" % (request.output_type, command.output_type)
+            )
+
+        return command
 
     def get_and_validate_parameters(
         self, request, command=None, command_parameters=None, request_parameters=None
@@ -142,34 +244,144 @@ class RequestValidator(object):
             command = self.get_and_validate_command_for_system(request)
 
         if command_parameters is None:
-            command_parameters = command.parameters
+            plan = self.get_plan(command)
+        else:
+            plan = ValidationPlan(command_parameters)
 
         if request_parameters is None:
             request_parameters = request.parameters
 
-        self._validate_no_extra_request_parameter_keys(
-            request_parameters, command_parameters
-        )
+        return self._validate_with_plan(request, command, plan, request_parameters)
+
+    def get_plan(self, command):
+        """Get the compiled validation plan for a command's parameters
+
+        Plans for commands from the System catalog are cached by the fingerprint of
+        their parameter definitions. Other commands are compiled on every call.
+
+        :param command: The command
+        :return: The ValidationPlan
+        """
+        if not isinstance(command, CachedCommand):
+            return ValidationPlan(command.parameters)
+
+        with self._plans_lock:
+            plan = self._plans.pop(command.fingerprint, None)
+            if plan is not None:
+                self._plans[command.fingerprint] = plan
+                return plan
+
+        plan = ValidationPlan(command.parameters)
+
+        with self._plans_lock:
+            self._plans[command.fingerprint] = plan
+            while len(self._plans) > self.MAX_PLANS:
+                self._plans.popitem(last=False)
+
+        return plan
+
+    def _validate_with_plan(self, request, command, plan, request_parameters):
+        """Validate request parameters against a compiled ValidationPlan"""
+        self._validate_no_extra_request_parameter_keys(request_parameters, plan)
+
+        prefetched = self._prefetch_choices(request, plan, request_parameters)
 
         parameters_to_save = {}
-        for command_parameter in command_parameters:
-            self._validate_required_parameter_is_included_in_request(
-                request, command_parameter, request_parameters
-            )
-            extracted_value = self._extract_parameter_value_from_request(
-                request, command_parameter, request_parameters, command
-            )
-            self._validate_value_in_choices(request, extracted_value, command_parameter)
-            self._validate_maximum(extracted_value, command_parameter)
-            self._validate_minimum(extracted_value, command_parameter)
-            self._validate_regex(extracted_value, command_parameter)
-            parameters_to_save[command_parameter.key] = extracted_value
+        try:
+            for command_parameter in plan.parameters:
+                self._validate_required_parameter_is_included_in_request(
+                    request, command_parameter, request_parameters
+                )
+                extracted_value = self._extract_parameter_value_from_request(
+                    request, command_parameter, request_parameters, command
+                )
+                self._validate_value_in_choices(
+                    request,
+                    extracted_value,
+                    command_parameter,
+                    prefetched.get(command_parameter.key),
+                )
+                self._validate_maximum(extracted_value, command_parameter)
+                self._validate_minimum(extracted_value, command_parameter)
+                self._validate_regex(extracted_value, command_parameter)
+                parameters_to_save[command_parameter.key] = extracted_value
+        finally:
+            # Validation may have failed before every result was needed
+            for future in prefetched.values():
+                future.cancel()
 
         self.logger.debug("Successfully Updated and Validated Parameters.")
         self.logger.debug("Parameters: %s", parameters_to_save)
         return parameters_to_save
 
-    def _validate_value_in_choices(self, request, value, command_parameter):
+    def _prefetch_choices(self, request, plan, request_parameters):
+        """Start the url and command choices lookups a plan will need
+
+        The lookups only depend on the request, so they can be resolved at once
+        instead of one after another. This is only worthwhile when there is more
+        than one of them. The first is left to be made on the calling thread, and
+        the pool is shared by every thrift worker, so lookups it has no idle thread
+        for are left to the calling thread too rather than queued behind other
+        requests' lookups.
+
+        :return: Dictionary mapping parameter key to a Future for its raw choices
+        """
+        to_fetch = [
+            parameter
+            for parameter in plan.parameters
+            if _has_strict_dynamic_choices(parameter)
+            and request_parameters.get(parameter.key, parameter.default) is not None
+        ]
+
+        prefetched = {}
+        for parameter in to_fetch[1:]:
+            future = self._submit_choices(self._get_raw_choices, request, parameter)
+            if future is None:
+                break
+            prefetched[parameter.key] = future
+
+        return prefetched
+
+    def _submit_choices(self, func, *args):
+        """Run a function on the choices pool if it has an idle thread
+
+        :return: A Future for the result, or None if every thread is busy
+        """
+        with self._choices_busy_lock:
+            if self._choices_busy >= self._choices_workers:
+                return None
+            self._choices_busy += 1
+
+        return self._run_choices(func, args)
+
+    def _queue_choices(self, func, *args):
+        """Run a function on the choices pool, waiting for a thread if need be
+
+        :return: A Future for the result
+        """
+        with self._choices_busy_lock:
+            self._choices_busy += 1
+
+        return self._run_choices(func, args)
+
+    def _run_choices(self, func, args):
+        """Submit to the choices pool, counting the work until it's done"""
+        try:
+            future = self._choices_pool.submit(func, *args)
+        except Exception:
+            self._choices_done(None)
+            raise
+
+        future.add_done_callback(self._choices_done)
+        return future
+
+    def _choices_done(self, _):
+        with self._choices_busy_lock:
+            self._choices_busy -= 1
+
+    def _validate_value_in_choices(
+        self, request, value, command_parameter, prefetched=None
+    ):
         """Validate that the value(s) are valid according to the choice constraints"""
         if (
             value is not None
@@ -177,81 +389,138 @@ class RequestValidator(object):
             and command_parameter.choices
             and command_parameter.choices.strict
         ):
+            if prefetched is not None:
+                allowed_values, allowed_set = collapse_choices(prefetched.result())
+            elif (
+                isinstance(command_parameter, ParameterPlan)
+                and command_parameter.allowed is not None
+            ):
+                allowed_values, allowed_set = command_parameter.allowed
+            else:
+                allowed_values, allowed_set = collapse_choices(
+                    self._get_raw_choices(request, command_parameter)
+                )
 
-            choices = command_parameter.choices
-
-            def map_param_values(kv_pair_list):
-                param_map = {}
-                for param_name, param_ref in kv_pair_list:
-                    if param_ref == "instance_name":
-                        param_map[param_name] = request.instance_name
-                    else:
-                        param_map[param_name] = request.parameters[param_ref]
-
-                return param_map
+            values = value if command_parameter.multi else [value]
+            for single_value in values:
+                if not _is_allowed(single_value, allowed_values, allowed_set):
+                    raise ModelValidationError(
+                        "Value '%s' is not a valid choice for parameter with key '%s'. "
+                        "Valid choices are: %s"
+                        % (single_value, command_parameter.key, allowed_values)
+                    )
 
-            if choices.type == "static":
-                if isinstance(choices.value, list):
-                    raw_allowed = choices.value
-                elif isinstance(choices.value, dict):
-                    key = choices.details.get("key_reference")
-                    if key is None:
-                        raise ModelValidationError(
-                            "Unable to validate choices for parameter '%s' - Choices"
-                            " with a dictionary value must specify a key_reference"
-                            % command_parameter.key
-                        )
+    def _get_raw_choices(self, request, command_parameter):
+        """Determine the list of allowed values for a parameter with choices"""
+        choices = command_parameter.choices
 
-                    if key == "instance_name":
-                        key_reference_value = request.instance_name
-                    else:
-                        # Mongoengine stores None keys as 'null', so use that instead of None
-                        key_reference_value = request.parameters.get(key) or "null"
+        if choices.type == "static":
+            if isinstance(choices.value, list):
+                return choices.value
+            elif isinstance(choices.value, dict):
+                key = choices.details.get("key_reference")
+                if key is None:
+                    raise ModelValidationError(
+                        "Unable to validate choices for parameter '%s' - Choices"
+                        " with a dictionary value must specify a key_reference"
+                        % command_parameter.key
+                    )
 
-                    raw_allowed = choices.value.get(key_reference_value)
-                    if raw_allowed is None:
-                        raise ModelValidationError(
-                            "Unable to validate choices for parameter '%s' - Choices"
-                            " dictionary doesn't contain an entry with key '%s'"
-                            % (command_parameter.key, key_reference_value)
-                        )
+                if key == "instance_name":
+                    key_reference_value = request.instance_name
                 else:
+                    # Mongoengine stores None keys as 'null', so use that instead of None
+                    key_reference_value = request.parameters.get(key) or "null"
+
+                raw_allowed = choices.value.get(key_reference_value)
+                if raw_allowed is None:
                     raise ModelValidationError(
-                        "Unable to validate choices for parameter '%s' - Choices value"
-                        " must be a list or dictionary " % command_parameter.key
+                        "Unable to validate choices for parameter '%s' - Choices"
+                        " dictionary doesn't contain an entry with key '%s'"
+                        % (command_parameter.key, key_reference_value)
                     )
-            elif choices.type == "url":
-                parsed_value = parse(choices.value, parse_as="url")
-                query_params = map_param_values(parsed_value["args"])
 
-                raw_allowed = json.loads(
-                    self._session.get(parsed_value["address"], params=query_params).text
+                return raw_allowed
+            else:
+                raise ModelValidationError(
+                    "Unable to validate choices for parameter '%s' - Choices value"
+                    " must be a list or dictionary " % command_parameter.key
                 )
-            elif choices.type == "command":
-
-                if isinstance(choices.value, six.string_types):
-                    parsed_value = parse(choices.value, parse_as="func")
-                    response = self._client.send_bg_request(
-                        _command=parsed_value["name"],
-                        _system_name=request.system,
-                        _system_version=request.system_version,
-                        _instance_name=request.instance_name,
-                        **map_param_values(parsed_value["args"])
-                    )
-                elif isinstance(choices.value, dict):
-                    parsed_value = parse(choices.value["command"], parse_as="func")
-                    response = self._client.send_bg_request(
-                        _command=parsed_value["name"],
-                        _system_name=choices.value.get("system"),
-                        _system_version=choices.value.get("version"),
-                        _instance_name=choices.value.get("instance_name", "default"),
-                        **map_param_values(parsed_value["args"])
-                    )
+
+        cache_key, loader = self._dynamic_choices_lookup(request, command_parameter)
+
+        return self._choices_cache.get(
+            cache_key, loader, ttl=self._choices_ttl(choices)
+        )
+
+    def _dynamic_choices_lookup(self, request, command_parameter):
+        """Determine how to look up choices of type 'url' or 'command'
+
+        :return: Tuple of (cache key, callable that performs the lookup)
+        """
+        choices = command_parameter.choices
+        timeout = self._choices_timeout
+        if isinstance(choices.details, dict) and choices.details.get("timeout"):
+            timeout = choices.details["timeout"]
+
+        def map_param_values(kv_pair_list):
+            param_map = {}
+            for param_name, param_ref in kv_pair_list:
+                if param_ref == "instance_name":
+                    param_map[param_name] = request.instance_name
                 else:
-                    raise ModelValidationError(
-                        "Unable to validate choices for parameter '%s' - Choices value"
-                        " must be a string or dictionary " % command_parameter.key
-                    )
+                    param_map[param_name] = request.parameters[param_ref]
+
+            return param_map
+
+        if choices.type == "url":
+            parsed_value = parse(choices.value, parse_as="url")
+            address = parsed_value["address"]
+            query_params = map_param_values(parsed_value["args"])
+
+            def load_url_choices():
+                response = self._session.get(
+                    address, params=query_params, timeout=timeout
+                )
+                return json.loads(response.text)
+
+            return (
+                ("url", address, _freeze(query_params)),
+                self._guard_choices_lookup(
+                    command_parameter, urlparse(address).netloc, load_url_choices
+                ),
+            )
+
+        elif choices.type == "command":
+            if isinstance(choices.value, six.string_types):
+                parsed_value = parse(choices.value, parse_as="func")
+                target = {
+                    "_system_name": request.system,
+                    "_system_version": request.system_version,
+                    "_instance_name": request.instance_name,
+                }
+            elif isinstance(choices.value, dict):
+                parsed_value = parse(choices.value["command"], parse_as="func")
+                target = {
+                    "_system_name": choices.value.get("system"),
+                    "_system_version": choices.value.get("version"),
+                    "_instance_name": choices.value.get("instance_name", "default"),
+                }
+            else:
+                raise ModelValidationError(
+                    "Unable to validate choices for parameter '%s' - Choices value"
+                    " must be a string or dictionary " % command_parameter.key
+                )
+
+            command_name = parsed_value["name"]
+            command_args = map_param_values(parsed_value["args"])
+
+            def load_command_choices():
+                kwargs = dict(command_args)
+                kwargs.update(target)
+                response = self._client.send_bg_request(
+                    _command=command_name, _timeout=timeout, **kwargs
+                )
 
                 raw_allowed = json.loads(response.output)
                 if isinstance(raw_allowed, list):
@@ -265,38 +534,126 @@ class RequestValidator(object):
                         "Unable to validate choices for parameter '%s' - Result of "
                         " choices query must be a list" % command_parameter.key
                     )
-            else:
+
+                return raw_allowed
+
+            cache_key = (
+                "command",
+                target["_system_name"],
+                target["_system_version"],
+                target["_instance_name"],
+                command_name,
+                _freeze(command_args),
+            )
+            backend = "%s[%s]-%s" % (
+                target["_system_name"],
+                target["_system_version"],
+                target["_instance_name"],
+            )
+            return (
+                cache_key,
+                self._guard_choices_lookup(
+                    command_parameter, backend, load_command_choices
+                ),
+            )
+
+        else:
+            raise ModelValidationError(
+                "Unable to validate choices for parameter '%s' - No valid type "
+                "specified (valid types are %s)"
+                % (command_parameter.key, Choices.TYPES)
+            )
+
+    def _guard_choices_lookup(self, command_parameter, backend, loader):
+        """Wrap a choices lookup with the circuit breaker and bulkhead for its backend
+
+        The validator's sessions never retry, so each lookup is one attempt: the
+        breaker sees every failed attempt and a bulkhead slot is held for no
+        longer than the lookup's timeout. Lookups that are rejected or time out
+        are reported as validation errors.
+        """
+
+        def guarded_loader():
+            try:
+                return self._choices_guard.call(backend, loader)
+            except BackendUnavailableError as ex:
+                raise ModelValidationError(
+                    "Unable to validate choices for parameter '%s' - %s"
+                    % (command_parameter.key, ex)
+                )
+            except (Timeout, TimeoutExceededError):
                 raise ModelValidationError(
-                    "Unable to validate choices for parameter '%s' - No valid type "
-                    "specified (valid types are %s)"
-                    % (command_parameter.key, Choices.TYPES)
+                    "Unable to validate choices for parameter '%s' - Lookup from "
+                    "backend %s timed out" % (command_parameter.key, backend)
                 )
 
-            # At this point raw_allowed is a list, but that list can potentially contain
-            # {"value": "", "text": ""} dicts. Need to collapse those to strings
-            allowed_values = []
-            for allowed in raw_allowed:
-                if isinstance(allowed, dict):
-                    allowed_values.append(allowed["value"])
-                else:
-                    allowed_values.append(allowed)
+        return guarded_loader
 
-            if command_parameter.multi:
-                for single_value in value:
-                    if single_value not in allowed_values:
-                        raise ModelValidationError(
-                            "Value '%s' is not a valid choice for parameter with key '%s'. "
-                            "Valid choices are: %s"
-                            % (single_value, command_parameter.key, allowed_values)
+    def _choices_ttl(self, choices):
+        """Cache TTL for a choices lookup, which may be overridden per parameter"""
+        details = choices.details
+        if isinstance(details, dict) and details.get("cache_ttl") is not None:
+            return details["cache_ttl"]
+
+        return None
+
+    def warm_choices(self, system_name, system_version):
+        """Populate the choices cache for a System in the background
+
+        Only lookups that don't depend on other request parameters can be made
+        ahead of time, so those are the only ones that are attempted. Each distinct
+        lookup is made once (most don't depend on the instance), and they're all
+        queued on the choices pool. This does nothing unless
+        validator.choices.cache.prewarm is enabled.
+
+        :param system_name: The System name
+        :param system_version: The System version
+        :return: None
+        """
+        if not self._choices_prewarm:
+            return
+
+        system = self.catalog.get(system_name, system_version)
+        if system is None:
+            return
+
+        warming = set()
+        for instance_name in sorted(system.instance_names):
+            request = Request(
+                system=system_name,
+                system_version=system_version,
+                instance_name=instance_name,
+                parameters={},
+            )
+
+            for command in system.commands:
+                for parameter in _dynamic_choices_parameters(command.parameters):
+                    try:
+                        cache_key, loader = self._dynamic_choices_lookup(
+                            request, parameter
                         )
-            else:
-                if value not in allowed_values:
-                    raise ModelValidationError(
-                        "Value '%s' is not a valid choice for parameter with key '%s'. "
-                        "Valid choices are: %s"
-                        % (value, command_parameter.key, allowed_values)
+                    except (KeyError, ModelValidationError):
+                        continue
+
+                    if cache_key in warming:
+                        continue
+                    warming.add(cache_key)
+
+                    self.logger.debug("Pre-warming choices for %s", cache_key)
+                    self._queue_choices(
+                        self._warm_choices,
+                        cache_key,
+                        loader,
+                        self._choices_ttl(parameter.choices),
                     )
 
+    def _warm_choices(self, cache_key, loader, ttl):
+        """Load one entry into the choices cache, logging any failure"""
+        try:
+            self._choices_cache.get(cache_key, loader, ttl)
+        except Exception as ex:
+            self.logger.warning("Error pre-warming choices for %s: %s", cache_key, ex)
+
     def _validate_maximum(self, value, command_parameter):
         """Validate that the value(s) are below the specified maximum"""
         if value is not None and not command_parameter.optional:
@@ -347,10 +704,10 @@ class RequestValidator(object):
         """Validate that the value matches the regex"""
         if value is not None and not command_parameter.optional:
             if command_parameter.regex:
-                if not re.match(command_parameter.regex, value):
+                if not command_parameter.regex.match(value):
                     raise ModelValidationError(
                         "Value %s does not match regular expression %s"
-                        % (value, command_parameter.regex)
+                        % (value, command_parameter.regex.pattern)
                     )
 
     def _extract_parameter_value_from_request(
@@ -373,13 +730,9 @@ class RequestValidator(object):
                     "but was not provided as such" % command_parameter.key
                 )
 
-            value_to_return = []
-            for value in request_values:
-                value_to_return.append(
-                    self._validate_parameter_based_on_type(
-                        value, command_parameter, command, request
-                    )
-                )
+            value_to_return = self._validate_multi_values(
+                request_values, command_parameter, command, request
+            )
         else:
             value_to_return = self._validate_parameter_based_on_type(
                 request_value, command_parameter, command, request
@@ -387,6 +740,28 @@ class RequestValidator(object):
 
         return value_to_return
 
+    def _validate_multi_values(self, values, parameter, command, request):
+        """Validate every value of a multi parameter
+
+        Values of simple types are converted in a single pass. If that fails, or
+        the parameter needs anything more, each value is validated individually so
+        the error describes the value at fault.
+        """
+        if (
+            parameter.coerce is not None
+            and parameter.sub_plan is None
+            and (parameter.nullable or not any(v is None for v in values))
+        ):
+            try:
+                return list(map(parameter.coerce, values))
+            except (TypeError, ValueError):
+                pass
+
+        return [
+            self._validate_parameter_based_on_type(value, parameter, command, request)
+            for value in values
+        ]
+
     def _validate_required_parameter_is_included_in_request(
         self, request, command_parameter, request_parameters
     ):
@@ -405,19 +780,16 @@ class RequestValidator(object):
                     % (command_parameter.key, request.parameters)
                 )
 
-    def _validate_no_extra_request_parameter_keys(
-        self, request_parameters, command_parameters
-    ):
+    def _validate_no_extra_request_parameter_keys(self, request_parameters, plan):
         """Validate that all the parameters passed in were valid keys. If there is a key specified
         that is not noted in the database, then a validation error is thrown"""
         self.logger.debug("Validating Keys")
-        valid_keys = [cp.key for cp in command_parameters]
-        self.logger.debug("Valid Keys are : %s" % valid_keys)
+        self.logger.debug("Valid Keys are : %s" % plan.valid_keys)
         for key in request_parameters:
-            if key not in valid_keys:
+            if key not in plan.valid_key_set:
                 raise ModelValidationError(
                     "Unknown key '%s' provided in the parameters. Valid Keys are: %s"
-                    % (key, valid_keys)
+                    % (key, plan.valid_keys)
                 )
 
     def _validate_parameter_based_on_type(self, value, parameter, command, request):
@@ -430,40 +802,17 @@ class RequestValidator(object):
                     "There is no value for parameter '%s' "
                     "and this field is not nullable." % parameter.key
                 )
-            elif parameter.type.upper() == "STRING":
-                if isinstance(value, six.string_types):
-                    return str(value)
-                else:
-                    raise TypeError("Invalid value for string (%s)" % value)
-            elif parameter.type.upper() == "INTEGER":
-                if int(value) != float(value):
-                    raise TypeError("Invalid value for integer (%s)" % value)
-                return int(value)
-            elif parameter.type.upper() == "FLOAT":
-                return float(value)
-            elif parameter.type.upper() == "ANY":
-                return value
-            elif parameter.type.upper() == "BOOLEAN":
-                if value in [True, False]:
-                    return value
-                else:
-                    raise TypeError("Invalid value for boolean (%s)" % value)
-            elif parameter.type.upper() == "DICTIONARY":
-                dict_value = dict(value)
-                if parameter.parameters:
-                    self.logger.debug("Found Nested Parameters.")
-                    return self.get_and_validate_parameters(
-                        request, command, parameter.parameters, dict_value
-                    )
-                return dict_value
-            elif parameter.type.upper() == "DATE":
-                return int(value)
-            elif parameter.type.upper() == "DATETIME":
-                return int(value)
-            else:
+            elif parameter.coerce is None:
                 raise ModelValidationError(
                     "Unknown type for parameter. Please contact a system administrator."
                 )
+            elif parameter.sub_plan is not None:
+                self.logger.debug("Found Nested Parameters.")
+                return self._validate_with_plan(
+                    request, command, parameter.sub_plan, parameter.coerce(value)
+                )
+
+            return parameter.coerce(value)
         except TypeError as ex:
             self.logger.exception(ex)
             raise ModelValidationError(
@@ -476,3 +825,39 @@ class RequestValidator(object):
                 "Value for key: %s is not the correct type. Should be: %s"
                 % (parameter.key, parameter.type)
             )
+
+
+def _is_allowed(value, allowed_values, allowed_set):
+    """Check a value against allowed values, using the set when possible"""
+    if allowed_set is not None:
+        try:
+            return value in allowed_set
+        except TypeError:
+            pass
+
+    return value in allowed_values
+
+
+def _freeze(params):
+    """Hashable, order-independent representation of lookup arguments"""
+    return json.dumps(params, sort_keys=True, default=repr)
+
+
+def _has_strict_dynamic_choices(parameter):
+    """Whether validating a parameter requires a url or command choices lookup"""
+    return bool(
+        not parameter.optional
+        and parameter.choices
+        and parameter.choices.strict
+        and parameter.choices.type in ("url", "command")
+    )
+
+
+def _dynamic_choices_parameters(parameters):
+    """Yield every parameter (including nested ones) with url or command choices"""
+    for parameter in parameters:
+        if parameter.choices and parameter.choices.type in ("url", "command"):
+            yield parameter
+
+        for nested in _dynamic_choices_parameters(parameter.parameters or []):
+            yield nested
@@ -72,6 +72,70 @@ SPECIFICATION = {
                 "description": "Virtual host to use for AMQ",
                 "previous_names": ["amq_virtual_host"],
             },
+            "publisher": {
+                "type": "dict",
+                "items": {
+                    "async_confirms": {
+                        "type": "bool",
+                        "default": False,
+                        "description": "Track publisher confirms asynchronously so "
+                        "that many requests can be awaiting confirmation at once",
+                    },
+                    "confirm_timeout": {
+                        "type": "int",
+                        "default": 30,
+                        "description": "Seconds to wait for a published request to "
+                        "be confirmed when async_confirms is enabled",
+                    },
+                },
+            },
+            "content_types": {
+                "type": "list",
+                "required": False,
+                "default": [],
+                "description": "Binary content types requests may be published "
+                "in, to plugin instances that advertise support for them in their "
+                "'content_types' metadata (application/msgpack is supported). "
+                "Other instances are sent JSON",
+                "items": {"content_type": {"type": "str"}},
+            },
+            "spool": {
+                "type": "dict",
+                "items": {
+                    "directory": {
+                        "type": "str",
+                        "required": False,
+                        "description": "Directory to spool requests to while AMQ "
+                        "is unavailable or blocking publishers, to be published "
+                        "once it recovers. Requests fail to publish if unset",
+                    },
+                    "segment_size": {
+                        "type": "int",
+                        "default": 16777216,
+                        "description": "Bytes written to a spool file before "
+                        "starting a new one",
+                    },
+                    "max_size": {
+                        "type": "int",
+                        "default": 0,
+                        "description": "Maximum bytes of spooled requests per "
+                        "process, beyond which requests fail to publish (0 for no "
+                        "limit)",
+                    },
+                    "fsync": {
+                        "type": "bool",
+                        "default": True,
+                        "description": "Make sure each spooled request is on disk "
+                        "before acknowledging it",
+                    },
+                    "retry_interval": {
+                        "type": "int",
+                        "default": 5,
+                        "description": "Seconds between attempts to publish "
+                        "spooled requests while AMQ is unavailable",
+                    },
+                },
+            },
             "connections": {
                 "type": "dict",
                 "items": {
@@ -346,16 +410,73 @@ SPECIFICATION = {
             },
         },
     },
+    "http": {
+        "type": "dict",
+        "items": {
+            "pool_connections": {
+                "type": "int",
+                "default": 10,
+                "description": "Number of hosts to keep HTTP connection pools for",
+            },
+            "pool_maxsize": {
+                "type": "int",
+                "default": 10,
+                "description": "Maximum number of HTTP connections kept per host",
+            },
+            "keep_alive": {
+                "type": "bool",
+                "default": True,
+                "description": "Reuse HTTP connections between requests",
+            },
+            "retries": {
+                "type": "int",
+                "default": 3,
+                "description": "Number of times to retry HTTP requests that fail "
+                "to connect (or idempotent requests that fail with a 502, 503 "
+                "or 504)",
+            },
+            "backoff_factor": {
+                "type": "float",
+                "default": 0.5,
+                "description": "Base of the exponential backoff between HTTP "
+                "retries, in seconds",
+            },
+            "backoff_jitter": {
+                "type": "float",
+                "default": 0.5,
+                "description": "Fraction of each HTTP retry backoff to randomize",
+            },
+        },
+    },
     "thrift": {
         "type": "dict",
         "items": {
             "max_workers": {
                 "type": "int",
                 "default": 25,
-                "description": "Maximum number of threads for handling incoming thrift calls",
+                "description": "Maximum number of threads for reading incoming thrift "
+                "calls and running the hot path ones",
                 "previous_names": ["max_thrift_workers"],
                 "alt_env_names": ["MAX_THRIFT_WORKERS"],
             },
+            "min_workers": {
+                "type": "int",
+                "default": 5,
+                "description": "Minimum number of threads kept for reading "
+                "incoming thrift calls, even when idle (capped at max_workers)",
+            },
+            "keep_alive": {
+                "type": "int",
+                "default": 60,
+                "description": "Seconds a thrift thread above min_workers may "
+                "sit idle before it is retired",
+            },
+            "grow_wait": {
+                "type": "float",
+                "default": 0.05,
+                "description": "Seconds a call may wait for a thrift thread before "
+                "another is started (up to max_workers)",
+            },
             "host": {
                 "type": "str",
                 "default": "0.0.0.0",
@@ -368,6 +489,361 @@ SPECIFICATION = {
                 "description": "Port to bind the thrift server to",
                 "previous_names": ["thrift_port"],
             },
+            "processes": {
+                "type": "int",
+                "default": 1,
+                "description": "Number of processes serving thrift calls. With more "
+                "than one, each process binds the same host and port (which "
+                "requires SO_REUSEPORT) and calls that manage local plugins are "
+                "forwarded to the main process",
+            },
+            "ipc_socket": {
+                "type": "str",
+                "required": False,
+                "description": "Unix socket thrift processes use to forward calls "
+                "to the main process. Defaults to a file in the temp directory",
+            },
+            "backlog": {
+                "type": "int",
+                "default": 128,
+                "description": "Maximum number of connections waiting to be "
+                "accepted by the thrift server",
+            },
+            "tcp_nodelay": {
+                "type": "bool",
+                "default": True,
+                "description": "Send thrift responses without waiting to coalesce "
+                "them with later writes (disables Nagle's algorithm)",
+            },
+            "client_timeout": {
+                "type": "int",
+                "default": 10000,
+                "description": "Milliseconds to wait on a client socket read while "
+                "processing a call. A client that stalls partway through a call is "
+                "disconnected after this long so it can't hold a worker (0 to wait "
+                "forever)",
+            },
+            "idle_timeout": {
+                "type": "int",
+                "default": 0,
+                "description": "Seconds a client connection may sit without making "
+                "a call before it is closed (0 to never close)",
+            },
+            "queue_depth": {
+                "type": "int",
+                "default": 100,
+                "description": "Maximum number of calls waiting for a worker before "
+                "new calls are refused as busy (0 for no limit)",
+            },
+            "max_wait": {
+                "type": "float",
+                "default": 30.0,
+                "description": "Seconds a call may wait for a worker before it is "
+                "refused as busy (0 for no limit)",
+            },
+            "stats_interval": {
+                "type": "int",
+                "default": 300,
+                "description": "Seconds between logging the thrift server's queue "
+                "depth, wait times, refused calls and worker pool size (0 to only "
+                "log them at shutdown)",
+            },
+            "transport": {
+                "type": "str",
+                "default": "buffered",
+                "choices": ["buffered", "framed"],
+                "description": "Thrift transport. Framed transport delimits each "
+                "call, buffered streams them. Brew-view must use the same one",
+            },
+            "protocol": {
+                "type": "str",
+                "default": "binary",
+                "choices": ["binary", "compact"],
+                "description": "Thrift protocol. Compact produces smaller "
+                "payloads at some encoding cost. Brew-view must use the same one",
+            },
+            "ssl": {
+                "type": "dict",
+                "items": {
+                    "cert_file": {
+                        "type": "str",
+                        "required": False,
+                        "description": "Certificate (with private key) to serve "
+                        "thrift over TLS. Thrift is served in plaintext if unset",
+                    },
+                    "handshake_timeout": {
+                        "type": "float",
+                        "default": 10.0,
+                        "description": "Seconds a client may take to complete "
+                        "the TLS handshake before it is disconnected",
+                    },
+                    "session_tickets": {
+                        "type": "bool",
+                        "default": True,
+                        "description": "Allow clients to resume TLS sessions "
+                        "with session tickets when they reconnect",
+                    },
+                },
+            },
+            "pools": {
+                "type": "dict",
+                "items": {
+                    "lifecycle": {
+                        "type": "dict",
+                        "items": {
+                            "max_workers": {
+                                "type": "int",
+                                "default": 5,
+                                "description": "Maximum number of threads for "
+                                "starting, stopping, reloading and removing "
+                                "systems and instances",
+                            }
+                        },
+                    },
+                    "admin": {
+                        "type": "dict",
+                        "items": {
+                            "max_workers": {
+                                "type": "int",
+                                "default": 2,
+                                "description": "Maximum number of threads for "
+                                "clearing queues and rescanning the plugin "
+                                "directory",
+                            }
+                        },
+                    },
+                },
+            },
+        },
+    },
+    "scheduler": {
+        "type": "dict",
+        "items": {
+            "max_concurrent": {
+                "type": "int",
+                "default": 0,
+                "description": "Number of requests that may be validated and "
+                "published at once, shared fairly between systems (0 to disable "
+                "fair scheduling). Requests waiting for their turn hold a thrift "
+                "worker, so keep this plus the requests that may wait below "
+                "thrift.max_workers",
+            },
+            "max_wait": {
+                "type": "float",
+                "default": 5.0,
+                "description": "Seconds a request may wait for its system's turn "
+                "before it is refused (0 for no limit)",
+            },
+            "max_queued": {
+                "type": "int",
+                "default": 5,
+                "description": "Maximum number of requests per system waiting for "
+                "their turn before more are refused (0 for no limit)",
+            },
+            "stats_interval": {
+                "type": "int",
+                "default": 300,
+                "description": "Seconds between logging the number of requests "
+                "running and waiting for each system (0 to only log them at "
+                "shutdown)",
+            },
+            "systems": {
+                "type": "list",
+                "required": False,
+                "default": [],
+                "description": "Scheduling settings for individual systems",
+                "items": {
+                    "system": {
+                        "type": "dict",
+                        "items": {
+                            "name": {
+                                "type": "str",
+                                "description": "Name of the system",
+                            },
+                            "weight": {
+                                "type": "float",
+                                "default": 1.0,
+                                "description": "Share of processing slots "
+                                "relative to other systems",
+                            },
+                            "max_concurrent": {
+                                "type": "int",
+                                "default": 0,
+                                "description": "Maximum number of this system's "
+                                "requests processed at once (0 for no limit)",
+                            },
+                        },
+                    }
+                },
+            },
+        },
+    },
+    "outbox": {
+        "type": "dict",
+        "items": {
+            "enabled": {
+                "type": "bool",
+                "default": False,
+                "description": "Return from processRequest once the validated "
+                "request is queued in the database, and publish queued requests "
+                "in batches from a separate thread",
+            },
+            "batch_size": {
+                "type": "int",
+                "default": 100,
+                "description": "Maximum number of queued requests published at " "once",
+            },
+            "poll_interval": {
+                "type": "float",
+                "default": 1.0,
+                "description": "Seconds between checks for requests queued by "
+                "other thrift processes",
+            },
+            "lease": {
+                "type": "int",
+                "default": 30,
+                "description": "Seconds a publisher may hold a batch of queued "
+                "requests before another publisher may take them over",
+            },
+            "retry_delay": {
+                "type": "int",
+                "default": 5,
+                "description": "Seconds before a queued request that failed to "
+                "publish is tried again",
+            },
+            "collection": {
+                "type": "str",
+                "default": "bartender_request_outbox",
+                "description": "Database collection holding queued requests",
+            },
+        },
+    },
+    "publish_filter": {
+        "type": "dict",
+        "items": {
+            "window": {
+                "type": "int",
+                "default": 0,
+                "description": "Seconds a published request is remembered, so "
+                "retried processRequest calls for it are not published again "
+                "(0 to disable). Enabling this adds two database writes to every "
+                "processRequest call",
+            },
+            "max_size": {
+                "type": "int",
+                "default": 10000,
+                "description": "Maximum number of published request IDs each "
+                "process remembers in memory. Older ones are still found in the "
+                "database",
+            },
+            "claim_timeout": {
+                "type": "int",
+                "default": 60,
+                "description": "Seconds before a request that was claimed but "
+                "never published may be published by a retry",
+            },
+            "collection": {
+                "type": "str",
+                "default": "bartender_published_requests",
+                "description": "Database collection recording published requests",
+            },
+        },
+    },
+    "validator": {
+        "type": "dict",
+        "items": {
+            "catalog": {
+                "type": "dict",
+                "items": {
+                    "ttl": {
+                        "type": "int",
+                        "default": 10,
+                        "description": "Seconds a cached System definition is used "
+                        "for request validation before it is reloaded",
+                    }
+                },
+            },
+            "choices": {
+                "type": "dict",
+                "items": {
+                    "cache": {
+                        "type": "dict",
+                        "items": {
+                            "max_size": {
+                                "type": "int",
+                                "default": 1000,
+                                "description": "Maximum number of url and command "
+                                "choices lookups to cache",
+                            },
+                            "ttl": {
+                                "type": "int",
+                                "default": 0,
+                                "description": "Seconds a url or command choices "
+                                "lookup is cached (0 to disable). Can be overridden "
+                                "per parameter with the 'cache_ttl' choices detail",
+                            },
+                            "stale_ttl": {
+                                "type": "int",
+                                "default": 0,
+                                "description": "Seconds past its TTL that a cached "
+                                "choices lookup may be used while it is refreshed",
+                            },
+                            "prewarm": {
+                                "type": "bool",
+                                "default": False,
+                                "description": "Resolve choices lookups that don't "
+                                "depend on other parameters when an instance is "
+                                "initialized",
+                            },
+                        },
+                    },
+                    "max_workers": {
+                        "type": "int",
+                        "default": 5,
+                        "description": "Maximum number of threads, shared by every "
+                        "thrift worker, for resolving a request's url and command "
+                        "choices lookups alongside each other. A request's first "
+                        "lookup, and any the threads are too busy for, are made by "
+                        "its own thrift worker",
+                    },
+                    "timeout": {
+                        "type": "int",
+                        "default": 30,
+                        "description": "Seconds to wait for a url or command choices "
+                        "lookup (0 to wait forever). Can be overridden per parameter "
+                        "with the 'timeout' choices detail",
+                    },
+                    "breaker": {
+                        "type": "dict",
+                        "items": {
+                            "failure_threshold": {
+                                "type": "int",
+                                "default": 5,
+                                "description": "Consecutive failed choices lookups "
+                                "before a backend stops being called",
+                            },
+                            "reset_timeout": {
+                                "type": "int",
+                                "default": 30,
+                                "description": "Seconds before a backend that stopped "
+                                "being called is tried again",
+                            },
+                        },
+                    },
+                    "bulkhead": {
+                        "type": "dict",
+                        "items": {
+                            "max_concurrent": {
+                                "type": "int",
+                                "default": 5,
+                                "description": "Maximum number of choices lookups in "
+                                "progress to a single backend. Lookups beyond this "
+                                "are rejected",
+                            }
+                        },
+                    },
+                },
+            },
         },
     },
     "plugin": {
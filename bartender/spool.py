@@ -0,0 +1,474 @@
+import errno
+import fcntl
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Event, Lock
+
+import simplejson
+import six
+from pika.exceptions import AMQPConnectionError, AMQPError
+
+from bartender.errors import SpoolFullError
+from brewtils.stoppable_thread import StoppableThread
+
+# Record header: checksum, metadata length, body length
+_HEADER = struct.Struct(">III")
+
+_SEGMENT_SUFFIX = ".seg"
+
+
+class _Record(object):
+    __slots__ = ("segment", "start", "end", "spooled_at")
+
+    def __init__(self, segment, start, end, spooled_at):
+        self.segment = segment
+        self.start = start
+        self.end = end
+        self.spooled_at = spooled_at
+
+
+def _encode(message, kwargs, spooled_at):
+    text = isinstance(message, six.text_type)
+    body = message.encode("utf-8") if text else message
+    meta = simplejson.dumps(
+        {"kwargs": kwargs, "spooled_at": spooled_at, "text": text}
+    ).encode("utf-8")
+
+    checksum = zlib.crc32(meta + body) & 0xFFFFFFFF
+    return _HEADER.pack(checksum, len(meta), len(body)) + meta + body
+
+
+def _decode(data):
+    """Decode one record, returning (message, kwargs, spooled_at)
+
+    :raises ValueError: The record is truncated or corrupt
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated record header")
+
+    checksum, meta_len, body_len = _HEADER.unpack_from(data)
+    start = _HEADER.size
+    end = start + meta_len + body_len
+    payload = data[start:end]
+    if len(payload) != meta_len + body_len:
+        raise ValueError("Truncated record")
+    if zlib.crc32(payload) & 0xFFFFFFFF != checksum:
+        raise ValueError("Record checksum mismatch")
+
+    meta = simplejson.loads(payload[:meta_len].decode("utf-8"))
+    body = payload[meta_len:]
+    message = body.decode("utf-8") if meta["text"] else body
+
+    return message, meta["kwargs"], meta["spooled_at"]
+
+
+class PublishSpool(object):
+    """Append-only on-disk queue of messages waiting to be published
+
+    Messages are appended to segment files, which are removed once every
+    message in them has been consumed. Appends made at the same time share a
+    single fsync (group commit), so a message is on disk by the time
+    ``append`` returns without every message paying for its own fsync.
+
+    Each process uses its own numbered slot under ``directory``, locked for as
+    long as the spool is open. A slot left behind by a process that died is
+    picked up (and its messages replayed) by the next process to open a spool
+    there.
+
+    :param directory: Directory holding the spool slots
+    :param segment_size: Bytes after which a new segment file is started
+    :param max_size: Maximum bytes of unconsumed messages (0 for no limit)
+    :param fsync: Sync each append to disk before returning
+    """
+
+    def __init__(
+        self, directory, segment_size=16 * 1024 * 1024, max_size=0, fsync=True
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.fsync = fsync
+
+        self._lock = Lock()
+        self._sync_lock = Lock()
+        self._appended = Event()
+        self._records = deque()
+        self._bytes = 0
+
+        self.path, self._lock_file = self._lock_slot(directory)
+        self._recover()
+
+        self._written = 0
+        self._synced = 0
+        self._writer = open(self._segment_path(self._segment), "ab")
+        self._reader = None
+        self._reader_segment = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def append(self, message, kwargs):
+        """Add a message to the end of the spool
+
+        :param message: The message body
+        :param kwargs: Arguments to publish the message with
+        :raises SpoolFullError: The spool is at its size limit
+        """
+        now = time.time()
+        record = _encode(message, kwargs, now)
+
+        with self._lock:
+            if self.max_size and self._bytes + len(record) > self.max_size:
+                raise SpoolFullError(
+                    "Publish spool at %s is full (%d bytes)" % (self.path, self._bytes)
+                )
+
+            offset = self._writer.tell()
+            if offset and offset + len(record) > self.segment_size:
+                self._rotate()
+                offset = 0
+
+            self._writer.write(record)
+            self._writer.flush()
+
+            self._records.append(
+                _Record(self._segment, offset, offset + len(record), now)
+            )
+            self._bytes += len(record)
+            self._written += 1
+            written = self._written
+
+        if self.fsync:
+            self._sync(written)
+
+        self._appended.set()
+
+    def peek(self, count):
+        """Read messages from the front of the spool without consuming them
+
+        :param count: Maximum number of messages to read
+        :return: List of (message, kwargs) tuples, oldest first
+        :raises ValueError: The first message is corrupt
+        :raises IOError: The first message can't be read
+        """
+        with self._lock:
+            records = [self._records[i] for i in range(min(count, len(self._records)))]
+
+        messages = []
+        for record in records:
+            try:
+                message, kwargs = self._read(record)
+            except (IOError, OSError, ValueError):
+                # Hand back what could be read, the error comes up next time
+                if messages:
+                    break
+                raise
+
+            messages.append((message, kwargs))
+
+        return messages
+
+    def consume(self, count):
+        """Remove messages from the front of the spool
+
+        :param count: Number of messages to remove
+        """
+        with self._lock:
+            for _ in range(min(count, len(self._records))):
+                record = self._records.popleft()
+                self._bytes -= record.end - record.start
+
+            if self._records:
+                cursor = (self._records[0].segment, self._records[0].start)
+            else:
+                cursor = (self._segment, self._writer.tell())
+
+            self._save_cursor(*cursor)
+
+            for segment in self._segments():
+                if segment >= cursor[0]:
+                    break
+                if segment == self._reader_segment:
+                    self._reader.close()
+                    self._reader = self._reader_segment = None
+                os.unlink(self._segment_path(segment))
+
+    def wait(self, timeout):
+        """Wait for a message to be appended
+
+        :param timeout: Seconds to wait
+        :return: True if a message was appended
+        """
+        appended = self._appended.wait(timeout)
+        self._appended.clear()
+        return appended
+
+    def wake(self):
+        """Wake anything waiting for a message"""
+        self._appended.set()
+
+    def stats(self):
+        with self._lock:
+            oldest = self._records[0].spooled_at if self._records else None
+
+        return {
+            "messages": len(self._records),
+            "bytes": self._bytes,
+            "oldest_age": time.time() - oldest if oldest is not None else 0,
+        }
+
+    def log_stats(self):
+        self.logger.info("Publish spool %s stats: %s", self.path, self.stats())
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+            if self._reader is not None:
+                self._reader.close()
+
+            self._lock_file.close()
+
+    def _read(self, record):
+        if self._reader_segment != record.segment:
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = self._reader_segment = None
+
+            self._reader = open(self._segment_path(record.segment), "rb")
+            self._reader_segment = record.segment
+
+        self._reader.seek(record.start)
+        message, kwargs, _ = _decode(self._reader.read(record.end - record.start))
+
+        return message, kwargs
+
+    def _sync(self, written):
+        """Make sure the first ``written`` appends are on disk
+
+        Whoever gets here first syncs everything appended so far, so callers
+        waiting behind it usually find their append already synced.
+        """
+        with self._sync_lock:
+            if self._synced >= written:
+                return
+
+            with self._lock:
+                target = self._written
+                fileno = self._writer.fileno()
+
+            os.fsync(fileno)
+            self._synced = target
+
+    def _rotate(self):
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+        self._writer.close()
+
+        self._segment += 1
+        self._writer = open(self._segment_path(self._segment), "ab")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, "%020d%s" % (segment, _SEGMENT_SUFFIX))
+
+    def _segments(self):
+        return sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.path)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _save_cursor(self, segment, offset):
+        path = os.path.join(self.path, "cursor")
+        with open(path + ".tmp", "w") as cursor_file:
+            simplejson.dump({"segment": segment, "offset": offset}, cursor_file)
+        os.rename(path + ".tmp", path)
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, "cursor")) as cursor_file:
+                cursor = simplejson.load(cursor_file)
+            return cursor["segment"], cursor["offset"]
+        except (IOError, OSError, ValueError, KeyError):
+            return 0, 0
+
+    def _lock_slot(self, directory):
+        """Lock the first free slot under directory"""
+        slot = 0
+        while True:
+            path = os.path.join(directory, str(slot))
+            try:
+                os.makedirs(path)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+
+            lock_file = open(os.path.join(path, "lock"), "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return path, lock_file
+            except (IOError, OSError) as ex:
+                lock_file.close()
+                if ex.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+
+            slot += 1
+
+    def _recover(self):
+        """Index the messages left in this slot by a previous process"""
+        segments = self._segments()
+        cursor_segment, cursor_offset = self._load_cursor()
+
+        for segment in segments:
+            if segment < cursor_segment:
+                os.unlink(self._segment_path(segment))
+                continue
+
+            offset = cursor_offset if segment == cursor_segment else 0
+            with open(self._segment_path(segment), "rb") as segment_file:
+                segment_file.seek(offset)
+                data = segment_file.read()
+
+            position = 0
+            while position < len(data):
+                try:
+                    checksum, meta_len, body_len = _HEADER.unpack_from(data, position)
+                    end = position + _HEADER.size + meta_len + body_len
+                    _, _, spooled_at = _decode(data[position:end])
+                except (ValueError, struct.error) as ex:
+                    self.logger.error(
+                        "Discarding the rest of spool segment %s from offset %d: %s",
+                        self._segment_path(segment),
+                        offset + position,
+                        ex,
+                    )
+                    with open(self._segment_path(segment), "r+b") as segment_file:
+                        segment_file.truncate(offset + position)
+                    break
+
+                self._records.append(
+                    _Record(segment, offset + position, offset + end, spooled_at)
+                )
+                self._bytes += end - position
+                position = end
+
+        self._segment = segments[-1] if segments else cursor_segment
+        if self._records:
+            self.logger.warning(
+                "Publish spool %s has %d messages left to publish",
+                self.path,
+                len(self._records),
+            )
+
+
+class SpoolReplayer(StoppableThread):
+    """Publishes spooled messages, in order, once the broker is reachable
+
+    Messages are only consumed from the spool once they are published. If
+    the broker can't be reached the replayer waits ``retry_interval`` seconds
+    and tries again from the same message. A publish that times out waiting
+    for its confirm is treated the same way, so that message may be published
+    twice. Messages the broker refuses (an unroutable message, say), or that
+    fail to publish for any other reason, are logged and dropped, as are
+    messages that are corrupt on disk, as retrying them won't help.
+
+    :param spool: The PublishSpool
+    :param publish: Called with each message and its publish kwargs
+    :param retry_interval: Seconds between attempts to reach the broker
+    :param batch_size: Number of messages read from the spool at once
+    """
+
+    # Seconds between logging spool stats while there is a backlog
+    STATS_INTERVAL = 60
+
+    def __init__(self, spool, publish, retry_interval=5, batch_size=100):
+        self.logger = logging.getLogger(__name__)
+        self.display_name = "Spool Replayer"
+        self.spool = spool
+        self.publish = publish
+        self.retry_interval = retry_interval
+        self.batch_size = batch_size
+
+        super(SpoolReplayer, self).__init__(logger=self.logger, name="SpoolReplayer")
+
+    def run(self):
+        self.logger.info(self.display_name + " is started")
+        last_stats = 0
+
+        while not self.stopped():
+            try:
+                messages = self.spool.peek(self.batch_size)
+            except ValueError as ex:
+                self.logger.error(
+                    "Dropping corrupt message from publish spool %s: %s",
+                    self.spool.path,
+                    ex,
+                )
+                self.spool.consume(1)
+                continue
+            except Exception as ex:
+                self.logger.error(
+                    "Unable to read publish spool %s, will retry: %s",
+                    self.spool.path,
+                    ex,
+                )
+                self.wait(self.retry_interval)
+                continue
+
+            if not messages:
+                self.spool.wait(self.retry_interval)
+                continue
+
+            if time.time() - last_stats > self.STATS_INTERVAL:
+                self.spool.log_stats()
+                last_stats = time.time()
+
+            published = self._replay(messages)
+            self.spool.consume(published)
+
+            if published < len(messages):
+                self.wait(self.retry_interval)
+            elif not len(self.spool):
+                self.logger.info("Publish spool %s is drained", self.spool.path)
+
+        self.logger.info(self.display_name + " is stopped")
+
+    def stop(self):
+        super(SpoolReplayer, self).stop()
+        self.spool.wake()
+
+    def _replay(self, messages):
+        """Publish messages until the broker can't be reached
+
+        :return: Number of messages consumed
+        """
+        for index, (message, kwargs) in enumerate(messages):
+            if self.stopped():
+                return index
+
+            try:
+                self.publish(message, **kwargs)
+            except AMQPConnectionError as ex:
+                self.logger.warning("Broker still unavailable for replay: %s", ex)
+                return index
+            except FutureTimeoutError:
+                self.logger.warning("Timed out waiting for replay to be confirmed")
+                return index
+            except AMQPError as ex:
+                self.logger.error(
+                    "Dropping spooled message for %s, it was refused: %s",
+                    kwargs.get("routing_key"),
+                    ex,
+                )
+            except Exception as ex:
+                self.logger.exception(
+                    "Dropping spooled message for %s, unable to publish it: %s",
+                    kwargs.get("routing_key"),
+                    ex,
+                )
+
+        return len(messages)
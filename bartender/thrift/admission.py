@@ -0,0 +1,91 @@
+import logging
+import time
+from threading import Lock
+
+from thriftpy2.thrift import TApplicationException
+
+# TApplicationException type sent back when a call is refused. It sits well
+# above the standard Thrift codes so clients can tell "busy, retry later"
+# apart from real failures.
+SERVER_BUSY = 100
+
+
+def server_busy(reason):
+    """Build the exception returned to clients for a refused call"""
+    return TApplicationException(
+        type=SERVER_BUSY, message="Server busy (%s), please retry" % reason
+    )
+
+
+class AdmissionQueue(object):
+    """Bounds the number of calls waiting for a worker
+
+    Calls are admitted with ``try_enter`` before being handed to the worker
+    pool. Once a worker picks a call up it reports in with ``start``, which
+    refuses the call if it waited longer than ``max_wait``.
+
+    Args:
+        max_depth: Maximum number of admitted calls waiting for a worker
+            (0 for no limit)
+        max_wait: Maximum seconds a call may wait for a worker (0 for no
+            limit)
+    """
+
+    def __init__(self, max_depth=0, max_wait=0):
+        self.logger = logging.getLogger(__name__)
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+
+        self._lock = Lock()
+        self._depth = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._expired = 0
+        self._total_wait = 0.0
+        self._longest_wait = 0.0
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def try_enter(self):
+        """Admit a call, returning False if the queue is already full"""
+        with self._lock:
+            if self.max_depth and self._depth >= self.max_depth:
+                self._rejected += 1
+                return False
+
+            self._depth += 1
+            self._admitted += 1
+            return True
+
+    def start(self, enqueued_at):
+        """Mark an admitted call as started, returning False if it expired"""
+        waited = time.time() - enqueued_at
+
+        with self._lock:
+            self._depth -= 1
+            self._total_wait += waited
+            self._longest_wait = max(self._longest_wait, waited)
+
+            if self.max_wait and waited > self.max_wait:
+                self._expired += 1
+                return False
+
+            return True
+
+    def stats(self):
+        with self._lock:
+            started = self._admitted - self._depth
+            return {
+                "depth": self._depth,
+                "max_depth": self.max_depth,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "average_wait": self._total_wait / started if started else 0.0,
+                "longest_wait": self._longest_wait,
+            }
+
+    def log_stats(self, name):
+        self.logger.info("%s admission stats: %s", name, self.stats())
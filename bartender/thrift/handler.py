@@ -1,15 +1,27 @@
 import logging
 import random
 import string
+from collections import OrderedDict
 from datetime import datetime
 
 import mongoengine
 import pika.spec
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from pyrabbit2.http import HTTPError
+from thriftpy2.protocol import TCyBinaryProtocol
+from thriftpy2.thrift import TClient
+from thriftpy2.transport import TCyBufferedTransport, TSocket
 from time import sleep
 
 import bartender
 import bartender._version
+from bartender import encoding
+from bartender.errors import SystemThrottledError
+from bartender.fair_scheduler import FairScheduler
+from bartender.publish_filter import PublishFilter
+from bartender.raw_request import RawRequest
 import bg_utils
 from bg_utils.mongo.models import Instance, Request, System, StatusInfo
 from bg_utils.pika import get_routing_key, get_routing_keys
@@ -17,59 +29,482 @@ from brewtils.errors import ModelValidationError, RestError
 from brewtils.schema_parser import SchemaParser
 
 
+# Thrift server pool each slow handler method runs on. Methods not listed here
+# run on the hot path workers that read the calls.
+METHOD_POOLS = {
+    "initializeInstance": "lifecycle",
+    "startInstance": "lifecycle",
+    "stopInstance": "lifecycle",
+    "restartInstance": "lifecycle",
+    "reloadSystem": "lifecycle",
+    "removeSystem": "lifecycle",
+    "rescanSystemDirectory": "admin",
+    "clearQueue": "admin",
+    "clearAllQueues": "admin",
+}
+
+# Request fields that request validation can change. After validation only
+# these are written back, rather than the whole Request.
+VALIDATED_FIELDS = ("parameters", "command_type", "output_type", "updated_at")
+
+# Handler methods that manage local plugins. Only the main process knows about
+# those, so any other thrift server processes forward these calls to it.
+FORWARDED_METHODS = (
+    "startInstance",
+    "stopInstance",
+    "restartInstance",
+    "reloadSystem",
+    "removeSystem",
+    "rescanSystemDirectory",
+)
+
+
 class BartenderHandler(object):
     """Implements the BREWMASTER Thrift interface."""
 
-    def __init__(self, registry, clients, plugin_manager, request_validator):
+    def __init__(
+        self,
+        registry,
+        clients,
+        plugin_manager,
+        request_validator,
+        scheduler=None,
+        publish_filter=None,
+        outbox=None,
+    ):
         self.logger = logging.getLogger(__name__)
         self.registry = registry
         self.clients = clients
         self.plugin_manager = plugin_manager
         self.request_validator = request_validator
+        self.scheduler = scheduler or FairScheduler()
+        self.publish_filter = publish_filter or PublishFilter()
+        self.outbox = outbox
         self.parser = SchemaParser()
 
     def processRequest(self, request_id):
         """Validates and publishes a Request.
 
+        With an outbox the validated Request is queued, and published by the
+        outbox publisher after this returns.
+
         :param str request_id: The ID of the Request to process
         :raises InvalidRequest: If the Request is invalid in some way
         :return: None
         """
         request_id = str(request_id)
+
+        # Retries of a call that already published the Request (after a
+        # timeout, say) return straight away rather than publish it again
+        if self.publish_filter.recently_published(request_id):
+            self.logger.info("Request %s was already published", request_id)
+            return
+
         self.logger.info("Processing Request: %s", request_id)
 
         try:
-            request = Request.find_or_none(request_id)
+            # Work on the raw document rather than decoding it into a model
+            request = RawRequest.find(request_id)
             if request is None:
                 raise ModelValidationError(
                     "Could not find request with ID '%s'" % request_id
                 )
 
-            # Validates the request based on what is in the database.
-            # This includes the validation of the request parameters,
-            # systems are there, commands are there etc.
-            request = self.request_validator.validate_request(request)
-            request.save()
+            # Child Requests are published along with their parent, and only
+            # the model knows how to dereference it
+            if request.parent is not None:
+                request = request.to_model()
+
+            # Wait for this System's fair share of processing slots so one
+            # System flooding requests can't starve the others
+            with self.scheduler.slot(request.system):
+                self._validate_and_publish(request)
+
+        except (mongoengine.ValidationError, ModelValidationError, RestError) as ex:
+            self.logger.exception(ex)
+            raise bg_utils.bg_thrift.InvalidRequest(request_id, str(ex))
+        except SystemThrottledError as ex:
+            # The Request is fine, it just can't be published right now
+            self.logger.warning("Request %s throttled: %s", request_id, ex)
+            raise bg_utils.bg_thrift.PublishException(str(ex))
+
+    def _validate_and_publish(self, request):
+        if not self.publish_filter.claim(request.id):
+            self.logger.info(
+                "Request %s was already published (or is being published)", request.id
+            )
+            return
+
+        try:
+            published = self._validate_and_publish_claimed(request)
+        except Exception:
+            self.publish_filter.release(request.id)
+            raise
+
+        if published:
+            try:
+                self.publish_filter.published(request.id)
+            except Exception as ex:
+                self.logger.warning(
+                    "Unable to record that Request %s was published: %s", request.id, ex
+                )
+
+    def _validate_and_publish_claimed(self, request):
+        # Validates the request based on what is in the database.
+        # This includes the validation of the request parameters,
+        # systems are there, commands are there etc.
+        status = request.status
+        request = self.request_validator.validate_request(request)
+
+        # In outbox mode the publisher thread saves and publishes it
+        if self.outbox is not None:
+            request.updated_at = datetime.utcnow()
+            request.validate()
+            self.outbox.add(request.id, status, self._validated_fields(request))
+            return True
+
+        if not self._save_validated(request, status):
+            self.logger.info(
+                "Request %s is no longer %s, not publishing it", request.id, status
+            )
+            return False
+
+        try:
+            self.clients["pika"].publish_request(
+                request,
+                content_type=self._content_type(request),
+                confirm=True,
+                mandatory=True,
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+                spool=True,
+            )
+        except Exception:
+            msg = "Error while publishing request to queue (%s[%s]-%s %s)" % (
+                request.system,
+                request.system_version,
+                request.instance_name,
+                request.command,
+            )
+            raise bg_utils.bg_thrift.PublishException(msg)
+
+        return True
+
+    def _content_type(self, request):
+        """Content type negotiated with the Instance a Request is for
+
+        The System was just used to validate the Request, so this is normally
+        answered from the catalog without going to the database. Initializing
+        an Instance invalidates its System in every thrift process's catalog, so
+        a newly negotiated content type is used from then on.
+        """
+        system = self.request_validator.catalog.get_for_command(
+            request.system,
+            request.system_version,
+            request.command,
+            request.instance_name,
+        )
+        if system is None:
+            return None
+
+        return system.content_types.get(request.instance_name)
+
+    def _save_validated(self, request, status):
+        """Write back the fields validation can change with a single update
+
+        The update only applies while the Request still has the status it was
+        loaded with, so a concurrent change (a cancel, for example) is never
+        overwritten.
+
+        :param request: The validated Request
+        :param status: The status the Request was loaded with
+        :return: True if the Request was updated, False if its status changed
+        """
+        request.updated_at = datetime.utcnow()
+        request.validate()
+
+        result = Request._get_collection().update_one(
+            {"_id": request.id, "status": status},
+            {"$set": self._validated_fields(request)},
+        )
+        return result.matched_count == 1
+
+    @staticmethod
+    def _validated_fields(request):
+        document = request.to_mongo()
+        return {
+            field: document[field] for field in VALIDATED_FIELDS if field in document
+        }
+
+    def _process_requests(self, request_ids):
+        """Validates and publishes a batch of Requests.
+
+        The BartenderBackend IDL in bg-utils doesn't declare a batch call yet,
+        so this isn't part of the thrift interface. It should become
+        ``processRequests`` once the IDL does.
+
+        Every Request gets the same guarantees as in ``processRequest``: Requests
+        already published are skipped, a Request whose status changes while it
+        is processed isn't published, and each System's Requests are processed
+        in one of its scheduler slots and published in the Instance's content
+        type (through the outbox, or spooled if the broker is unavailable, when
+        those are enabled).
+
+        The work is batched: all Requests are loaded with a single query, and
+        each System's Requests are validated against a shared System lookup,
+        saved with a single bulk write and published over a single channel. A
+        failure for one Request does not affect the others.
+
+        :param list request_ids: The IDs of the Requests to process
+        :return: Dictionary mapping each Request ID to an error message, or to an
+            empty string if that Request was processed successfully
+        """
+        request_ids = [str(request_id) for request_id in request_ids]
+        self.logger.info("Processing %d Requests", len(request_ids))
+
+        failures = {}
+
+        query_ids, missing = [], []
+        for request_id in request_ids:
+            if self.publish_filter.recently_published(request_id):
+                self.logger.info("Request %s was already published", request_id)
+            elif ObjectId.is_valid(request_id):
+                query_ids.append(request_id)
+            else:
+                missing.append(request_id)
+
+        requests = list(Request.objects(id__in=query_ids)) if query_ids else []
+        found = set(str(request.id) for request in requests)
+
+        missing.extend(
+            request_id for request_id in query_ids if request_id not in found
+        )
+        for request_id in missing:
+            failures[request_id] = "Could not find request with ID '%s'" % request_id
+
+        by_system = OrderedDict()
+        for request in requests:
+            by_system.setdefault(request.system, []).append(request)
+
+        for system, system_requests in by_system.items():
+            try:
+                # Holding one slot at a time, so a batch can't deadlock with others
+                with self.scheduler.slot(system):
+                    failures.update(self._process_batch(system_requests))
+            except SystemThrottledError as ex:
+                self.logger.warning("Requests for %s were refused: %s", system, ex)
+                for request in system_requests:
+                    failures[str(request.id)] = str(ex)
+            except Exception as ex:
+                self.logger.exception("Error processing Requests for %s", system)
+                for request in system_requests:
+                    failures[str(request.id)] = str(ex)
+
+        return {request_id: failures.get(request_id, "") for request_id in request_ids}
+
+    def _process_batch(self, requests):
+        """Validate, save and publish Requests the way processRequest does
+
+        :param requests: The Requests
+        :return: Dictionary mapping Request ID to an error message for the
+            Requests that failed
+        """
+        claimed = []
+        for request in requests:
+            if self.publish_filter.claim(request.id):
+                claimed.append(request)
+            else:
+                self.logger.info(
+                    "Request %s was already published (or is being published)",
+                    request.id,
+                )
+
+        # Validation may change the Requests, but not their statuses
+        statuses = dict((str(request.id), request.status) for request in claimed)
+        failures = {}
+
+        try:
+            validated, invalid = self.request_validator.validate_requests(claimed)
+            for request_id, ex in invalid.items():
+                self.logger.error("Request %s is invalid: %s", request_id, ex)
+                failures[request_id] = str(ex)
+
+            if self.outbox is not None:
+                published, unqueued = self._queue_requests(validated, statuses)
+                failures.update(unqueued)
+            else:
+                saved, unsaved = self._bulk_save_requests(validated, statuses)
+                failures.update(unsaved)
+
+                published, unpublished = self._publish_requests(saved)
+                failures.update(unpublished)
+        except Exception:
+            for request in claimed:
+                self.publish_filter.release(request.id)
+            raise
+
+        for request in claimed:
+            if str(request.id) in failures:
+                self.publish_filter.release(request.id)
+
+        for request in published:
+            try:
+                self.publish_filter.published(request.id)
+            except Exception as ex:
+                self.logger.warning(
+                    "Unable to record that Request %s was published: %s", request.id, ex
+                )
+
+        return failures
+
+    def _queue_requests(self, requests, statuses):
+        """Queue validated Requests in the outbox
+
+        :param requests: The validated Requests
+        :param statuses: Dictionary mapping Request ID to the status the Request
+            was loaded with
+        :return: Tuple of (list of queued Requests, dictionary mapping Request ID
+            to an error message for Requests that could not be queued)
+        """
+        queued = []
+        failures = {}
+        now = datetime.utcnow()
+
+        for request in requests:
+            try:
+                request.updated_at = now
+                request.validate()
+                self.outbox.add(
+                    request.id,
+                    statuses[str(request.id)],
+                    self._validated_fields(request),
+                )
+                queued.append(request)
+            except Exception as ex:
+                failures[str(request.id)] = str(ex)
+
+        return queued, failures
+
+    def _bulk_save_requests(self, requests, statuses):
+        """Persist validated Requests using a single bulk write
+
+        Only the fields that request validation is able to change are written,
+        and only to Requests that still have the status they were loaded with.
+        Requests whose status changed are left out of the saved Requests, but
+        aren't failures.
+
+        :param requests: The validated Requests
+        :param statuses: Dictionary mapping Request ID to the status the Request
+            was loaded with
+        :return: Tuple of (list of saved Requests, dictionary mapping Request ID to
+            an error message for Requests that could not be saved)
+        """
+        to_write = []
+        failures = {}
+        now = datetime.utcnow()
 
+        for request in requests:
             try:
-                self.clients["pika"].publish_request(
-                    request,
-                    confirm=True,
-                    mandatory=True,
-                    delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+                request.updated_at = now
+                request.validate()
+                to_write.append(request)
+            except (mongoengine.ValidationError, ModelValidationError) as ex:
+                failures[str(request.id)] = str(ex)
+
+        if not to_write:
+            return [], failures
+
+        operations = []
+        for request in to_write:
+            operations.append(
+                UpdateOne(
+                    {"_id": request.id, "status": statuses[str(request.id)]},
+                    {"$set": self._validated_fields(request)},
                 )
-            except Exception:
-                msg = "Error while publishing request to queue (%s[%s]-%s %s)" % (
+            )
+
+        try:
+            matched = (
+                Request._get_collection()
+                .bulk_write(operations, ordered=False)
+                .matched_count
+            )
+        except BulkWriteError as ex:
+            matched = ex.details.get("nMatched", 0)
+            for error in ex.details.get("writeErrors", []):
+                request = to_write[error["index"]]
+                failures[str(request.id)] = error.get("errmsg", "Unable to save")
+
+        saved = [r for r in to_write if str(r.id) not in failures]
+
+        # Some statuses changed since they were loaded, find out which
+        if matched < len(saved):
+            unchanged = self._unchanged(saved, statuses)
+            for request in saved:
+                if request.id not in unchanged:
+                    self.logger.info(
+                        "Request %s is no longer %s, not publishing it",
+                        request.id,
+                        statuses[str(request.id)],
+                    )
+
+            saved = [r for r in saved if r.id in unchanged]
+
+        return saved, failures
+
+    @staticmethod
+    def _unchanged(requests, statuses):
+        """IDs of the Requests that still have the status they were loaded with"""
+        return set(
+            document["_id"]
+            for document in Request._get_collection().find(
+                {
+                    "$or": [
+                        {"_id": request.id, "status": statuses[str(request.id)]}
+                        for request in requests
+                    ]
+                },
+                {"_id": True},
+            )
+        )
+
+    def _publish_requests(self, requests):
+        """Publish saved Requests over a single channel
+
+        :param requests: The saved Requests
+        :return: Tuple of (list of published Requests, dictionary mapping Request
+            ID to an error message for Requests that could not be published)
+        """
+        results = self.clients["pika"].publish_requests(
+            requests,
+            content_types=dict(
+                (str(request.id), self._content_type(request)) for request in requests
+            ),
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
+        )
+
+        published = []
+        failures = {}
+        for request in requests:
+            error = results.get(str(request.id))
+            if error is None:
+                published.append(request)
+                continue
+
+            self.logger.error("Error publishing request %s: %s", request.id, error)
+            failures[str(request.id)] = (
+                "Error while publishing request to queue (%s[%s]-%s %s)"
+                % (
                     request.system,
                     request.system_version,
                     request.instance_name,
                     request.command,
                 )
-                raise bg_utils.bg_thrift.PublishException(msg)
+            )
 
-        except (mongoengine.ValidationError, ModelValidationError, RestError) as ex:
-            self.logger.exception(ex)
-            raise bg_utils.bg_thrift.InvalidRequest(request_id, str(ex))
+        return published, failures
 
     def initializeInstance(self, instance_id):
         """Initializes an instance.
@@ -120,8 +555,14 @@ class BartenderHandler(object):
             "request": req_queue,
             "connection": connection,
             "url": self.clients["public"].connection_url,
+            "content_type": encoding.negotiate(
+                (instance.metadata or {}).get("content_types"),
+                bartender.config.amq.content_types,
+            ),
         }
         instance.save()
+        self.request_validator.catalog.invalidate(system.name, system.version)
+        self.request_validator.warm_choices(system.name, system.version)
 
         # Send a request to start to the plugin on the plugin's admin queue
         self.clients["pika"].start(
@@ -176,6 +617,7 @@ class BartenderHandler(object):
 
             self.logger.info("Reloading system: %s-%s", system.name, system.version)
             self.plugin_manager.reload_system(system.name, system.version)
+            self.request_validator.catalog.invalidate(system.name, system.version)
         except mongoengine.DoesNotExist:
             raise bg_utils.bg_thrift.InvalidSystem(
                 "", "Couldn't find system %s" % system_id
@@ -234,6 +676,7 @@ class BartenderHandler(object):
 
         # Finally, actually delete the system
         system.deep_delete()
+        self.request_validator.catalog.invalidate(system.name, system.version)
 
     def rescanSystemDirectory(self):
         """Scans plugin directory and starts any new Systems"""
@@ -326,3 +769,61 @@ class BartenderHandler(object):
             raise bg_utils.bg_thrift.InvalidSystem(
                 "", "Couldn't find system " "with instance %s" % instance.id
             )
+
+
+class ForwardingHandler(BartenderHandler):
+    """Handler for thrift server processes other than the main one
+
+    Calls listed in ``FORWARDED_METHODS`` are made against the main process
+    over the unix socket at ``ipc_socket``. Everything else is handled here.
+    """
+
+    def __init__(
+        self,
+        ipc_socket,
+        clients,
+        request_validator,
+        scheduler=None,
+        publish_filter=None,
+        outbox=None,
+    ):
+        super(ForwardingHandler, self).__init__(
+            registry=None,
+            clients=clients,
+            plugin_manager=None,
+            request_validator=request_validator,
+            scheduler=scheduler,
+            publish_filter=publish_filter,
+            outbox=outbox,
+        )
+        self.ipc_socket = ipc_socket
+
+    def _forward(self, method, *args):
+        # Plugin lifecycle calls can take a while, so don't time them out here.
+        # They're rare enough that a connection per call is fine.
+        transport = TCyBufferedTransport(
+            TSocket(unix_socket=self.ipc_socket, socket_timeout=None)
+        )
+        client = TClient(
+            bg_utils.bg_thrift.BartenderBackend, TCyBinaryProtocol(transport)
+        )
+
+        transport.open()
+        try:
+            self.logger.debug("Forwarding %s to the main process", method)
+            return getattr(client, method)(*args)
+        finally:
+            transport.close()
+
+
+def _forwarded(method):
+    def forward(self, *args):
+        return self._forward(method, *args)
+
+    forward.__name__ = method
+    forward.__doc__ = "Forwards %s to the main process" % method
+    return forward
+
+
+for _method in FORWARDED_METHODS:
+    setattr(ForwardingHandler, _method, _forwarded(_method))
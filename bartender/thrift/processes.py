@@ -0,0 +1,319 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from multiprocessing import Process
+from threading import Event, Lock
+
+import mongoengine.base
+import mongoengine.connection
+
+import bartender
+from bartender.connection_pool import HttpPool
+from bartender.errors import ConfigurationError
+from bartender.thrift.server import make_server
+from brewtils.rest.easy_client import EasyClient
+from brewtils.stoppable_thread import StoppableThread
+
+
+def default_ipc_socket():
+    """Per-process unix socket path for forwarding calls to the main process"""
+    return os.path.join(tempfile.gettempdir(), "bartender-thrift-%d.sock" % os.getpid())
+
+
+def _reset_inherited_connections():
+    """Set up the connections of a forked process
+
+    Connections inherited from the parent share its sockets, so using (or even
+    cleanly closing) them here would corrupt the parent's conversations. The
+    parent may not have registered its database connection before forking, so
+    it's registered again and mongoengine reconnects the next time it's used.
+    """
+    mongoengine.connection._connections.clear()
+    mongoengine.connection._dbs.clear()
+    for document in mongoengine.base._document_registry.values():
+        if getattr(document, "_collection", None) is not None:
+            document._collection = None
+
+    mongoengine.connection.register_connection(
+        "default", name=bartender.config.db.name, **bartender.config.db.connection
+    )
+
+    bartender.http_pool = HttpPool(**bartender.config.http)
+    bartender.bv_client = EasyClient(**bartender.config.web)
+    bartender.http_pool.mount(bartender.bv_client.client.session)
+
+
+class ThriftProcess(object):
+    """Thrift server run by a process forked from the ThriftSupervisor
+
+    ``make_handler`` is called in the process to build the handler, so nothing
+    it creates is shared with any other process. The server is stopped on
+    SIGTERM, or if the supervisor goes away.
+    """
+
+    # Seconds between checks that the supervisor is still around
+    POLL_INTERVAL = 1
+
+    def __init__(self, make_handler, server_kwargs, name, parent_pid):
+        self.make_handler = make_handler
+        self.server_kwargs = server_kwargs
+        self.name = name
+        self.parent_pid = parent_pid
+
+    def run(self):
+        stop = Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        # Ctrl-C reaches the whole process group, let the main process decide
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        _reset_inherited_connections()
+        handler = self.make_handler()
+
+        server = make_server(handler=handler, **self.server_kwargs)
+        server.display_name = "Thrift Server (%s)" % self.name
+        server.start()
+
+        while (
+            not stop.is_set() and server.is_alive() and os.getppid() == self.parent_pid
+        ):
+            stop.wait(self.POLL_INTERVAL)
+
+        server.stop()
+        server.join(server.WORKER_TIMEOUT + 1)
+
+        handler.request_validator.shutdown()
+        handler.clients["pika"].close()
+
+
+class ThriftSupervisor(Process):
+    """Process that forks the thrift server processes, and replaces any that die
+
+    Forking a process that runs other threads can leave the child holding a
+    lock (logging's, pika's or pymongo's) that one of those threads held at the
+    time, and it deadlocks the first time it needs it. So the supervisor should
+    be started before the main process starts any threads. It never starts any
+    itself, so every server process it forks, including replacements, starts
+    from a single threaded process.
+
+    Args:
+        processes: Number of thrift server processes
+        make_handler: Called with the unix socket path in each server process to
+            build its handler
+        ipc_socket: Path of the unix socket calls that need the main process are
+            forwarded to (defaults to one in the temp directory)
+        server_kwargs: Passed to ``make_server`` in each server process
+    """
+
+    # Seconds between checks that every server process is alive
+    POLL_INTERVAL = 1
+
+    # Seconds a server process may take to shut down after being asked to
+    PROCESS_TIMEOUT = 10
+
+    def __init__(self, processes, make_handler, ipc_socket=None, **kwargs):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise ConfigurationError(
+                "Serving thrift from more than one process requires SO_REUSEPORT, "
+                "which this platform does not support"
+            )
+
+        super(ThriftSupervisor, self).__init__(name="ThriftSupervisor")
+        self.daemon = True
+
+        self.logger = logging.getLogger(__name__)
+        self.processes = processes
+        self.make_handler = make_handler
+        self.ipc_socket = ipc_socket or default_ipc_socket()
+        self.server_kwargs = kwargs
+        self.parent_pid = os.getpid()
+
+        self._begun = multiprocessing.Event()
+        self._stopping = False
+
+    def begin(self):
+        """Let the supervisor start the server processes"""
+        self._begun.set()
+
+    def replacement(self):
+        """A new, unstarted, supervisor with the same arguments"""
+        return ThriftSupervisor(
+            self.processes, self.make_handler, self.ipc_socket, **self.server_kwargs
+        )
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        pids = [None] * self.processes
+
+        while not self._stopping and os.getppid() == self.parent_pid:
+            if self._begun.is_set():
+                for index, pid in enumerate(pids):
+                    if pid is not None:
+                        exited, status = os.waitpid(pid, os.WNOHANG)
+                        if not exited:
+                            continue
+
+                        self.logger.warning(
+                            "ThriftProcess-%d exited with status %s, restarting",
+                            index,
+                            status,
+                        )
+
+                    pids[index] = self._fork(index)
+
+            time.sleep(self.POLL_INTERVAL)
+
+        self._stop_processes([pid for pid in pids if pid is not None])
+
+    def _on_sigterm(self, signum, frame):
+        self._stopping = True
+
+    def _fork(self, index):
+        name = "ThriftProcess-%d" % index
+        parent_pid = os.getpid()
+
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                ThriftProcess(
+                    lambda: self.make_handler(self.ipc_socket),
+                    self.server_kwargs,
+                    name,
+                    parent_pid,
+                ).run()
+            except BaseException:
+                self.logger.exception("%s failed", name)
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.logger.debug("Started %s (pid %s)", name, pid)
+        return pid
+
+    def _stop_processes(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        deadline = time.time() + self.PROCESS_TIMEOUT
+        for pid in pids:
+            while True:
+                try:
+                    exited, _ = os.waitpid(pid, os.WNOHANG)
+                except OSError:
+                    break
+
+                if exited:
+                    break
+
+                if time.time() > deadline:
+                    self.logger.warning("Killing pid %s, it did not stop", pid)
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+
+                time.sleep(0.1)
+
+
+class ThriftProcessPool(StoppableThread):
+    """Serves thrift from several processes to make use of more than one core
+
+    The processes are forked by ``supervisor``. Each binds the same host and port
+    with SO_REUSEPORT, so the kernel spreads incoming connections between them.
+    Calls that need the main process (see ``FORWARDED_METHODS``) are forwarded
+    to a server this thread runs on the supervisor's unix socket, using
+    ``handler``.
+
+    Args:
+        supervisor: The ThriftSupervisor, ideally started before any threads were
+        handler: Handler for calls forwarded to the main process
+    """
+
+    # Seconds between checks that the supervisor is alive
+    POLL_INTERVAL = 1
+
+    def __init__(self, supervisor, handler):
+        self.logger = logging.getLogger(__name__)
+        self.display_name = "Thrift Processes"
+        self.supervisor = supervisor
+        self.ipc_socket = supervisor.ipc_socket
+        self.server_kwargs = supervisor.server_kwargs
+
+        self._handler = handler
+        self._ipc_server = None
+        self._lock = Lock()
+
+        super(ThriftProcessPool, self).__init__(logger=self.logger, name="ThriftPool")
+
+    def run(self):
+        self.logger.info(self.display_name + " is started")
+
+        while not self.stopped():
+            with self._lock:
+                if self.stopped():
+                    break
+
+                if self._ipc_server is None or not self._ipc_server.is_alive():
+                    self._start_ipc_server()
+
+                if self.supervisor.pid is None:
+                    self.logger.warning(
+                        "Thrift supervisor was not started before other threads, "
+                        "starting it now"
+                    )
+                    self.supervisor.start()
+                elif not self.supervisor.is_alive():
+                    # Forking from here is only a last resort, the supervisor
+                    # should only die if it's killed
+                    self.logger.error(
+                        "Thrift supervisor exited with code %s, restarting",
+                        self.supervisor.exitcode,
+                    )
+                    self.supervisor = self.supervisor.replacement()
+                    self.supervisor.start()
+
+                self.supervisor.begin()
+
+            self.wait(self.POLL_INTERVAL)
+
+        self.logger.info(self.display_name + " is stopped")
+
+    def stop(self):
+        with self._lock:
+            StoppableThread.stop(self)
+
+        if self.supervisor.is_alive():
+            self.supervisor.terminate()
+            self.supervisor.join(self.supervisor.PROCESS_TIMEOUT + 1)
+            if self.supervisor.is_alive():
+                self.logger.warning("Thrift supervisor did not stop successfully")
+
+        if self._ipc_server is not None:
+            self._ipc_server.stop()
+            self._ipc_server.join(self._ipc_server.WORKER_TIMEOUT + 1)
+
+        try:
+            os.unlink(self.ipc_socket)
+        except OSError:
+            pass
+
+    def _start_ipc_server(self):
+        self._ipc_server = make_server(
+            self.server_kwargs["service"],
+            self._handler,
+            unix_socket=self.ipc_socket,
+            pools=self.server_kwargs.get("pools"),
+            method_pools=self.server_kwargs.get("method_pools"),
+        )
+        self._ipc_server.display_name = "Thrift Server (local forwarding)"
+        self._ipc_server.daemon = True
+        self._ipc_server.start()
@@ -1,28 +1,187 @@
+import errno
 import logging
+import os
+import socket
+import ssl
+import time
 from concurrent.futures import wait, ThreadPoolExecutor, ALL_COMPLETED
+from functools import partial
 from threading import Event
 
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors
+
+from six.moves import queue
+from thriftpy2.protocol import TCompactProtocolFactory, TCyBinaryProtocolFactory
 from thriftpy2.server import TThreadedServer
-from thriftpy2.thrift import TProcessor
-from thriftpy2.transport import TServerSocket, TSSLServerSocket
+from thriftpy2.thrift import TApplicationException, TProcessor, TType
+from thriftpy2.transport import (
+    TCyBufferedTransportFactory,
+    TCyFramedTransportFactory,
+    TServerSocket,
+    TSocket,
+    TSSLServerSocket,
+    TTransportException,
+)
 
 import bg_utils
 from brewtils.stoppable_thread import StoppableThread
 import bartender
+from bartender.elastic_pool import ElasticThreadPool
+from bartender.thrift.admission import AdmissionQueue, server_busy
+
+# Wire formats the server can speak. Thrift has no negotiation, so clients
+# (brew-view's thrift.transport / thrift.protocol) must be configured to match.
+TRANSPORTS = {
+    "buffered": TCyBufferedTransportFactory,
+    "framed": TCyFramedTransportFactory,
+}
+PROTOCOLS = {"binary": TCyBinaryProtocolFactory, "compact": TCompactProtocolFactory}
+
+
+class _Connection(object):
+    """A client connection parked in the selector between calls"""
+
+    __slots__ = ("client", "itrans", "otrans", "iprot", "oprot", "last_active")
+
+    def __init__(self, server, client):
+        self.client = client
+        self.itrans = server.itrans_factory.get_transport(client)
+        self.otrans = server.otrans_factory.get_transport(client)
+        self.iprot = server.iprot_factory.get_protocol(self.itrans)
+        self.oprot = server.oprot_factory.get_protocol(self.otrans)
+        self.last_active = time.time()
+
+    @property
+    def sock(self):
+        return self.client.sock
+
+    def pending(self):
+        """Whether the socket already holds data the selector cannot see
+
+        SSL sockets decrypt whole records, so a complete call can be sitting
+        in the SSL buffer while the underlying socket is not readable.
+        """
+        pending = getattr(self.client.sock, "pending", None)
+        return bool(pending and pending())
+
+    def close(self):
+        self.itrans.close()
+        self.otrans.close()
+
+
+class _Handshake(object):
+    """A TLS handshake being driven by the selector"""
+
+    __slots__ = ("sock", "deadline")
+
+    def __init__(self, sock, deadline):
+        self.sock = sock
+        self.deadline = deadline
+
+    def close(self):
+        try:
+            self.sock.close()
+        except (socket.error, OSError):
+            pass
+
+
+class _UnixServerSocket(TServerSocket):
+    """Server socket listening on a unix socket
+
+    TServerSocket tries to set SO_REUSEPORT on unix sockets too, which fails.
+    """
+
+    def __init__(self, unix_socket, **kwargs):
+        super(_UnixServerSocket, self).__init__(unix_socket=unix_socket, **kwargs)
+
+    def _init_sock(self):
+        # Remove the socket file left behind by a server that's no longer running
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.unix_socket)
+        except (socket.error, OSError) as ex:
+            if ex.errno == errno.ECONNREFUSED:
+                os.unlink(self.unix_socket)
+        finally:
+            probe.close()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
 
 class BartenderThriftServer(TThreadedServer, StoppableThread):
-    """Thrift server that uses a ThreadPoolExecutor to process requests"""
+    """Thrift server that multiplexes client connections over a selector
+
+    Idle connections are parked in a selector owned by the serving thread.
+    A worker from the ElasticThreadPool is only dispatched once a
+    connection becomes readable, processes that call and hands the
+    connection back to the selector. This means the number of open
+    connections is no longer bounded by the number of workers.
+
+    Calls waiting for a worker are bounded by an ``AdmissionQueue``. Calls
+    that do not fit, or that wait too long for a worker, are answered with a
+    ``SERVER_BUSY`` application exception instead of being processed.
+
+    The worker that reads a call runs it directly unless ``method_pools``
+    assigns the method to one of the named ``pools``. In that case the call
+    is handed to that pool, so slow administrative calls never tie up the
+    workers serving the hot path.
+
+    With a TLS server socket only the TCP accept happens on the serving
+    thread's critical path. Handshakes are driven without blocking by the
+    selector and abandoned after ``handshake_timeout`` seconds, so a slow
+    client can't hold up other connections.
+    """
 
     # Amount of time (in seconds) after shutdown requested to wait for workers to finish processing
     WORKER_TIMEOUT = 5
 
+    # Maximum amount of time (in seconds) to block in the selector
+    SELECT_TIMEOUT = 1
+
+    # Maximum amount of time (in seconds) the selector thread will spend
+    # reading a call it is refusing
+    REJECT_TIMEOUT = 1
+
     def __init__(self, *args, **kwargs):
         self.logger = logging.getLogger(__name__)
         self.display_name = "Thrift Server"
-        self.pool = ThreadPoolExecutor(max_workers=bartender.config.thrift.max_workers)
+        self.pool = ElasticThreadPool(
+            min_workers=bartender.config.thrift.min_workers,
+            max_workers=bartender.config.thrift.max_workers,
+            keep_alive=bartender.config.thrift.keep_alive,
+            grow_wait=bartender.config.thrift.grow_wait,
+            name="ThriftWorker",
+        )
         self.futures = set()
         self.finished = Event()
+        self.idle_timeout = kwargs.pop("idle_timeout", None)
+        self.tcp_nodelay = kwargs.pop("tcp_nodelay", False)
+        self.handshake_timeout = kwargs.pop("handshake_timeout", 10)
+        self.tls_stats = {"handshakes": 0, "resumed": 0, "failed": 0, "timed_out": 0}
+        self.admission = AdmissionQueue(
+            max_depth=kwargs.pop("queue_depth", 0), max_wait=kwargs.pop("max_wait", 0)
+        )
+        self.stats_interval = kwargs.pop("stats_interval", 0)
+        self._stats_logged = time.time()
+
+        self.class_pools = {
+            name: ThreadPoolExecutor(max_workers=max_workers)
+            for name, max_workers in (kwargs.pop("pools", None) or {}).items()
+        }
+        self.method_pools = {
+            method: self.class_pools[name]
+            for method, name in (kwargs.pop("method_pools", None) or {}).items()
+            if name in self.class_pools
+        }
+
+        self.selector = None
+        self._returned = queue.Queue()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
 
         StoppableThread.__init__(
             self, logger=self.logger, name=kwargs.pop("name", "ThriftPyServer")
@@ -36,18 +195,40 @@ class BartenderThriftServer(TThreadedServer, StoppableThread):
         # We could still be waiting on worker threads to finish -
         # we need another event to tell when REALLY stopped
         self.finished.wait(timeout=self.WORKER_TIMEOUT + 1)
+
+        # Shut the pools down only once serve() can no longer dispatch to them
+        for pool in [self.pool] + list(self.class_pools.values()):
+            pool.shutdown(wait=False)
+
+        self.log_stats()
         self.logger.info(self.display_name + " is stopped")
 
+    def log_stats(self):
+        """Log admission queue, worker pool and TLS stats"""
+        self._stats_logged = time.time()
+
+        self.admission.log_stats(self.display_name)
+        self.pool.log_stats()
+        if isinstance(self.trans, TSSLServerSocket):
+            self.logger.info(
+                "%s TLS stats: %s, session cache: %s",
+                self.display_name,
+                self.tls_stats,
+                self.trans.ssl_context.session_stats(),
+            )
+
     def stop(self):
         # Mark the thread as stopping
         StoppableThread.stop(self)
 
-        # Close the socket - this will kick us out of the self.trans.accept() call with an exception
+        # Close the listening socket and kick the selector out of select()
         self.trans.close()
+        self._wake()
 
         # Wait some amount of time for all the futures to complete
+        # (on a copy, since finishing workers remove themselves from the set)
         futures_status = wait(
-            self.futures, timeout=self.WORKER_TIMEOUT, return_when=ALL_COMPLETED
+            set(self.futures), timeout=self.WORKER_TIMEOUT, return_when=ALL_COMPLETED
         )
 
         # If there are still workers remaining after the timeout then we remove references to them.
@@ -62,7 +243,8 @@ class BartenderThriftServer(TThreadedServer, StoppableThread):
 
             import concurrent.futures.thread
 
-            self.pool._threads.clear()
+            for pool in [self.pool] + list(self.class_pools.values()):
+                pool._threads.clear()
             concurrent.futures.thread._threads_queues.clear()
 
         # Let run() know that we've made our attempt to wait
@@ -72,18 +254,257 @@ class BartenderThriftServer(TThreadedServer, StoppableThread):
     def serve(self):
         self.trans.listen()
 
-        while not self.stopped():
-            try:
-                trans_input = self.trans.accept()
-
-                future = self.pool.submit(self.handle, trans_input)
-                self.futures.add(future)
-                future.add_done_callback(lambda x: self.futures.remove(x))
-            except OSError as ex:
-                if not self.stopped() or ex.errno != 22:
-                    self.logger.exception(ex)
-            except Exception as ex:
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.trans.sock, selectors.EVENT_READ, self._accept)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self._requeue)
+
+        try:
+            while not self.stopped():
+                try:
+                    events = self.selector.select(timeout=self.SELECT_TIMEOUT)
+                except (OSError, ValueError) as ex:
+                    if not self.stopped():
+                        self.logger.exception(ex)
+                    break
+
+                for key, _ in events:
+                    if isinstance(key.data, _Connection):
+                        self._dispatch(key.data)
+                    elif isinstance(key.data, _Handshake):
+                        self._continue_handshake(key.data)
+                    else:
+                        key.data()
+
+                self._close_idle()
+                self._expire_handshakes()
+
+                if (
+                    self.stats_interval
+                    and time.time() - self._stats_logged >= self.stats_interval
+                ):
+                    self.log_stats()
+        finally:
+            self._close_all()
+
+    def _accept(self):
+        try:
+            if isinstance(self.trans, TSSLServerSocket):
+                self._start_handshake(self._tune(self.trans.sock.accept()[0]))
+            else:
+                client = self.trans.accept()
+                self._tune(client.sock)
+                self._park(_Connection(self, client))
+        except OSError as ex:
+            if not self.stopped() or ex.errno not in (9, 22):
                 self.logger.exception(ex)
+        except Exception as ex:
+            self.logger.exception(ex)
+
+    def _tune(self, sock):
+        """Apply per-connection socket options to an accepted socket"""
+        if self.tcp_nodelay and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _start_handshake(self, raw_sock):
+        try:
+            sock = self.trans.ssl_context.wrap_socket(
+                raw_sock, server_side=True, do_handshake_on_connect=False
+            )
+            sock.setblocking(False)
+        except Exception:
+            raw_sock.close()
+            raise
+
+        handshake = _Handshake(sock, time.time() + self.handshake_timeout)
+        self.selector.register(sock, selectors.EVENT_READ, handshake)
+
+    def _continue_handshake(self, handshake):
+        """Advance a handshake as far as it can go without blocking"""
+        sock = handshake.sock
+        try:
+            sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self.selector.modify(sock, selectors.EVENT_READ, handshake)
+            return
+        except ssl.SSLWantWriteError:
+            self.selector.modify(sock, selectors.EVENT_WRITE, handshake)
+            return
+        except (ssl.SSLError, socket.error, OSError) as ex:
+            self.logger.debug("TLS handshake failed: %s", ex)
+            self.tls_stats["failed"] += 1
+            self.selector.unregister(sock)
+            handshake.close()
+            return
+
+        self.selector.unregister(sock)
+        self.tls_stats["handshakes"] += 1
+        if getattr(sock, "session_reused", False):
+            self.tls_stats["resumed"] += 1
+
+        sock.setblocking(True)
+        if self.trans.client_timeout:
+            sock.settimeout(self.trans.client_timeout)
+        self._park(_Connection(self, TSocket(sock=sock)))
+
+    def _dispatch(self, connection):
+        if not self.admission.try_enter():
+            self._reject_inline(connection)
+            return
+
+        self.selector.unregister(connection.sock)
+        self._submit(self.pool, self._process, connection, time.time())
+
+    def _submit(self, pool, fn, *args):
+        future = pool.submit(fn, *args)
+        self.futures.add(future)
+        future.add_done_callback(lambda x: self.futures.discard(x))
+
+    def _reject_inline(self, connection):
+        """Refuse a call from the selector thread, keeping the read bounded"""
+        sock = connection.sock
+        timeout = sock.gettimeout()
+        try:
+            sock.settimeout(self.REJECT_TIMEOUT)
+            self._reject(connection, "queue full")
+            sock.settimeout(timeout)
+        except Exception as ex:
+            if not isinstance(ex, (TTransportException, socket.error)):
+                self.logger.exception(ex)
+            self.selector.unregister(sock)
+            connection.close()
+
+    def _reject(self, connection, reason):
+        """Consume the next call on a connection and answer it as busy
+
+        Like other steps run by ``_run`` this returns False, meaning the
+        connection was not handed off.
+        """
+        api, _, seqid = connection.iprot.read_message_begin()
+        connection.iprot.skip(TType.STRUCT)
+        connection.iprot.read_message_end()
+
+        self.logger.debug("Refusing thrift call %s: %s", api, reason)
+        self.processor.send_exception(connection.oprot, api, server_busy(reason), seqid)
+        return False
+
+    def _process(self, connection, enqueued_at):
+        """Worker entry point for a connection the selector found readable"""
+        if self.admission.start(enqueued_at):
+            self._run(connection, partial(self._handle_call, connection))
+        else:
+            self._run(
+                connection, partial(self._reject, connection, "wait deadline exceeded")
+            )
+
+    def _run(self, connection, step):
+        """Run a step on a connection, then any calls already buffered behind it
+
+        Steps return True if they handed the connection off to another pool,
+        in which case that pool is responsible for giving it back.
+        """
+        try:
+            handed_off = step()
+            while not handed_off and connection.pending():
+                handed_off = self._handle_call(connection)
+        except TTransportException:
+            connection.close()
+            return
+        except (ssl.SSLError, socket.error) as ex:
+            # Clients commonly drop TLS connections without a close_notify
+            self.logger.debug("Thrift connection lost: %s", ex)
+            connection.close()
+            return
+        except Exception as ex:
+            self.logger.exception(ex)
+            connection.close()
+            return
+
+        if not handed_off:
+            self._return(connection)
+
+    def _handle_call(self, connection):
+        """Read a call and run it here or on the pool its method belongs to"""
+        api, seqid, result, call = self.processor.process_in(connection.iprot)
+
+        pool = self.method_pools.get(api)
+        if pool is None:
+            return self._respond(connection, api, seqid, result, call)
+
+        respond = partial(self._respond, connection, api, seqid, result, call)
+        self._submit(pool, self._run, connection, respond)
+        return True
+
+    def _respond(self, connection, api, seqid, result, call):
+        self.processor.process_out(connection.oprot, api, seqid, result, call)
+        return False
+
+    def _return(self, connection):
+        connection.last_active = time.time()
+        self._returned.put(connection)
+        self._wake()
+
+    def _requeue(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (socket.error, OSError):
+            pass
+
+        while True:
+            try:
+                connection = self._returned.get_nowait()
+            except queue.Empty:
+                break
+
+            if self.stopped():
+                connection.close()
+            else:
+                self._park(connection)
+
+    def _park(self, connection):
+        try:
+            self.selector.register(connection.sock, selectors.EVENT_READ, connection)
+        except (KeyError, ValueError, OSError):
+            connection.close()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (socket.error, OSError):
+            # Either the buffer is full (and a wakeup is pending) or we're closed
+            pass
+
+    def _close_idle(self):
+        if not self.idle_timeout:
+            return
+
+        cutoff = time.time() - self.idle_timeout
+        for key in list(self.selector.get_map().values()):
+            connection = key.data
+            if isinstance(connection, _Connection) and connection.last_active < cutoff:
+                self.logger.debug("Closing idle thrift connection")
+                self.selector.unregister(key.fileobj)
+                connection.close()
+
+    def _expire_handshakes(self):
+        now = time.time()
+        for key in list(self.selector.get_map().values()):
+            handshake = key.data
+            if isinstance(handshake, _Handshake) and handshake.deadline < now:
+                self.logger.debug("Abandoning slow TLS handshake")
+                self.tls_stats["timed_out"] += 1
+                self.selector.unregister(key.fileobj)
+                handshake.close()
+
+    def _close_all(self):
+        for key in list(self.selector.get_map().values()):
+            if isinstance(key.data, (_Connection, _Handshake)):
+                key.data.close()
+
+        self.selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
 
 
 class WrappedTProcessor(TProcessor):
@@ -95,6 +516,24 @@ class WrappedTProcessor(TProcessor):
         self.default_exception_cls = default_exception_cls
         self.logger = logging.getLogger(__name__)
 
+    def process(self, iprot, oprot):
+        self.process_out(oprot, *self.process_in(iprot))
+
+    def process_out(self, oprot, api, seqid, result, call):
+        """Run a call read by ``process_in`` and write its response"""
+        if isinstance(result, TApplicationException):
+            return self.send_exception(oprot, api, result, seqid)
+
+        try:
+            result.success = call()
+        except Exception as e:
+            # raise if api don't have throws
+            if not self.handle_exception(e, result):
+                raise
+
+        if not result.oneway:
+            self.send_result(oprot, api, result, seqid)
+
     def handle_exception(self, e, result):
         try:
             return super(WrappedTProcessor, self).handle_exception(e, result)
@@ -112,20 +551,92 @@ class WrappedTProcessor(TProcessor):
 
 
 def make_server(
-    service, handler, host="127.0.0.1", port=9090, client_timeout=None, cert_file=None
+    service,
+    handler,
+    host="127.0.0.1",
+    port=9090,
+    unix_socket=None,
+    backlog=128,
+    tcp_nodelay=True,
+    client_timeout=10000,
+    idle_timeout=None,
+    queue_depth=0,
+    max_wait=0,
+    pools=None,
+    method_pools=None,
+    cert_file=None,
+    handshake_timeout=10,
+    session_tickets=True,
+    transport="buffered",
+    protocol="binary",
+    stats_interval=0,
 ):
-    """Factory method to create a BartenderThriftServer"""
+    """Factory method to create a BartenderThriftServer
 
-    if cert_file:
+    The server listens on ``host`` and ``port``, or on ``unix_socket`` if one
+    is given. Listening sockets set SO_REUSEPORT where the platform supports
+    it, so several processes can serve the same port. ``backlog`` bounds the
+    connections waiting to be accepted and ``tcp_nodelay`` disables Nagle's
+    algorithm on accepted TCP connections.
+
+    ``client_timeout`` (milliseconds) bounds each socket read while a call is
+    being processed. A connection is handed to a worker as soon as it becomes
+    readable, so this is also how long a client that stalls partway through a
+    call can hold that worker before it is disconnected (None to wait forever).
+    ``idle_timeout`` (seconds) closes connections that have not made a call in
+    that long. ``queue_depth`` and ``max_wait`` bound how many calls may wait
+    for a worker and for how long (0 for no limit).
+    ``pools`` maps extra pool names to their worker counts and
+    ``method_pools`` maps handler method names to the pool they run on.
+
+    Giving a ``cert_file`` enables TLS. Handshakes taking longer than
+    ``handshake_timeout`` seconds are abandoned. ``session_tickets`` lets
+    reconnecting clients resume their TLS session instead of doing a full
+    handshake.
+
+    ``transport`` ("buffered" or "framed") and ``protocol`` ("binary" or
+    "compact") select the wire format. Clients must use the same ones.
+
+    Admission queue, worker pool and TLS stats are logged every
+    ``stats_interval`` seconds (0 to only log them at shutdown).
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError("Unknown thrift transport '%s'" % transport)
+    if protocol not in PROTOCOLS:
+        raise ValueError("Unknown thrift protocol '%s'" % protocol)
+
+    if unix_socket:
+        server_socket = _UnixServerSocket(
+            unix_socket, client_timeout=client_timeout, backlog=backlog
+        )
+    elif cert_file:
         server_socket = TSSLServerSocket(
-            host=host, port=port, client_timeout=client_timeout, certfile=cert_file
+            host=host,
+            port=port,
+            client_timeout=client_timeout,
+            backlog=backlog,
+            certfile=cert_file,
         )
+        if session_tickets:
+            server_socket.ssl_context.options &= ~ssl.OP_NO_TICKET
+        else:
+            server_socket.ssl_context.options |= ssl.OP_NO_TICKET
     else:
         server_socket = TServerSocket(
-            host=host, port=port, client_timeout=client_timeout
+            host=host, port=port, client_timeout=client_timeout, backlog=backlog
         )
 
     return BartenderThriftServer(
         WrappedTProcessor("baseEx", bg_utils.bg_thrift.BaseException, service, handler),
         server_socket,
+        itrans_factory=TRANSPORTS[transport](),
+        iprot_factory=PROTOCOLS[protocol](),
+        idle_timeout=idle_timeout,
+        tcp_nodelay=tcp_nodelay,
+        queue_depth=queue_depth,
+        max_wait=max_wait,
+        pools=pools,
+        method_pools=method_pools,
+        handshake_timeout=handshake_timeout,
+        stats_interval=stats_interval,
     )
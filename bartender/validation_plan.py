@@ -0,0 +1,158 @@
+import hashlib
+import json
+import re
+
+import six
+from builtins import str
+
+from brewtils.errors import ModelValidationError
+
+
+def _coerce_string(value):
+    if isinstance(value, six.string_types):
+        return str(value)
+    raise TypeError("Invalid value for string (%s)" % value)
+
+
+def _coerce_integer(value):
+    if int(value) != float(value):
+        raise TypeError("Invalid value for integer (%s)" % value)
+    return int(value)
+
+
+def _coerce_boolean(value):
+    if value in [True, False]:
+        return value
+    raise TypeError("Invalid value for boolean (%s)" % value)
+
+
+def _coerce_any(value):
+    return value
+
+
+COERCERS = {
+    "STRING": _coerce_string,
+    "INTEGER": _coerce_integer,
+    "FLOAT": float,
+    "ANY": _coerce_any,
+    "BOOLEAN": _coerce_boolean,
+    "DICTIONARY": dict,
+    "DATE": int,
+    "DATETIME": int,
+}
+
+
+def collapse_choices(raw_allowed):
+    """Reduce a list of choices to the values they allow
+
+    Choices may be plain values or {"value": "", "text": ""} dictionaries.
+
+    :param raw_allowed: The list of choices
+    :return: Tuple of (list of allowed values, frozenset of allowed values or None
+        if any of them are unhashable)
+    """
+    allowed_values = [
+        allowed["value"] if isinstance(allowed, dict) else allowed
+        for allowed in raw_allowed
+    ]
+
+    try:
+        allowed_set = frozenset(allowed_values)
+    except TypeError:
+        allowed_set = None
+
+    return allowed_values, allowed_set
+
+
+class ParameterPlan(object):
+    """Everything needed to validate one parameter, computed ahead of time
+
+    Attribute names mirror those of a Parameter so the plan can be used anywhere
+    a Parameter is expected. The differences are that ``regex`` is a compiled
+    pattern, ``coerce`` is the bound type conversion function (None if the type
+    is unknown) and ``sub_plan`` is the plan for nested dictionary parameters.
+    ``allowed`` is the result of ``collapse_choices`` for static list choices.
+    """
+
+    __slots__ = (
+        "key",
+        "type",
+        "multi",
+        "optional",
+        "default",
+        "nullable",
+        "choices",
+        "maximum",
+        "minimum",
+        "regex",
+        "coerce",
+        "sub_plan",
+        "allowed",
+    )
+
+    def __init__(self, parameter):
+        self.key = parameter.key
+        self.type = parameter.type
+        self.multi = parameter.multi
+        self.optional = parameter.optional
+        self.default = parameter.default
+        self.nullable = parameter.nullable
+        self.choices = parameter.choices
+        self.maximum = parameter.maximum
+        self.minimum = parameter.minimum
+        self.regex = None
+        self.sub_plan = None
+        self.allowed = None
+
+        try:
+            type_name = parameter.type.upper()
+        except AttributeError:
+            type_name = None
+        self.coerce = COERCERS.get(type_name)
+
+        # Regexes are only ever checked for required parameters
+        if not parameter.optional and isinstance(parameter.regex, six.string_types):
+            try:
+                self.regex = re.compile(parameter.regex)
+            except re.error as ex:
+                raise ModelValidationError(
+                    "Invalid regular expression %s for parameter %s: %s"
+                    % (parameter.regex, parameter.key, ex)
+                )
+
+        if type_name == "DICTIONARY" and parameter.parameters:
+            self.sub_plan = ValidationPlan(parameter.parameters)
+
+        choices = parameter.choices
+        if choices and choices.type == "static" and isinstance(choices.value, list):
+            self.allowed = collapse_choices(choices.value)
+
+    def __repr__(self):
+        return "<ParameterPlan: key=%s, type=%s>" % (self.key, self.type)
+
+
+class ValidationPlan(object):
+    """Compiled form of a list of command parameters
+
+    :param parameters: The command parameters to compile
+    """
+
+    __slots__ = ("parameters", "valid_keys", "valid_key_set")
+
+    def __init__(self, parameters):
+        self.parameters = tuple(ParameterPlan(p) for p in parameters)
+        self.valid_keys = [p.key for p in self.parameters]
+        self.valid_key_set = frozenset(self.valid_keys)
+
+    def __repr__(self):
+        return "<ValidationPlan: keys=%s>" % self.valid_keys
+
+
+def fingerprint(parameters):
+    """Compute a stable fingerprint for a parameter definition
+
+    :param parameters: Parameters in their catalog (namedtuple) form
+    :return: Hex digest identifying the definition
+    """
+    serialized = json.dumps(parameters, sort_keys=True, default=repr)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
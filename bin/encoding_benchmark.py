@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Compare the cost of encoding Requests as JSON and as msgpack
+
+Encodes a mix of Request messages (small parameters, long strings, nested
+dictionaries and numeric lists) with each content type bartender can publish
+in and reports the CPU time and size per message. Only encoding is measured;
+decoding happens in the plugins.
+
+Usage: bin/encoding_benchmark.py [--requests 20000]
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import sys
+import time
+from os import path
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    process_time = time.clock
+
+
+def build_message(parameters):
+    return {
+        "id": "5d1b6bab89b9e12d2b3f8e30",
+        "system": "echo",
+        "system_version": "1.0.0",
+        "instance_name": "default",
+        "command": "say",
+        "parameters": parameters,
+        "comment": "benchmark",
+        "output": None,
+        "output_type": "STRING",
+        "status": "CREATED",
+        "command_type": "ACTION",
+        "created_at": 1562068800123,
+        "updated_at": 1562068800123,
+        "error_class": None,
+        "metadata": {},
+        "has_parent": False,
+        "requester": "benchmark",
+        "parent": None,
+        "children": None,
+    }
+
+
+def build_messages():
+    return {
+        "small": build_message({"message": "Hello, World!", "loud": True}),
+        "strings": build_message({"text": "x" * 64 * 1024, "name": u"h\xe9llo"}),
+        "nested": build_message(
+            {
+                "config": {
+                    "level_%d" % i: {"key_%d" % j: j for j in range(10)}
+                    for i in range(20)
+                }
+            }
+        ),
+        "numbers": build_message(
+            {"ints": list(range(5000)), "floats": [i / 7 for i in range(5000)]}
+        ),
+    }
+
+
+def measure(message, content_type, count):
+    from bartender import encoding
+
+    for _ in range(100):
+        encoding.dumps(message, content_type)
+
+    start = process_time()
+    for _ in range(count):
+        body = encoding.dumps(message, content_type)
+    return (process_time() - start) / count, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Make the bartender package importable when run from a checkout
+    sys.path.append(path.abspath(path.join(path.abspath(__file__), "..", "..")))
+
+    from bartender import encoding
+
+    if encoding.MSGPACK not in encoding.supported():
+        print("msgpack is not installed")
+        return 1
+
+    print("%d requests per message and content type" % args.requests)
+    print(
+        "%-8s %12s %12s %10s %10s"
+        % ("message", "json us", "msgpack us", "json B", "msgpack B")
+    )
+    for name, message in sorted(build_messages().items()):
+        json_time, json_size = measure(message, encoding.JSON, args.requests)
+        msgpack_time, msgpack_size = measure(message, encoding.MSGPACK, args.requests)
+        print(
+            "%-8s %12.1f %12.1f %10d %10d"
+            % (name, json_time * 1e6, msgpack_time * 1e6, json_size, msgpack_size)
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""Compare processRequest's CPU cost with and without the Request model
+
+Runs what processRequest does with a Request document once it's been read from
+Mongo (decode, validate, build the update, serialize the message) both through
+the mongoengine model and through RawRequest, and reports the CPU time per
+Request for each. Mongo and RabbitMQ are not involved, so only the in-process
+work is measured.
+
+Usage: bin/request_benchmark.py [--requests 20000] [--parameters 5]
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import datetime
+import sys
+import time
+from os import path
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    process_time = time.clock
+
+
+def build_system(parameter_count):
+    from bg_utils.mongo.models import Command, Instance, Parameter, System
+
+    parameters = [
+        Parameter(key="message", type="String", optional=False),
+        Parameter(key="loud", type="Boolean", optional=True, default=False),
+        Parameter(key="times", type="Integer", multi=True, optional=True),
+    ]
+    for index in range(max(parameter_count - len(parameters), 0)):
+        parameters.append(
+            Parameter(key="extra_%d" % index, type="String", optional=True)
+        )
+
+    return System(
+        name="echo",
+        version="1.0.0",
+        instances=[Instance(name="default")],
+        commands=[
+            Command(
+                name="say",
+                command_type="ACTION",
+                output_type="STRING",
+                parameters=parameters[:parameter_count],
+            )
+        ],
+    )
+
+
+def build_document(parameter_count):
+    from bson import ObjectId
+
+    parameters = [("message", "Hello, World!"), ("loud", True), ("times", [1, 2, 3])]
+    for index in range(max(parameter_count - len(parameters), 0)):
+        parameters.append(("extra_%d" % index, "value %d" % index))
+
+    return {
+        "_id": ObjectId("5d1b6bab89b9e12d2b3f8e30"),
+        "system": "echo",
+        "system_version": "1.0.0",
+        "instance_name": "default",
+        "command": "say",
+        "parameters": dict(parameters[:parameter_count]),
+        "comment": "benchmark",
+        "metadata": {},
+        "status": "CREATED",
+        "has_parent": False,
+        "requester": "benchmark",
+        "created_at": datetime.datetime(2019, 7, 2, 12, 0, 0, 123000),
+        "updated_at": datetime.datetime(2019, 7, 2, 12, 0, 0, 123000),
+    }
+
+
+class StubCatalog(object):
+    def __init__(self, system):
+        from bartender.catalog import CachedSystem
+
+        self.system = CachedSystem.from_system(system)
+
+    def get_for_command(self, name, version, command_name):
+        return self.system
+
+
+def model_path(validator, document):
+    from bg_utils.mongo.models import Request
+    from bartender.thrift.handler import BartenderHandler
+    from brewtils.schema_parser import SchemaParser
+
+    request = Request._from_son(dict(document))
+    request = validator.validate_request(request)
+    request.validate()
+    update = BartenderHandler._validated_fields(request)
+    return update, SchemaParser.serialize_request(request)
+
+
+def raw_path(validator, document):
+    from bartender.raw_request import RawRequest
+    from bartender.thrift.handler import BartenderHandler
+
+    request = RawRequest(dict(document))
+    request = validator.validate_request(request)
+    request.validate()
+    update = BartenderHandler._validated_fields(request)
+    return update, request.serialize()
+
+
+def measure(func, validator, document, count):
+    # Warm up plan and schema caches
+    for _ in range(100):
+        func(validator, document)
+
+    start = process_time()
+    for _ in range(count):
+        func(validator, document)
+    return (process_time() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--parameters", type=int, default=5)
+    args = parser.parse_args()
+
+    # Make the bartender package importable when run from a checkout
+    sys.path.append(path.abspath(path.join(path.abspath(__file__), "..", "..")))
+
+    from yapconf import YapconfSpec
+
+    import bartender
+    from bartender.specification import SPECIFICATION
+
+    bartender.config = YapconfSpec(SPECIFICATION).load_config()
+
+    from bartender.request_validator import RequestValidator
+
+    validator = RequestValidator(catalog=StubCatalog(build_system(args.parameters)))
+    document = build_document(args.parameters)
+
+    model_result = model_path(validator, document)
+    raw_result = raw_path(validator, document)
+    if model_result[1] != raw_result[1]:
+        print(
+            "Messages differ!\n  model: %s\n  raw:   %s"
+            % (model_result[1], raw_result[1])
+        )
+        return 1
+
+    try:
+        model = measure(model_path, validator, document, args.requests)
+        raw = measure(raw_path, validator, document, args.requests)
+    finally:
+        validator.shutdown()
+
+    print("%d parameters, %d requests per path" % (args.parameters, args.requests))
+    print("%-6s %12s" % ("path", "us/request"))
+    print("%-6s %12.1f" % ("model", model * 1e6))
+    print("%-6s %12.1f" % ("raw", raw * 1e6))
+    print("raw path saves %.0f%% of the CPU time" % (100 * (1 - raw / model)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
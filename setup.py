@@ -32,8 +32,10 @@ setup(
         ':python_version=="2.7"': [
             "future>=0.16.0",
             "futures>=3.1.1",
+            "selectors34>=1.2",
             "subprocess32>=3.2.7",
-        ]
+        ],
+        "msgpack": ["msgpack>=0.6"],
     },
     classifiers=[
         "Development Status :: 4 - Beta",
@@ -1,3 +1,5 @@
+import shutil
+import tempfile
 import unittest
 from datetime import timedelta
 
@@ -7,7 +9,11 @@ from yapconf import YapconfSpec
 
 import bartender
 from bartender.app import BartenderApp, HelperThread
+from bartender.outbox import OutboxPublisher, RequestOutbox
+from bartender.spool import PublishSpool
 from bartender.specification import SPECIFICATION
+from bartender.thrift.handler import ForwardingHandler
+from bartender.thrift.processes import ThriftProcessPool
 from bg_utils.mongo.models import Event, Request
 
 
@@ -87,6 +93,8 @@ class BartenderAppTest(unittest.TestCase):
     @patch("bartender.app.BartenderApp._startup", Mock())
     def test_shutdown(self):
         self.app.stopped = Mock(return_value=True)
+        self.app.request_validator = Mock()
+        self.app.clients = self.clients
         self.app.plugin_manager = self.plugin_manager
         self.app.helper_threads = [
             self.mongo_pruner,
@@ -101,6 +109,9 @@ class BartenderAppTest(unittest.TestCase):
         for helper in self.app.helper_threads:
             helper.stop.assert_called_once_with()
 
+        self.app.request_validator.shutdown.assert_called_once_with()
+        self.app.clients["pika"].close.assert_called_once_with()
+
     @patch("bartender.bv_client")
     def test_shutdown_notification_error(self, client_mock):
         self.app.plugin_manager = self.plugin_manager
@@ -111,6 +122,84 @@ class BartenderAppTest(unittest.TestCase):
 
         self.app._shutdown()
 
+    @patch("bartender.app.ThriftSupervisor")
+    def test_thrift_processes(self, supervisor_mock):
+        bartender.config.thrift.processes = 3
+        app = BartenderApp()
+
+        # Started before anything else, so before any other thread is
+        self.assertEqual(3, supervisor_mock.call_args[1]["processes"])
+        supervisor_mock.return_value.start.assert_called_once_with()
+
+        thrift_helper = app.helper_threads[0].loader_func
+        self.assertIs(ThriftProcessPool, thrift_helper.func)
+        self.assertIs(
+            supervisor_mock.return_value, thrift_helper.keywords["supervisor"]
+        )
+        self.assertIs(app.handler, thrift_helper.keywords["handler"])
+
+        # Invalidating the main catalog reaches the process handlers' catalogs
+        process_catalog = app._make_process_handler("/tmp/ipc.sock").request_validator
+        app.request_validator.catalog.invalidate("system", "1.0.0")
+        self.assertIsNotNone(app.catalog_generation)
+        self.assertEqual(
+            app.catalog_generation.value, process_catalog.catalog._shared.value
+        )
+
+    def test_scheduler_default(self):
+        # Fair scheduling holds thrift workers while requests wait, so it's
+        # opt-in, and bounded when it is turned on
+        self.assertEqual(0, self.app.scheduler.max_concurrent)
+        self.assertGreater(self.app.scheduler.max_queued, 0)
+        self.assertGreater(self.app.scheduler.max_wait, 0)
+
+    @patch("bartender.publish_filter.Request._get_db")
+    def test_publish_filter_default(self, get_db_mock):
+        publish_filter = self.app.handler.publish_filter
+        self.assertFalse(publish_filter.enabled)
+
+        # So processRequest doesn't make any extra database round trips
+        self.assertTrue(publish_filter.claim("id"))
+        publish_filter.published("id")
+        publish_filter.release("id")
+        self.assertFalse(get_db_mock.called)
+
+    def test_outbox(self):
+        self.assertIsNone(self.app.handler.outbox)
+
+        bartender.config.outbox.enabled = True
+        app = BartenderApp()
+
+        self.assertIsInstance(app.handler.outbox, RequestOutbox)
+        outbox_helper = [
+            h.loader_func
+            for h in app.helper_threads
+            if h.loader_func.func is OutboxPublisher
+        ][0]
+        self.assertIs(app.handler.outbox, outbox_helper.keywords["outbox"])
+        self.assertIs(app.clients["pika"], outbox_helper.keywords["pika_client"])
+
+        handler = app._make_process_handler("/tmp/ipc.sock")
+        self.assertIsInstance(handler.outbox, RequestOutbox)
+
+    def test_make_spool(self):
+        self.assertIsNone(BartenderApp._make_spool())
+
+        directory = tempfile.mkdtemp()
+        try:
+            bartender.config.amq.spool.directory = directory
+            spool = BartenderApp._make_spool()
+            self.assertIsInstance(spool, PublishSpool)
+            spool.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_make_process_handler(self):
+        handler = self.app._make_process_handler("/tmp/ipc.sock")
+        self.assertIsInstance(handler, ForwardingHandler)
+        self.assertEqual("/tmp/ipc.sock", handler.ipc_socket)
+        self.assertIsNot(self.app.clients["pika"], handler.clients["pika"])
+
     def test_setup_pruning_tasks(self):
         bartender.config.db.ttl.info = 5
         bartender.config.db.ttl.action = 10
@@ -0,0 +1,133 @@
+import pytest
+from mock import Mock, patch
+
+from bartender.backend_guard import BackendGuard, Bulkhead, CircuitBreaker
+from bartender.errors import BulkheadFullError, CircuitOpenError
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("backend", failure_threshold=2, reset_timeout=30)
+
+
+class TestCircuitBreaker(object):
+    def test_closed(self, breaker):
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_opens(self, breaker):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_success_resets_failures(self, breaker):
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @patch("bartender.backend_guard.time")
+    def test_half_open(self, time_mock, breaker):
+        time_mock.time.return_value = 100
+        breaker.record_failure()
+        breaker.record_failure()
+
+        time_mock.time.return_value = 130
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        # Only one probe at a time
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    @patch("bartender.backend_guard.time")
+    def test_probe_success(self, time_mock, breaker):
+        time_mock.time.return_value = 100
+        breaker.record_failure()
+        breaker.record_failure()
+
+        time_mock.time.return_value = 130
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @patch("bartender.backend_guard.time")
+    def test_probe_failure(self, time_mock, breaker):
+        time_mock.time.return_value = 100
+        breaker.record_failure()
+        breaker.record_failure()
+
+        time_mock.time.return_value = 130
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        time_mock.time.return_value = 159
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+
+class TestBulkhead(object):
+    def test_full(self):
+        bulkhead = Bulkhead("backend", max_concurrent=1)
+
+        bulkhead.acquire()
+        with pytest.raises(BulkheadFullError):
+            bulkhead.acquire()
+
+        bulkhead.release()
+        bulkhead.acquire()
+
+
+class TestBackendGuard(object):
+    @pytest.fixture
+    def guard(self):
+        return BackendGuard(
+            failure_threshold=1, reset_timeout=30, max_concurrent=1, ignore=(KeyError,)
+        )
+
+    def test_call(self, guard):
+        func = Mock(return_value="result")
+
+        assert guard.call("backend", func, 1, a=2) == "result"
+        func.assert_called_once_with(1, a=2)
+
+    def test_failure_opens(self, guard):
+        with pytest.raises(ValueError):
+            guard.call("backend", Mock(side_effect=ValueError))
+
+        func = Mock()
+        with pytest.raises(CircuitOpenError):
+            guard.call("backend", func)
+        assert func.called is False
+
+    def test_ignored_failure(self, guard):
+        with pytest.raises(KeyError):
+            guard.call("backend", Mock(side_effect=KeyError))
+
+        assert guard.state("backend") == CircuitBreaker.CLOSED
+
+    def test_backends_isolated(self, guard):
+        with pytest.raises(ValueError):
+            guard.call("backend", Mock(side_effect=ValueError))
+
+        assert guard.call("other", Mock(return_value="result")) == "result"
+
+    def test_bulkhead_full(self, guard):
+        def nested():
+            return guard.call("backend", Mock())
+
+        with pytest.raises(BulkheadFullError):
+            guard.call("backend", nested)
+
+    def test_bulkhead_released(self, guard):
+        with pytest.raises(ValueError):
+            guard.call("other", Mock(side_effect=ValueError))
+
+        guard.call("backend", Mock())
+        guard.call("backend", Mock())
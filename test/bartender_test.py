@@ -27,6 +27,10 @@ class BartenderTest(unittest.TestCase):
         bg.setup_bartender(self.spec, {})
         self.assertIsInstance(bg.config, Box)
         self.assertIsInstance(bg.logger, logging.Logger)
+        self.assertIs(
+            bg.bv_client.client.session.get_adapter("http://localhost"),
+            bg.http_pool.adapter,
+        )
 
     def test_progressive_backoff(self):
         bg.logger = Mock()
@@ -0,0 +1,262 @@
+import time
+
+import pytest
+from mock import Mock, patch
+
+from bartender.catalog import CachedSystem, shared_generation, SystemCatalog
+from bg_utils.mongo.models import System
+
+
+@pytest.fixture
+def system_find(monkeypatch):
+    find_mock = Mock()
+    monkeypatch.setattr(System, "find_unique", find_mock)
+    return find_mock
+
+
+@pytest.fixture
+def command_load(monkeypatch):
+    load_mock = Mock()
+    monkeypatch.setattr(CachedSystem, "load_for_command", load_mock)
+    return load_mock
+
+
+@pytest.fixture
+def catalog():
+    return SystemCatalog(ttl=60)
+
+
+class TestCachedSystem(object):
+    def test_from_system(self, bg_system, bg_command, bg_parameter):
+        cached = CachedSystem.from_system(bg_system)
+
+        assert cached.name == bg_system.name
+        assert cached.version == bg_system.version
+        assert cached.instance_names == frozenset(bg_system.instance_names)
+
+        command = cached.command_index[bg_command.name]
+        assert command.command_type == bg_command.command_type
+        assert command.output_type == bg_command.output_type
+
+        parameter = command.parameters[0]
+        assert parameter.key == bg_parameter.key
+        assert parameter.type == bg_parameter.type
+        assert parameter.choices.value == bg_parameter.choices.value
+        assert len(parameter.parameters) == len(bg_parameter.parameters)
+
+    def test_read_only(self, bg_system):
+        cached = CachedSystem.from_system(bg_system)
+
+        with pytest.raises(AttributeError):
+            cached.foo = "bar"
+
+        with pytest.raises(AttributeError):
+            cached.commands[0].name = "bar"
+
+    @patch("bartender.catalog.Command")
+    @patch("bartender.catalog.Instance")
+    @patch("bartender.catalog.System")
+    def test_load_for_command(
+        self, system_mock, instance_mock, command_mock, bg_system, bg_command
+    ):
+        system_query = system_mock.objects.return_value.only.return_value
+        system_query.as_pymongo.return_value.first.return_value = {
+            "_id": bg_system.id,
+            "instances": ["instance_id"],
+        }
+        instance_mock.objects.return_value.scalar.return_value = [
+            ("default", {"content_type": "application/msgpack"}),
+            ("other", None),
+        ]
+        command_mock.objects.return_value.first.return_value = bg_command
+
+        cached = CachedSystem.load_for_command("system", "1.0.0", bg_command.name)
+        assert cached.partial is True
+        assert cached.instance_names == frozenset(["default", "other"])
+        assert cached.content_types == {"default": "application/msgpack", "other": None}
+        assert list(cached.command_index) == [bg_command.name]
+        system_mock.objects.assert_called_once_with(name="system", version="1.0.0")
+        instance_mock.objects.assert_called_once_with(id__in=["instance_id"])
+        command_mock.objects.assert_called_once_with(
+            system=bg_system.id, name=bg_command.name
+        )
+
+    @patch("bartender.catalog.System")
+    def test_load_for_command_missing(self, system_mock):
+        system_query = system_mock.objects.return_value.only.return_value
+        system_query.as_pymongo.return_value.first.return_value = None
+
+        assert CachedSystem.load_for_command("system", "1.0.0", "command") is None
+
+
+class TestSystemCatalog(object):
+    def test_get(self, catalog, system_find, bg_system):
+        system_find.return_value = bg_system
+
+        entry = catalog.get(bg_system.name, bg_system.version)
+        assert entry.name == bg_system.name
+        assert catalog.get(bg_system.name, bg_system.version) is entry
+        system_find.assert_called_once_with(bg_system.name, bg_system.version)
+
+    def test_get_missing(self, catalog, system_find):
+        system_find.return_value = None
+
+        assert catalog.get("foo", "1.0.0") is None
+        assert len(catalog) == 0
+
+    def test_expired(self, system_find, bg_system):
+        system_find.return_value = bg_system
+        catalog = SystemCatalog(ttl=0)
+
+        catalog.get(bg_system.name, bg_system.version)
+        catalog.get(bg_system.name, bg_system.version)
+        assert system_find.call_count == 2
+
+    @pytest.mark.parametrize(
+        "args,remaining",
+        [((), 0), (("system",), 1), (("system", "1.0.0"), 2), (("system", "3.0.0"), 3)],
+    )
+    def test_invalidate(self, catalog, system_find, bg_system, args, remaining):
+        system_find.return_value = bg_system
+        catalog.get("system", "1.0.0")
+        catalog.get("system", "2.0.0")
+        catalog.get("other", "1.0.0")
+
+        catalog.invalidate(*args)
+        assert len(catalog) == remaining
+
+    def test_reload_on_miss(self, catalog, system_find, bg_system, bg_command):
+        system_find.return_value = bg_system
+        entry = catalog.get(bg_system.name, bg_system.version)
+
+        # Entries that were just loaded aren't reloaded for every miss
+        assert catalog.get(bg_system.name, bg_system.version, "new") is entry
+        assert catalog.get(bg_system.name, bg_system.version, None, "new") is entry
+        assert system_find.call_count == 1
+
+        entry.loaded_at -= catalog.MISS_RELOAD_INTERVAL
+        assert catalog.get(bg_system.name, bg_system.version, "new") is not entry
+        assert system_find.call_count == 2
+
+        # Lookups the entry can answer don't reload it
+        entry = catalog.get(bg_system.name, bg_system.version)
+        entry.loaded_at -= catalog.MISS_RELOAD_INTERVAL
+        assert (
+            catalog.get(
+                bg_system.name,
+                bg_system.version,
+                bg_command.name,
+                bg_system.instance_names[0],
+            )
+            is entry
+        )
+
+    def test_shared_generation(self, system_find, bg_system):
+        system_find.return_value = bg_system
+        generation = shared_generation()
+        catalog, other = (
+            SystemCatalog(generation=generation),
+            SystemCatalog(generation=generation),
+        )
+        catalog.get("system", "1.0.0")
+        catalog.get("other", "1.0.0")
+        other.get("system", "1.0.0")
+
+        # Only the named System is dropped where the invalidation happened
+        catalog.invalidate("system", "1.0.0")
+        assert len(catalog) == 1
+
+        other.get("other", "1.0.0")
+        assert len(other) == 1
+        assert system_find.call_count == 4
+
+    def test_shared_generation_concurrent_invalidation(self, system_find, bg_system):
+        system_find.return_value = bg_system
+        generation = shared_generation()
+        catalog, other = (
+            SystemCatalog(generation=generation),
+            SystemCatalog(generation=generation),
+        )
+        catalog.get("system", "1.0.0")
+        catalog.get("other", "1.0.0")
+
+        other.invalidate("third", "1.0.0")
+        catalog.invalidate("system", "1.0.0")
+
+        # The other catalog's invalidation still empties this one
+        catalog.get("other", "1.0.0")
+        assert system_find.call_count == 3
+
+    def test_invalidate_during_load(self, catalog, system_find, bg_system):
+        def find(name, version):
+            catalog.invalidate(name, version)
+            return bg_system
+
+        system_find.side_effect = find
+
+        assert catalog.get("system", "1.0.0") is not None
+        assert len(catalog) == 0
+
+    def test_get_for_command_cached(
+        self, catalog, system_find, command_load, bg_system, bg_command
+    ):
+        system_find.return_value = bg_system
+        entry = catalog.get(bg_system.name, bg_system.version)
+
+        assert (
+            catalog.get_for_command(bg_system.name, bg_system.version, bg_command.name)
+            is entry
+        )
+        assert command_load.called is False
+
+    def test_get_for_command_miss(
+        self, monkeypatch, catalog, command_load, bg_system, bg_command
+    ):
+        background_mock = Mock()
+        monkeypatch.setattr(catalog, "_load_in_background", background_mock)
+        partial = CachedSystem.from_system(bg_system)
+        command_load.return_value = partial
+
+        assert (
+            catalog.get_for_command(bg_system.name, bg_system.version, bg_command.name)
+            is partial
+        )
+        background_mock.assert_called_once_with(bg_system.name, bg_system.version)
+
+    def test_get_for_command_no_ttl(
+        self, monkeypatch, command_load, bg_system, bg_command
+    ):
+        catalog = SystemCatalog(ttl=0)
+        background_mock = Mock()
+        monkeypatch.setattr(catalog, "_load_in_background", background_mock)
+        command_load.return_value = CachedSystem.from_system(bg_system)
+
+        catalog.get_for_command(bg_system.name, bg_system.version, bg_command.name)
+        assert background_mock.called is False
+
+    def test_get_for_command_missing_system(self, catalog, command_load):
+        command_load.return_value = None
+
+        assert catalog.get_for_command("system", "1.0.0", "command") is None
+
+    def test_get_for_command_missing_command(
+        self, catalog, system_find, command_load, bg_system
+    ):
+        system_find.return_value = bg_system
+        command_load.return_value = CachedSystem("id", "system", "1.0.0", [], [], 0)
+
+        entry = catalog.get_for_command(bg_system.name, bg_system.version, "BAD")
+        assert entry.partial is False
+        assert len(entry.commands) == len(bg_system.commands)
+
+    def test_load_in_background(self, catalog, system_find, bg_system):
+        system_find.return_value = bg_system
+
+        catalog._load_in_background(bg_system.name, bg_system.version)
+        for _ in range(100):
+            if len(catalog) and not catalog._loading:
+                break
+            time.sleep(0.01)
+
+        assert len(catalog) == 1
+        assert catalog._loading == set()
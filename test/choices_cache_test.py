@@ -0,0 +1,118 @@
+from threading import Event, Thread
+
+import pytest
+from mock import Mock, patch
+
+from bartender.choices_cache import ChoicesCache
+
+
+@pytest.fixture
+def cache():
+    return ChoicesCache(max_size=2, ttl=60)
+
+
+class TestChoicesCache(object):
+    def test_cached(self, cache):
+        loader = Mock(return_value=["a"])
+
+        assert cache.get("key", loader) == ["a"]
+        assert cache.get("key", loader) == ["a"]
+        assert loader.call_count == 1
+
+    def test_ttl_disabled(self, cache):
+        loader = Mock(return_value=["a"])
+
+        cache.get("key", loader, ttl=0)
+        cache.get("key", loader, ttl=0)
+        assert loader.call_count == 2
+        assert len(cache) == 0
+
+    def test_failure_not_cached(self, cache):
+        loader = Mock(side_effect=[ValueError, ["a"]])
+
+        with pytest.raises(ValueError):
+            cache.get("key", loader)
+        assert cache.get("key", loader) == ["a"]
+
+    def test_max_size(self, cache):
+        for key in ("k1", "k2", "k3"):
+            cache.get(key, Mock(return_value=key))
+
+        assert len(cache) == 2
+
+    def test_invalidate(self, cache):
+        cache.get("k1", Mock())
+        cache.get("k2", Mock())
+
+        cache.invalidate("k1")
+        assert len(cache) == 1
+
+        cache.invalidate()
+        assert len(cache) == 0
+
+    @patch("bartender.choices_cache.time")
+    def test_expired(self, time_mock, cache):
+        loader = Mock(side_effect=[["old"], ["new"]])
+
+        time_mock.time.return_value = 0
+        cache.get("key", loader)
+
+        time_mock.time.return_value = 61
+        assert cache.get("key", loader) == ["new"]
+
+    @patch("bartender.choices_cache.time")
+    def test_stale_while_revalidate(self, time_mock):
+        cache = ChoicesCache(ttl=60, stale_ttl=60)
+        cache.run_in_background = Mock()
+        loader = Mock(return_value=["old"])
+
+        time_mock.time.return_value = 0
+        cache.get("key", loader)
+
+        time_mock.time.return_value = 90
+        assert cache.get("key", loader) == ["old"]
+        assert loader.call_count == 1
+        cache.run_in_background.assert_called_once_with(cache._load, "key", loader, 60)
+
+    def test_single_flight(self, cache):
+        started = Event()
+        release = Event()
+        results = []
+
+        def slow_loader():
+            started.set()
+            release.wait(5)
+            return ["a"]
+
+        loader = Mock(side_effect=slow_loader)
+
+        def lookup():
+            results.append(cache.get("key", loader))
+
+        threads = [Thread(target=lookup) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert results == [["a"]] * 5
+        assert loader.call_count == 1
+
+    def test_single_flight_shares_exception(self, cache):
+        call = Mock()
+        cache._in_flight["key"] = call
+        call.wait.side_effect = ValueError
+
+        loader = Mock()
+        with pytest.raises(ValueError):
+            cache.get("key", loader)
+        assert not loader.called
+
+    def test_run_in_background_swallows(self, cache):
+        thread = cache.run_in_background(Mock(side_effect=ValueError))
+        thread.join(5)
+        assert not thread.is_alive()
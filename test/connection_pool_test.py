@@ -0,0 +1,116 @@
+import socket
+
+import pytest
+from mock import ANY, Mock, patch
+from requests import Request, Session
+
+from bartender.connection_pool import HttpPool, JitterRetry, PooledAdapter
+
+
+class TestJitterRetry(object):
+    def test_new_keeps_jitter(self):
+        retry = JitterRetry(total=3, jitter=0.5)
+        assert retry.new(total=2).jitter == 0.5
+
+    @patch("bartender.connection_pool.random")
+    def test_backoff(self, random_mock):
+        random_mock.uniform.return_value = 1.25
+        retry = JitterRetry(total=3, backoff_factor=1, jitter=0.5)
+        retry = retry.increment(method="GET").increment(method="GET")
+
+        assert retry.get_backoff_time() == 2.5
+        random_mock.uniform.assert_called_once_with(0.5, 1.5)
+
+    def test_no_backoff(self):
+        retry = JitterRetry(total=3, backoff_factor=1, jitter=0.5)
+        assert retry.get_backoff_time() == 0
+
+
+class TestPooledAdapter(object):
+    def test_retries(self):
+        adapter = PooledAdapter(retries=5, backoff_jitter=0.25)
+
+        assert adapter.max_retries.total == 5
+        assert adapter.max_retries.jitter == 0.25
+
+    def test_pool_size(self):
+        adapter = PooledAdapter(pool_connections=3, pool_maxsize=7)
+        pool = adapter.poolmanager.connection_from_url("http://localhost")
+
+        assert adapter.poolmanager.pools._maxsize == 3
+        assert pool.pool.maxsize == 7
+
+    @pytest.mark.parametrize("keep_alive,expected", [(True, True), (False, False)])
+    def test_tcp_keep_alive(self, keep_alive, expected):
+        adapter = PooledAdapter(keep_alive=keep_alive)
+        options = adapter.poolmanager.connection_pool_kw.get("socket_options", [])
+
+        assert ((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options) is expected
+
+    @pytest.mark.parametrize("keep_alive,expected", [(True, None), (False, "close")])
+    def test_connection_header(self, keep_alive, expected):
+        adapter = PooledAdapter(keep_alive=keep_alive)
+        request = Request("GET", "http://localhost").prepare()
+
+        with patch("requests.adapters.HTTPAdapter.send") as send_mock:
+            adapter.send(request)
+
+        assert send_mock.call_args[0][0].headers.get("Connection") == expected
+
+    def test_stats(self):
+        adapter = PooledAdapter()
+        pool = adapter.poolmanager.connection_from_url("http://localhost:2337")
+        pool.num_connections = 2
+        pool.num_requests = 10
+
+        assert adapter.stats() == {
+            "http://localhost:2337": {"connections": 2, "requests": 10}
+        }
+
+
+class TestHttpPool(object):
+    def test_mount(self):
+        pool = HttpPool()
+        session = pool.mount(Session())
+
+        assert session.get_adapter("http://localhost") is pool.adapter
+        assert session.get_adapter("https://localhost") is pool.adapter
+
+    def test_mount_without_retries(self):
+        pool = HttpPool(retries=3)
+        session = pool.mount(Session(), retries=False)
+
+        assert session.get_adapter("http://localhost") is pool.single_attempt_adapter
+        assert pool.single_attempt_adapter.max_retries.total == 0
+        assert pool.adapter.max_retries.total == 3
+
+    def test_stats_combined(self):
+        pool = HttpPool()
+        for adapter in (pool.adapter, pool.single_attempt_adapter):
+            connection = adapter.poolmanager.connection_from_url(
+                "http://localhost:2337"
+            )
+            connection.num_connections = 1
+            connection.num_requests = 3
+
+        assert pool.stats() == {
+            "http://localhost:2337": {"connections": 2, "requests": 6}
+        }
+
+    def test_shared(self):
+        pool = HttpPool()
+
+        first = pool.mount(Session())
+        second = pool.mount(Session())
+        assert first.get_adapter("http://host") is second.get_adapter("http://host")
+
+    def test_log_stats(self):
+        pool = HttpPool()
+        pool.logger = Mock()
+        pool.adapter = Mock()
+        pool.adapter.stats.return_value = {
+            "http://host:80": {"connections": 1, "requests": 5}
+        }
+
+        pool.log_stats()
+        pool.logger.debug.assert_called_once_with(ANY, "http://host:80", 5, 1)
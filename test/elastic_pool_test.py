@@ -0,0 +1,92 @@
+import time
+from threading import Event
+
+import pytest
+
+from bartender.elastic_pool import ElasticThreadPool
+
+
+@pytest.fixture
+def pool():
+    pool = ElasticThreadPool(min_workers=1, max_workers=3, keep_alive=60)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestElasticThreadPool(object):
+    def test_minimum_workers(self, pool):
+        assert pool.size == 1
+
+    def test_submit(self, pool):
+        assert pool.submit(lambda x: x * 2, 21).result(5) == 42
+
+    def test_submit_exception(self, pool):
+        future = pool.submit(lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            future.result(5)
+
+    def test_invalid_bounds(self):
+        with pytest.raises(ValueError):
+            ElasticThreadPool(min_workers=0, max_workers=0)
+
+    def test_min_workers_capped(self):
+        pool = ElasticThreadPool(min_workers=5, max_workers=2)
+        try:
+            assert pool.min_workers == 2
+            assert pool.size == 2
+        finally:
+            pool.shutdown(wait=False)
+
+    def test_grows_to_max(self, pool):
+        release = Event()
+        futures = [pool.submit(release.wait, 5) for _ in range(5)]
+
+        assert wait_for(lambda: pool.size == 3)
+        assert wait_for(lambda: pool.stats()["queued"] == 2)
+
+        release.set()
+        assert all(future.result(5) for future in futures)
+        assert pool.stats()["peak"] == 3
+
+    def test_grow_wait(self):
+        pool = ElasticThreadPool(min_workers=1, max_workers=2, grow_wait=0.2)
+        release = Event()
+        try:
+            pool.submit(release.wait, 5)
+            pool.submit(release.wait, 5)
+            assert pool.size == 1
+
+            assert wait_for(lambda: pool.size == 2)
+        finally:
+            release.set()
+            pool.shutdown()
+
+    def test_retires_idle_workers(self):
+        pool = ElasticThreadPool(min_workers=1, max_workers=3, keep_alive=0.1)
+        release = Event()
+        try:
+            futures = [pool.submit(release.wait, 5) for _ in range(3)]
+            assert wait_for(lambda: pool.size == 3)
+
+            release.set()
+            for future in futures:
+                future.result(5)
+
+            assert wait_for(lambda: pool.size == 1)
+            assert [entry[1] for entry in pool.stats()["history"]][-2:] == [2, 1]
+        finally:
+            pool.shutdown()
+
+    def test_shutdown(self, pool):
+        pool.shutdown()
+
+        assert pool.size == 0
+        with pytest.raises(RuntimeError):
+            pool.submit(lambda: None)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import pytest
+import simplejson
+from mock import patch
+
+from bartender import encoding
+
+# msgpack is an optional dependency
+msgpack = pytest.importorskip("msgpack")
+
+
+class NegotiateTest(unittest.TestCase):
+    def test_first_enabled(self):
+        self.assertEqual(
+            encoding.MSGPACK,
+            encoding.negotiate(
+                ["application/cbor", encoding.MSGPACK], [encoding.MSGPACK]
+            ),
+        )
+
+    def test_not_enabled(self):
+        self.assertEqual(encoding.JSON, encoding.negotiate([encoding.MSGPACK], []))
+
+    def test_nothing_accepted(self):
+        self.assertEqual(encoding.JSON, encoding.negotiate(None, [encoding.MSGPACK]))
+
+    @patch("bartender.encoding.msgpack", None)
+    def test_not_installed(self):
+        self.assertEqual([], encoding.supported())
+        self.assertEqual(
+            encoding.JSON, encoding.negotiate([encoding.MSGPACK], [encoding.MSGPACK])
+        )
+
+
+class DumpsTest(unittest.TestCase):
+    def setUp(self):
+        self.message = {
+            "id": "id",
+            "parameters": {"message": u"héllo", "times": [1, 2.5]},
+        }
+
+    def test_json(self):
+        self.assertEqual(
+            self.message, simplejson.loads(encoding.dumps(self.message, encoding.JSON))
+        )
+
+    def test_msgpack(self):
+        body = encoding.dumps(self.message, encoding.MSGPACK)
+        self.assertEqual(self.message, msgpack.unpackb(body, raw=False))
@@ -0,0 +1,136 @@
+import time
+from threading import Thread
+
+import pytest
+from mock import Mock
+
+from bartender.errors import SystemThrottledError
+from bartender.fair_scheduler import FairScheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+    assert condition()
+
+
+def start_waiters(scheduler, keys, order):
+    """Queue one waiter per key, in order, each recording when it is granted"""
+
+    def wait(key):
+        scheduler.acquire(key)
+        order.append(key)
+
+    threads = []
+    for key in keys:
+        thread = Thread(target=wait, args=(key,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+        # Make sure each waiter is queued (or granted) before the next arrives
+        wait_for(lambda: sum(scheduler.depths().values()) + len(order) == len(threads))
+
+    return threads
+
+
+def drain(scheduler, first, threads, order):
+    """Release ``first``, then each waiter as soon as it is granted"""
+    scheduler.release(first)
+    for count in range(1, len(threads) + 1):
+        wait_for(lambda: len(order) >= count)
+        scheduler.release(order[count - 1])
+
+    for thread in threads:
+        thread.join(5)
+
+
+class TestFairScheduler(object):
+    def test_disabled(self):
+        scheduler = FairScheduler()
+
+        with scheduler.slot("system"):
+            assert scheduler.stats()["running"] == 0
+
+    def test_slot(self):
+        scheduler = FairScheduler(max_concurrent=1)
+
+        with scheduler.slot("system"):
+            assert scheduler.stats()["running_by_key"] == {"system": 1}
+        assert scheduler.stats()["running"] == 0
+
+    def test_noisy_system_does_not_starve_others(self):
+        scheduler = FairScheduler(max_concurrent=1)
+        scheduler.acquire("noisy")
+
+        order = []
+        threads = start_waiters(scheduler, ["noisy"] * 3 + ["quiet"], order)
+        assert scheduler.depths() == {"noisy": 3, "quiet": 1}
+
+        drain(scheduler, "noisy", threads, order)
+        # The noisy system already had a turn, so the quiet one goes next
+        assert order == ["quiet", "noisy", "noisy", "noisy"]
+
+    def test_weights(self):
+        scheduler = FairScheduler(
+            max_concurrent=1, systems=[{"name": "heavy", "weight": 3}]
+        )
+        scheduler.acquire("blocker")
+
+        order = []
+        threads = start_waiters(scheduler, ["light"] * 3 + ["heavy"] * 3, order)
+
+        drain(scheduler, "blocker", threads, order)
+        assert order == ["heavy", "heavy", "light", "heavy", "light", "light"]
+
+    def test_cap(self):
+        scheduler = FairScheduler(
+            max_concurrent=3, systems=[{"name": "capped", "max_concurrent": 1}]
+        )
+        scheduler.acquire("capped")
+
+        order = []
+        threads = start_waiters(scheduler, ["capped", "other"], order)
+        assert order == ["other"]
+        assert scheduler.depths() == {"capped": 1}
+
+        scheduler.release("capped")
+        threads[0].join(5)
+        assert order == ["other", "capped"]
+
+    def test_max_queued(self):
+        scheduler = FairScheduler(max_concurrent=1, max_queued=1)
+        scheduler.acquire("system")
+
+        threads = start_waiters(scheduler, ["system"], [])
+        with pytest.raises(SystemThrottledError):
+            scheduler.acquire("system")
+        assert scheduler.stats()["rejected"] == 1
+
+        scheduler.release("system")
+        threads[0].join(5)
+
+    def test_max_wait(self):
+        scheduler = FairScheduler(max_concurrent=1, max_wait=0.05)
+        scheduler.acquire("system")
+
+        with pytest.raises(SystemThrottledError):
+            scheduler.acquire("other")
+
+        stats = scheduler.stats()
+        assert stats["timed_out"] == 1
+        assert stats["queued"] == {}
+
+    def test_stats_logged_periodically(self):
+        scheduler = FairScheduler(max_concurrent=1, stats_interval=60)
+        scheduler.log_stats = Mock()
+
+        with scheduler.slot("system"):
+            pass
+        assert not scheduler.log_stats.called
+
+        scheduler._stats_logged -= 60
+        with scheduler.slot("system"):
+            pass
+        scheduler.log_stats.assert_called_once_with()
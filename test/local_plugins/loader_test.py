@@ -144,6 +144,17 @@ class PluginLoaderTest(unittest.TestCase):
         self.assertTrue(self.loader.load_plugin("/path/to/foo-0.1"))
         self.assertTrue(self.mock_registry.register_plugin.called)
 
+    @patch("bartender.local_plugins.loader.LocalPluginLoader._load_plugin_config")
+    def test_load_plugin_invalidates_catalog(self, config_mock):
+        config_mock.return_value = self.default_config
+        self.mock_validator.validate_plugin = Mock(return_value=True)
+        self.loader.catalog = Mock()
+
+        self.loader.load_plugin("/path/to/foo-0.1")
+        self.loader.catalog.invalidate.assert_called_once_with(
+            self.default_config["NAME"], self.default_config["VERSION"]
+        )
+
     @patch("bartender.local_plugins.loader.LocalPluginLoader._load_plugin_config")
     def test_load_plugin_already_exists(self, config_mock):
         config_mock.return_value = self.default_config
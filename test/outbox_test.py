@@ -0,0 +1,244 @@
+import unittest
+from datetime import datetime
+
+import pika.spec
+from bson import ObjectId
+from mock import MagicMock, Mock, patch
+from pika.exceptions import UnroutableError
+from pymongo.errors import AutoReconnect
+
+from bartender.outbox import OutboxPublisher, RequestOutbox
+from bartender.raw_request import RawRequest
+
+
+class RequestOutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.collection = self.db.__getitem__.return_value
+
+        patcher = patch("bartender.outbox.Request._get_db", Mock(return_value=self.db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.outbox = RequestOutbox(lease=30)
+        self.request_id = ObjectId()
+
+    def test_add(self):
+        self.outbox.add(self.request_id, "CREATED", {"parameters": {}})
+
+        self.db.__getitem__.assert_called_with("bartender_request_outbox")
+        (query, entry), kwargs = self.collection.replace_one.call_args
+        self.assertEqual({"_id": self.request_id}, query)
+        self.assertEqual("CREATED", entry["status"])
+        self.assertEqual({"parameters": {}}, entry["fields"])
+        self.assertIsNone(entry["owner"])
+        self.assertTrue(kwargs["upsert"])
+
+        # Adding wakes a waiting publisher until it takes the new entries
+        self.assertTrue(self.outbox.wait(0))
+        self.collection.find.return_value.sort.return_value.limit.return_value = []
+        self.outbox.take(10)
+        self.assertFalse(self.outbox.wait(0))
+
+    def test_add_during_take(self):
+        def find(*args, **kwargs):
+            self.outbox.add(ObjectId(), "CREATED", {})
+            return MagicMock()
+
+        self.collection.find.side_effect = find
+        self.outbox.take(10)
+
+        # The entry may have been added too late for that take, so don't wait
+        self.assertTrue(self.outbox.wait(0))
+
+    def test_take_empty(self):
+        self.collection.find.return_value.sort.return_value.limit.return_value = []
+
+        self.assertEqual([], self.outbox.take(10))
+        self.assertFalse(self.collection.update_many.called)
+
+    def test_take(self):
+        leased = [{"_id": self.request_id, "owner": "me"}]
+
+        # Only entries this call managed to lease are returned
+        self.collection.find.return_value.sort.return_value = MagicMock(
+            limit=Mock(return_value=[{"_id": self.request_id}]),
+            __iter__=Mock(return_value=iter(leased)),
+        )
+        self.assertEqual(leased, self.outbox.take(10))
+
+        (query, update), _ = self.collection.update_many.call_args
+        owner = update["$set"]["owner"]
+        self.assertEqual({"$in": [self.request_id]}, query["_id"])
+        self.assertIn("$lt", query["leased_until"])
+        self.assertGreater(update["$set"]["leased_until"], datetime.utcnow())
+        self.collection.find.assert_called_with(
+            {"_id": {"$in": [self.request_id]}, "owner": owner}
+        )
+
+    def test_remove(self):
+        self.outbox.remove([{"_id": self.request_id, "owner": "me"}])
+        self.collection.delete_many.assert_called_once_with(
+            {"_id": {"$in": [self.request_id]}, "owner": "me"}
+        )
+
+    def test_remove_nothing(self):
+        self.outbox.remove([])
+        self.assertFalse(self.collection.delete_many.called)
+
+    def test_retry_later(self):
+        self.outbox.retry_later([{"_id": self.request_id, "owner": "me"}], 5)
+
+        (query, update), _ = self.collection.update_many.call_args
+        self.assertEqual({"_id": {"$in": [self.request_id]}, "owner": "me"}, query)
+        self.assertIsNone(update["$set"]["owner"])
+        self.assertGreater(update["$set"]["leased_until"], datetime.utcnow())
+
+
+class OutboxPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.requests.bulk_write.side_effect = lambda operations, **kwargs: Mock(
+            matched_count=len(operations)
+        )
+        patcher = patch(
+            "bartender.outbox.Request._get_collection", Mock(return_value=self.requests)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.outbox = Mock()
+        self.pika_client = Mock()
+        self.pika_client.publish_requests.side_effect = lambda requests, **kwargs: {
+            str(request.id): None for request in requests
+        }
+        self.publisher = OutboxPublisher(
+            self.outbox, self.pika_client, batch_size=10, retry_delay=5
+        )
+
+        self.request_id = ObjectId()
+        self.entry = {
+            "_id": self.request_id,
+            "status": "CREATED",
+            "fields": {"parameters": {"message": "hi"}},
+            "owner": "me",
+        }
+        self.document = {
+            "_id": self.request_id,
+            "system": "system",
+            "system_version": "1.0.0",
+            "instance_name": "default",
+            "command": "command",
+            "status": "CREATED",
+            "parameters": {},
+        }
+
+    def test_publish_batch_empty(self):
+        self.outbox.take.return_value = []
+
+        self.assertEqual(0, self.publisher.publish_batch())
+        self.assertFalse(self.pika_client.publish_requests.called)
+
+    def test_publish_batch(self):
+        self.outbox.take.return_value = [self.entry]
+        self.requests.find.return_value = [self.document]
+
+        self.assertEqual(1, self.publisher.publish_batch())
+
+        (operations,), _ = self.requests.bulk_write.call_args
+        self.assertEqual(
+            {"_id": self.request_id, "status": "CREATED"}, operations[0]._filter
+        )
+        self.assertEqual({"$set": self.entry["fields"]}, operations[0]._doc)
+
+        (published,), kwargs = self.pika_client.publish_requests.call_args
+        self.assertIsInstance(published[0], RawRequest)
+        self.assertEqual({"message": "hi"}, published[0].parameters)
+        self.assertEqual(
+            dict(
+                confirm=True,
+                mandatory=True,
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            ),
+            kwargs,
+        )
+        self.outbox.remove.assert_called_once_with([self.entry])
+        self.outbox.retry_later.assert_called_once_with([], 5)
+
+    def test_publish_batch_status_changed(self):
+        self.document["status"] = "CANCELED"
+        self.outbox.take.return_value = [self.entry]
+        self.requests.find.return_value = [self.document]
+
+        self.publisher.publish_batch()
+        self.assertFalse(self.requests.bulk_write.called)
+        self.pika_client.publish_requests.assert_called_once_with(
+            [],
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+        )
+        self.outbox.remove.assert_called_once_with([self.entry])
+
+    def test_publish_batch_status_changed_during_write(self):
+        other_id = ObjectId()
+        other_entry = dict(self.entry, _id=other_id)
+        self.outbox.take.return_value = [self.entry, other_entry]
+        self.requests.find.side_effect = [
+            [self.document, dict(self.document, _id=other_id)],
+            # Only the first Request still has its status after the write
+            [{"_id": self.request_id}],
+        ]
+        self.requests.bulk_write.side_effect = None
+        self.requests.bulk_write.return_value = Mock(matched_count=1)
+
+        self.publisher.publish_batch()
+        (published,), _ = self.pika_client.publish_requests.call_args
+        self.assertEqual([self.request_id], [request.id for request in published])
+        self.outbox.remove.assert_called_once_with([other_entry, self.entry])
+
+    def test_publish_batch_missing(self):
+        self.outbox.take.return_value = [self.entry]
+        self.requests.find.return_value = []
+
+        self.publisher.publish_batch()
+        self.outbox.remove.assert_called_once_with([self.entry])
+
+    def test_publish_batch_with_parent(self):
+        self.document["parent"] = ObjectId()
+        self.outbox.take.return_value = [self.entry]
+        self.requests.find.return_value = [self.document]
+        self.pika_client.publish_requests.side_effect = None
+        self.pika_client.publish_requests.return_value = {}
+
+        with patch("bartender.outbox.RawRequest.to_model") as to_model_mock:
+            self.publisher.publish_batch()
+
+        (published,), _ = self.pika_client.publish_requests.call_args
+        self.assertEqual([to_model_mock.return_value], published)
+
+    def test_publish_batch_failed(self):
+        self.outbox.take.return_value = [self.entry]
+        self.requests.find.return_value = [self.document]
+        self.pika_client.publish_requests.side_effect = lambda requests, **kwargs: {
+            str(request.id): UnroutableError([]) for request in requests
+        }
+
+        self.publisher.publish_batch()
+        self.outbox.remove.assert_called_once_with([])
+        self.outbox.retry_later.assert_called_once_with([self.entry], 5)
+
+    def test_run(self):
+        self.publisher.publish_batch = Mock(side_effect=[10, AutoReconnect, 0])
+        self.publisher.stopped = Mock(side_effect=[False, False, False, True])
+
+        self.publisher.run()
+        self.assertEqual(3, self.publisher.publish_batch.call_count)
+
+        # Full batches are followed straight away by another
+        self.assertEqual(2, self.outbox.wait.call_count)
+
+    def test_stop(self):
+        self.publisher.stop()
+        self.assertTrue(self.publisher.stopped())
+        self.outbox.wake.assert_called_once_with()
@@ -1,8 +1,21 @@
+import threading
 import unittest
 
-from mock import Mock, patch
+from concurrent.futures import Future
+from mock import ANY, Mock, patch
+from pika import BasicProperties
+from pika.spec import Basic
+from pika.exceptions import (
+    AMQPConnectionError,
+    ChannelClosedByBroker,
+    NackError,
+    StreamLostError,
+    UnroutableError,
+)
 
-from bartender.pika import PikaClient
+from bartender import encoding
+from bartender.pika import ConfirmingPublisher, PikaClient
+from bartender.raw_request import RawRequest
 
 
 class PikaClientTest(unittest.TestCase):
@@ -29,6 +42,29 @@ class PikaClientTest(unittest.TestCase):
             "body", headers={"request_id": "id"}, routing_key="queue_name"
         )
 
+    @patch("bartender.pika.SchemaParser")
+    def test_publish_raw_request(self, parser_mock):
+        request = RawRequest({"_id": "id", "system": "echo"})
+
+        self.client.publish_request(request, routing_key="queue_name")
+        self.publish_mock.assert_called_with(
+            request.serialize(), headers={"request_id": "id"}, routing_key="queue_name"
+        )
+        self.assertFalse(parser_mock.serialize_request.called)
+
+    def test_publish_request_msgpack(self):
+        request = RawRequest({"_id": "id", "system": "echo"})
+
+        self.client.publish_request(
+            request, content_type=encoding.MSGPACK, routing_key="queue_name"
+        )
+        self.publish_mock.assert_called_with(
+            encoding.dumps(request.to_message(), encoding.MSGPACK),
+            headers={"request_id": "id"},
+            routing_key="queue_name",
+            content_type=encoding.MSGPACK,
+        )
+
     @patch("bartender.pika.get_routing_key", Mock(return_value="queue_name_1"))
     @patch(
         "bartender.pika.SchemaParser", Mock(serialize_request=Mock(return_value="body"))
@@ -73,3 +109,572 @@ class PikaClientTest(unittest.TestCase):
         publish_request_mock.assert_called_once_with(
             request_mock.return_value, routing_key="admin.foo.1-0-0.default"
         )
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="queue_name"))
+    @patch(
+        "bartender.pika.SchemaParser", Mock(serialize_request=Mock(return_value="body"))
+    )
+    @patch("bartender.pika.BlockingConnection")
+    def test_publish_requests(self, connection_mock):
+        channel_mock = connection_mock.return_value.channel.return_value
+        channel_mock.basic_publish.side_effect = [None, UnroutableError([])]
+        channel_mock.is_closed = False
+
+        results = self.client.publish_requests(
+            [Mock(id="id1"), Mock(id="id2")], confirm=True, mandatory=True
+        )
+        self.assertTrue(channel_mock.confirm_delivery.called)
+        self.assertEqual(2, channel_mock.basic_publish.call_count)
+        self.assertIsNone(results["id1"])
+        self.assertIsInstance(results["id2"], UnroutableError)
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="queue_name"))
+    @patch(
+        "bartender.pika.SchemaParser", Mock(serialize_request=Mock(return_value="body"))
+    )
+    @patch("bartender.pika.BlockingConnection")
+    def test_publish_requests_connection_error(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+
+        results = self.client.publish_requests([Mock(id="id1"), Mock(id="id2")])
+        self.assertIsInstance(results["id1"], AMQPConnectionError)
+        self.assertIsInstance(results["id2"], AMQPConnectionError)
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="queue_name"))
+    @patch("bartender.pika.BlockingConnection")
+    def test_publish_requests_content_types(self, connection_mock):
+        channel_mock = connection_mock.return_value.channel.return_value
+        requests = [Mock(id="id1"), Mock(id="id2")]
+
+        with patch.object(PikaClient, "_serialize", return_value="body") as serialize:
+            self.client.publish_requests(
+                requests, content_types={"id2": encoding.MSGPACK}
+            )
+
+        serialize.assert_any_call(requests[0], None)
+        serialize.assert_any_call(requests[1], encoding.MSGPACK)
+        self.assertEqual(
+            [encoding.JSON, encoding.MSGPACK],
+            [
+                c[1]["properties"].content_type
+                for c in channel_mock.basic_publish.call_args_list
+            ],
+        )
+
+    @patch("bartender.pika.BlockingConnection")
+    def test_publish_requests_empty(self, connection_mock):
+        self.assertEqual({}, self.client.publish_requests([]))
+        self.assertFalse(connection_mock.called)
+
+
+@patch("bartender.pika.BlockingConnection")
+class PersistentPublishTest(unittest.TestCase):
+    def setUp(self):
+        self.client = PikaClient(host="localhost", port=5672)
+
+    def test_connection_reused(self, connection_mock):
+        self.client.publish("body1", routing_key="key")
+        self.client.publish("body2", routing_key="key")
+
+        self.assertEqual(1, connection_mock.call_count)
+        connection = connection_mock.return_value
+        self.assertEqual(1, connection.channel.call_count)
+        self.assertEqual(2, connection.channel.return_value.basic_publish.call_count)
+        connection.process_data_events.assert_called_once_with(time_limit=0)
+
+    def test_confirm_channel(self, connection_mock):
+        connection = connection_mock.return_value
+        plain, confirmed = Mock(), Mock()
+        connection.channel.side_effect = [plain, confirmed]
+
+        self.client.publish("body", routing_key="key")
+        self.client.publish("body", routing_key="key", confirm=True)
+        self.client.publish("body", routing_key="key", confirm=True)
+
+        self.assertFalse(plain.confirm_delivery.called)
+        confirmed.confirm_delivery.assert_called_once_with()
+        self.assertEqual(2, confirmed.basic_publish.call_count)
+
+    def test_content_type(self, connection_mock):
+        channel = connection_mock.return_value.channel.return_value
+
+        self.client.publish("body", routing_key="key")
+        self.client.publish(b"body", routing_key="key", content_type=encoding.MSGPACK)
+
+        contents = [
+            kwargs["properties"].content_type
+            for _, kwargs in channel.basic_publish.call_args_list
+        ]
+        self.assertEqual([encoding.JSON, encoding.MSGPACK], contents)
+
+    def test_connection_per_thread(self, connection_mock):
+        connection_mock.side_effect = lambda params: Mock()
+
+        self.client.publish("body", routing_key="key")
+        thread = threading.Thread(
+            target=self.client.publish, args=("body",), kwargs={"routing_key": "key"}
+        )
+        thread.start()
+        thread.join()
+
+        self.assertEqual(2, connection_mock.call_count)
+
+    def test_exited_thread_connection_closed(self, connection_mock):
+        connection_mock.side_effect = lambda params: Mock()
+
+        def publish():
+            self.client.publish("body", routing_key="key")
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        thread.join()
+        (exited,) = self.client._connections.values()
+
+        publish()
+        exited.close.assert_called_once_with()
+        self.assertEqual(1, len(self.client._connections))
+
+    def test_reconnect(self, connection_mock):
+        broken, fresh = Mock(), Mock()
+        broken.channel.return_value.basic_publish.side_effect = StreamLostError
+        connection_mock.side_effect = [broken, fresh]
+
+        self.client.publish("body", routing_key="key")
+        broken.close.assert_called_once_with()
+        self.assertEqual(1, fresh.channel.return_value.basic_publish.call_count)
+
+    def test_closed_channel_replaced(self, connection_mock):
+        connection = connection_mock.return_value
+        closed, fresh = Mock(), Mock()
+        closed.basic_publish.side_effect = ChannelClosedByBroker(404, "NOT_FOUND")
+        connection.channel.side_effect = [closed, fresh]
+
+        self.client.publish("body", routing_key="key")
+        self.assertEqual(1, connection_mock.call_count)
+        self.assertEqual(1, fresh.basic_publish.call_count)
+
+    def test_reconnect_fails(self, connection_mock):
+        connection_mock.return_value.channel.return_value.basic_publish.side_effect = (
+            StreamLostError
+        )
+
+        with self.assertRaises(StreamLostError):
+            self.client.publish("body", routing_key="key")
+
+    def test_unroutable_not_retried(self, connection_mock):
+        channel = connection_mock.return_value.channel.return_value
+        channel.basic_publish.side_effect = UnroutableError([])
+
+        with self.assertRaises(UnroutableError):
+            self.client.publish("body", routing_key="key", mandatory=True)
+        self.assertEqual(1, channel.basic_publish.call_count)
+
+    def test_closed_connection_reopened(self, connection_mock):
+        self.client.publish("body", routing_key="key")
+        connection_mock.return_value.is_open = False
+
+        self.client.publish("body", routing_key="key")
+        self.assertEqual(2, connection_mock.call_count)
+
+    def test_close(self, connection_mock):
+        self.client.publish("body", routing_key="key")
+
+        self.client.close()
+        connection_mock.return_value.close.assert_called_once_with()
+
+
+class AsyncConfirmsTest(unittest.TestCase):
+    def setUp(self):
+        self.client = PikaClient(
+            host="localhost", port=5672, async_confirms=True, confirm_timeout=1
+        )
+        self.confirmer = Mock()
+        self.client._confirmer = self.confirmer
+
+    def _future(self, exception=None):
+        future = Future()
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(None)
+        return future
+
+    @patch("bartender.pika.BlockingConnection")
+    def test_publish(self, connection_mock):
+        self.confirmer.publish.return_value = self._future()
+
+        self.client.publish("body", routing_key="key", confirm=True, mandatory=True)
+        self.confirmer.publish.assert_called_once_with(
+            "body", routing_key="key", properties=ANY, mandatory=True
+        )
+        self.assertFalse(connection_mock.called)
+
+    def test_publish_error(self):
+        self.confirmer.publish.return_value = self._future(UnroutableError([]))
+
+        with self.assertRaises(UnroutableError):
+            self.client.publish("body", routing_key="key", confirm=True)
+
+    @patch("bartender.pika.BlockingConnection")
+    def test_unconfirmed_not_async(self, connection_mock):
+        self.client.publish("body", routing_key="key")
+
+        self.assertFalse(self.confirmer.publish.called)
+        self.assertTrue(connection_mock.called)
+
+    @patch(
+        "bartender.pika.SchemaParser", Mock(serialize_request=Mock(return_value="body"))
+    )
+    def test_publish_requests(self):
+        self.client._confirm_timeout = 0.1
+        pending = Future()
+        self.confirmer.publish.side_effect = [
+            self._future(),
+            self._future(NackError([])),
+            pending,
+        ]
+
+        results = self.client.publish_requests(
+            [
+                Mock(id="id1", system="s", system_version="1", instance_name="i"),
+                Mock(id="id2", system="s", system_version="1", instance_name="i"),
+                Mock(id="id3", system="s", system_version="1", instance_name="i"),
+            ],
+            confirm=True,
+        )
+
+        # Everything is published before waiting on any confirmation
+        self.assertEqual(3, self.confirmer.publish.call_count)
+        self.assertIsNone(results["id1"])
+        self.assertIsInstance(results["id2"], NackError)
+        self.assertIsNotNone(results["id3"])
+
+    def test_close(self):
+        self.client.close()
+        self.confirmer.stop.assert_called_once_with()
+        self.assertIsNone(self.client._confirmer)
+
+    @patch("bartender.pika.ConfirmingPublisher")
+    def test_confirmer_started_once(self, publisher_mock):
+        self.client._confirmer = None
+        publisher_mock.return_value.publish.return_value = self._future()
+
+        self.client.publish("body", routing_key="key", confirm=True)
+        self.client.publish("body", routing_key="key", confirm=True)
+        publisher_mock.return_value.start.assert_called_once_with(timeout=1)
+
+    @patch("bartender.pika.ConfirmingPublisher")
+    def test_confirmer_started_unlocked(self, publisher_mock):
+        self.client._confirmer = None
+        publisher_mock.return_value.publish.return_value = self._future()
+
+        def start(timeout=None):
+            # Other publishing threads can still take the lock
+            self.assertTrue(self.client._confirmer_lock.acquire(False))
+            self.client._confirmer_lock.release()
+
+        publisher_mock.return_value.start.side_effect = start
+
+        self.client.publish("body", routing_key="key", confirm=True)
+        self.assertIs(publisher_mock.return_value, self.client._confirmer)
+
+    @patch("bartender.pika.ConfirmingPublisher")
+    def test_confirmer_started_concurrently(self, publisher_mock):
+        self.client._confirmer = None
+
+        def start(timeout=None):
+            # Another thread finished starting one first
+            self.client._confirmer = self.confirmer
+
+        publisher_mock.return_value.start.side_effect = start
+
+        self.client.publish("body", routing_key="key", confirm=True)
+        publisher_mock.return_value.stop.assert_called_once_with()
+        self.assertTrue(self.confirmer.publish.called)
+        self.assertIs(self.confirmer, self.client._confirmer)
+
+
+@patch("bartender.pika.BlockingConnection")
+class SpoolPublishTest(unittest.TestCase):
+    def setUp(self):
+        self.spool = Mock()
+        self.spool.__len__ = Mock(return_value=0)
+        self.client = PikaClient(host="localhost", port=5672, spool=self.spool)
+
+        patcher = patch("bartender.pika.SpoolReplayer")
+        self.replayer_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_published(self, connection_mock):
+        self.client.publish("body", routing_key="key", spool=True)
+
+        channel = connection_mock.return_value.channel.return_value
+        self.assertEqual(1, channel.basic_publish.call_count)
+        self.assertFalse(self.spool.append.called)
+
+    def test_broker_down(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+
+        self.client.publish("body", routing_key="key", confirm=True, spool=True)
+        self.spool.append.assert_called_once_with(
+            "body", {"routing_key": "key", "confirm": True}
+        )
+        self.replayer_mock.return_value.start.assert_called_once_with()
+
+    def test_broker_down_not_spooled(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+
+        with self.assertRaises(AMQPConnectionError):
+            self.client.publish("body", routing_key="key")
+        self.assertFalse(self.spool.append.called)
+
+    def test_unroutable_not_spooled(self, connection_mock):
+        channel = connection_mock.return_value.channel.return_value
+        channel.basic_publish.side_effect = UnroutableError([])
+
+        with self.assertRaises(UnroutableError):
+            self.client.publish("body", routing_key="key", spool=True)
+        self.assertFalse(self.spool.append.called)
+
+    def test_backlog_spooled_in_order(self, connection_mock):
+        self.spool.__len__.return_value = 1
+
+        self.client.publish("body", routing_key="key", spool=True)
+        self.assertFalse(connection_mock.called)
+        self.spool.append.assert_called_once_with("body", {"routing_key": "key"})
+
+    def test_blocked(self, connection_mock):
+        self.client.publish("body", routing_key="key")
+        connection = connection_mock.return_value
+        connection.add_on_connection_blocked_callback.assert_called_once_with(
+            self.client._on_blocked
+        )
+
+        self.client._on_blocked(connection, Mock())
+        self.client.publish("body", routing_key="key", spool=True)
+        self.assertEqual(1, self.spool.append.call_count)
+
+        # Replaying a message means the broker has stopped blocking
+        self.client._replay("body", routing_key="key")
+        self.client.publish("body", routing_key="key", spool=True)
+        self.assertEqual(1, self.spool.append.call_count)
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="key"))
+    @patch.object(PikaClient, "_serialize", Mock(return_value="body"))
+    def test_publish_requests_broker_down(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+
+        results = self.client.publish_requests(
+            [Mock(id="id1"), Mock(id="id2")], confirm=True, spool=True
+        )
+        self.assertEqual({"id1": None, "id2": None}, results)
+        self.assertEqual(2, self.spool.append.call_count)
+        self.spool.append.assert_called_with(
+            "body",
+            {"routing_key": "key", "confirm": True, "headers": {"request_id": "id2"}},
+        )
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="key"))
+    @patch.object(PikaClient, "_serialize", Mock(return_value="body"))
+    def test_publish_requests_backlog_spooled(self, connection_mock):
+        self.spool.__len__.return_value = 1
+
+        results = self.client.publish_requests([Mock(id="id1")], spool=True)
+        self.assertEqual({"id1": None}, results)
+        self.assertFalse(connection_mock.called)
+        self.assertEqual(1, self.spool.append.call_count)
+
+    @patch("bartender.pika.get_routing_key", Mock(return_value="key"))
+    @patch.object(PikaClient, "_serialize", Mock(return_value="body"))
+    def test_publish_requests_unroutable_not_spooled(self, connection_mock):
+        channel = connection_mock.return_value.channel.return_value
+        channel.basic_publish.side_effect = UnroutableError([])
+        channel.is_closed = False
+
+        results = self.client.publish_requests([Mock(id="id1")], spool=True)
+        self.assertIsInstance(results["id1"], UnroutableError)
+        self.assertFalse(self.spool.append.called)
+
+    def test_leftover_messages_replayed(self, connection_mock):
+        self.spool.__len__.return_value = 3
+
+        PikaClient(host="localhost", port=5672, spool=self.spool)
+        self.replayer_mock.return_value.start.assert_called_once_with()
+
+    def test_dead_replayer_restarted(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+        self.client.publish("body", routing_key="key", spool=True)
+
+        self.replayer_mock.return_value.is_alive.return_value = False
+        self.client.publish("body", routing_key="key", spool=True)
+        self.assertEqual(2, self.replayer_mock.return_value.start.call_count)
+
+    def test_blocked_async_confirms(self, connection_mock):
+        client = PikaClient(
+            host="localhost", port=5672, spool=self.spool, async_confirms=True
+        )
+
+        with patch("bartender.pika.ConfirmingPublisher") as confirmer_mock:
+            client._confirmed_publish("body", {"routing_key": "key"})
+
+        _, kwargs = confirmer_mock.call_args
+        self.assertEqual(client._on_blocked, kwargs["on_blocked"])
+        self.assertEqual(client._on_unblocked, kwargs["on_unblocked"])
+
+    def test_close(self, connection_mock):
+        connection_mock.side_effect = AMQPConnectionError
+        self.client.publish("body", routing_key="key", spool=True)
+
+        self.client.close()
+        self.replayer_mock.return_value.stop.assert_called_once_with()
+        self.spool.close.assert_called_once_with()
+
+
+class ConfirmingPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.publisher = ConfirmingPublisher(Mock(), "exchange")
+        self.ioloop = self.publisher._ioloop
+        self.channel = Mock()
+        self.publisher._on_confirm_mode(self.channel, Mock())
+
+    def tearDown(self):
+        self.ioloop.close()
+
+    def _publish(self, mandatory=False, body="body"):
+        future = Future()
+        self.publisher._publish(
+            future, body, "key", BasicProperties(), mandatory=mandatory
+        )
+        return future
+
+    @staticmethod
+    def _frame(method):
+        return Mock(method=method)
+
+    def test_publish(self):
+        future = self._publish()
+
+        self.assertEqual(1, self.channel.basic_publish.call_count)
+        self.assertIsNone(
+            self.channel.basic_publish.call_args[1]["properties"].message_id
+        )
+        self.assertFalse(future.done())
+
+    def test_blocked_callbacks(self):
+        on_blocked, on_unblocked = Mock(), Mock()
+        publisher = ConfirmingPublisher(
+            Mock(), "exchange", on_blocked=on_blocked, on_unblocked=on_unblocked
+        )
+        connection = Mock()
+
+        try:
+            publisher._on_connection_open(connection)
+        finally:
+            publisher._ioloop.close()
+
+        connection.add_on_connection_blocked_callback.assert_called_once_with(
+            on_blocked
+        )
+        connection.add_on_connection_unblocked_callback.assert_called_once_with(
+            on_unblocked
+        )
+
+    def test_not_connected(self):
+        self.publisher._channel = None
+
+        with self.assertRaises(AMQPConnectionError):
+            self._publish().result(0)
+
+    def test_ack(self):
+        future = self._publish()
+
+        self.publisher._on_confirm(self._frame(Basic.Ack(delivery_tag=1)))
+        self.assertIsNone(future.result(0))
+
+    def test_multiple_ack(self):
+        futures = [self._publish() for _ in range(3)]
+
+        self.publisher._on_confirm(
+            self._frame(Basic.Ack(delivery_tag=2, multiple=True))
+        )
+        self.assertTrue(futures[0].done())
+        self.assertTrue(futures[1].done())
+        self.assertFalse(futures[2].done())
+
+    def test_nack(self):
+        future = self._publish()
+
+        self.publisher._on_confirm(self._frame(Basic.Nack(delivery_tag=1)))
+        with self.assertRaises(NackError):
+            future.result(0)
+
+    def test_returned(self):
+        futures = [
+            self._publish(),
+            self._publish(mandatory=True, body="other"),
+            self._publish(mandatory=True),
+            self._publish(mandatory=True),
+        ]
+
+        self.publisher._on_return(
+            self.channel, Basic.Return(routing_key="key"), BasicProperties(), "body"
+        )
+        self.publisher._on_confirm(
+            self._frame(Basic.Ack(delivery_tag=4, multiple=True))
+        )
+
+        with self.assertRaises(UnroutableError):
+            futures[2].result(0)
+        self.assertIsNone(futures[0].result(0))
+        self.assertIsNone(futures[1].result(0))
+        self.assertIsNone(futures[3].result(0))
+
+    def test_returned_unmatched(self):
+        future = self._publish()
+
+        self.publisher._on_return(
+            self.channel, Basic.Return(routing_key="key"), BasicProperties(), "body"
+        )
+        self.publisher._on_confirm(self._frame(Basic.Ack(delivery_tag=1)))
+        self.assertIsNone(future.result(0))
+
+    def test_channel_closed(self):
+        future = self._publish()
+        self.publisher._connection = Mock(is_open=True)
+
+        self.publisher._on_channel_closed(
+            self.channel, ChannelClosedByBroker(404, "NOT_FOUND")
+        )
+        with self.assertRaises(ChannelClosedByBroker):
+            future.result(0)
+        self.publisher._connection.channel.assert_called_once_with(
+            on_open_callback=self.publisher._on_channel_open
+        )
+
+    def test_connection_closed(self):
+        future = self._publish()
+        self.publisher._ioloop = Mock()
+
+        self.publisher._on_connection_closed(Mock(), StreamLostError())
+        with self.assertRaises(StreamLostError):
+            future.result(0)
+        self.publisher._ioloop.call_later.assert_called_once_with(
+            5, self.publisher._connect
+        )
+
+    def test_shutdown(self):
+        self.publisher._ioloop = Mock()
+        self.publisher._connection = Mock(is_open=True)
+
+        self.publisher._shutdown()
+        self.publisher._connection.close.assert_called_once_with()
+
+        self.publisher._on_connection_closed(Mock(), StreamLostError())
+        self.publisher._ioloop.stop.assert_called_once_with()
+        self.assertFalse(self.publisher._ioloop.call_later.called)
+
+    def test_tags_reset_on_new_channel(self):
+        self._publish()
+        self.publisher._on_confirm_mode(Mock(), Mock())
+
+        self.assertEqual(1, self.publisher._next_tag)
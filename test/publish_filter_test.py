@@ -0,0 +1,104 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from mock import MagicMock, Mock, patch
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from bartender.publish_filter import PublishFilter
+
+
+class PublishFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+        self.collection = self.db.__getitem__.return_value
+
+        patcher = patch(
+            "bartender.publish_filter.Request._get_db", Mock(return_value=self.db)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.filter = PublishFilter(window=300, max_size=2, claim_timeout=60)
+        self.request_id = ObjectId()
+
+    def test_disabled(self):
+        publish_filter = PublishFilter()
+
+        self.assertTrue(publish_filter.claim(self.request_id))
+        publish_filter.published(self.request_id)
+        publish_filter.release(self.request_id)
+        self.assertFalse(publish_filter.recently_published(self.request_id))
+        self.assertFalse(self.db.__getitem__.called)
+
+    def test_claim(self):
+        self.assertTrue(self.filter.claim(self.request_id))
+
+        (query, update), kwargs = self.collection.update_one.call_args
+        self.assertEqual(self.request_id, query["_id"])
+        self.assertFalse(query["published"])
+        self.assertTrue(kwargs["upsert"])
+
+        # Only a claim that was never published, and is older than the
+        # timeout, may be taken over
+        claimed_at = update["$set"]["claimed_at"]
+        self.assertEqual(claimed_at - timedelta(seconds=60), query["claimed_at"]["$lt"])
+
+    def test_claim_taken(self):
+        self.collection.update_one.side_effect = DuplicateKeyError("dup")
+        self.assertFalse(self.filter.claim(self.request_id))
+
+    def test_create_index(self):
+        self.filter.claim(self.request_id)
+        self.filter.claim(self.request_id)
+
+        self.db.__getitem__.assert_called_with("bartender_published_requests")
+        self.collection.create_index.assert_called_once_with(
+            [("claimed_at", 1)], expireAfterSeconds=300
+        )
+
+    def test_create_index_window_changed(self):
+        self.collection.create_index.side_effect = OperationFailure("conflict")
+
+        self.filter.claim(self.request_id)
+        self.db.command.assert_called_once_with(
+            "collMod",
+            "bartender_published_requests",
+            index={"keyPattern": {"claimed_at": 1}, "expireAfterSeconds": 300},
+        )
+
+    def test_published(self):
+        self.filter.published(self.request_id)
+
+        (query, update), _ = self.collection.update_one.call_args
+        self.assertEqual({"_id": self.request_id}, query)
+        self.assertTrue(update["$set"]["published"])
+        self.assertIsInstance(update["$set"]["claimed_at"], datetime)
+        self.assertTrue(self.filter.recently_published(str(self.request_id)))
+
+    def test_recently_published_expired(self):
+        self.filter.published(self.request_id)
+        self.filter._published[str(self.request_id)] = time.time() - 1
+
+        self.assertFalse(self.filter.recently_published(self.request_id))
+        self.assertEqual(0, len(self.filter._published))
+
+    def test_recently_published_bounded(self):
+        first, second, third = ObjectId(), ObjectId(), ObjectId()
+        for request_id in (first, second, third):
+            self.filter.published(request_id)
+
+        self.assertFalse(self.filter.recently_published(first))
+        self.assertTrue(self.filter.recently_published(second))
+        self.assertTrue(self.filter.recently_published(third))
+
+    def test_release(self):
+        self.filter.release(self.request_id)
+        self.collection.delete_one.assert_called_once_with(
+            {"_id": self.request_id, "published": False}
+        )
+
+    def test_release_error(self):
+        self.collection.delete_one.side_effect = OperationFailure("down")
+        self.filter.release(self.request_id)
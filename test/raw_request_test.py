@@ -0,0 +1,118 @@
+import datetime
+import unittest
+
+import mongoengine
+from bson import ObjectId
+from bson.dbref import DBRef
+from mock import patch
+
+from bartender.raw_request import RawRequest
+from bg_utils.mongo.models import Request
+from brewtils.schema_parser import SchemaParser
+
+
+def make_document(**kwargs):
+    document = {
+        "_id": ObjectId("5d1b6bab89b9e12d2b3f8e30"),
+        "system": "echo",
+        "system_version": "1.0.0",
+        "instance_name": "default",
+        "command": "say",
+        "parameters": {"message": u"héllo", "loud": True, "times": [1, 2.5]},
+        "status": "CREATED",
+        "created_at": datetime.datetime(2019, 7, 2, 12, 0, 0, 123000),
+    }
+    document.update(kwargs)
+    return document
+
+
+class RawRequestTest(unittest.TestCase):
+    def assertSerializesLikeModel(self, document):
+        expected = SchemaParser.serialize_request(Request._from_son(dict(document)))
+        self.assertEqual(expected, RawRequest(dict(document)).serialize())
+
+    def test_to_message(self):
+        document = make_document()
+        self.assertEqual(
+            SchemaParser.serialize_request(
+                Request._from_son(dict(document)), to_string=False
+            ),
+            RawRequest(dict(document)).to_message(),
+        )
+
+    def test_serialize(self):
+        self.assertSerializesLikeModel(
+            make_document(
+                command_type="ACTION",
+                output_type="STRING",
+                comment="comment",
+                metadata={"key": "value"},
+                updated_at=datetime.datetime(2019, 7, 2, 12, 0, 1, 456789),
+                has_parent=False,
+                requester="user",
+                output="output",
+                error_class="ValueError",
+            )
+        )
+
+    def test_serialize_minimal(self):
+        document = make_document()
+        del document["parameters"]
+        del document["status"]
+
+        self.assertSerializesLikeModel(document)
+
+    def test_serialize_with_parent(self):
+        request = RawRequest(make_document(parent=DBRef("request", ObjectId())))
+        with self.assertRaises(ValueError):
+            request.serialize()
+
+    def test_attributes(self):
+        request = RawRequest({"_id": "id"})
+        self.assertEqual("id", request.id)
+        self.assertEqual("CREATED", request.status)
+        self.assertIsNone(request.command_type)
+
+        request.parameters["key"] = "value"
+        request.command_type = "ACTION"
+        self.assertEqual(
+            {
+                "_id": "id",
+                "status": "CREATED",
+                "parameters": {"key": "value"},
+                "command_type": "ACTION",
+            },
+            request.to_mongo(),
+        )
+
+    def test_validate(self):
+        RawRequest(make_document(command_type="ACTION")).validate()
+
+        with self.assertRaises(mongoengine.ValidationError):
+            RawRequest(make_document(command_type="NOT_A_TYPE")).validate()
+
+        with self.assertRaises(mongoengine.ValidationError):
+            RawRequest(make_document(parameters={"$key": 1})).validate()
+
+    def test_to_model(self):
+        request = RawRequest(make_document()).to_model()
+        self.assertIsInstance(request, Request)
+        self.assertEqual("say", request.command)
+
+    @patch("bartender.raw_request.Request")
+    def test_find(self, request_mock):
+        collection = request_mock._get_collection.return_value
+        collection.find_one.return_value = make_document()
+
+        request = RawRequest.find("5d1b6bab89b9e12d2b3f8e30")
+        self.assertEqual("say", request.command)
+        collection.find_one.assert_called_once_with(
+            {"_id": ObjectId("5d1b6bab89b9e12d2b3f8e30")}
+        )
+
+    @patch("bartender.raw_request.Request")
+    def test_find_missing(self, request_mock):
+        request_mock._get_collection.return_value.find_one.return_value = None
+
+        self.assertIsNone(RawRequest.find("5d1b6bab89b9e12d2b3f8e30"))
+        self.assertIsNone(RawRequest.find("not_an_id"))
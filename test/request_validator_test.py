@@ -1,7 +1,15 @@
+import copy
+import socket
+import threading
+import time
+
 import pytest
+import requests.exceptions
 from box import Box
-from mock import Mock, call, patch
+from mock import ANY, Mock, call, patch
 
+from bartender.catalog import CachedSystem
+from bartender.connection_pool import HttpPool
 from bartender.request_validator import RequestValidator
 from bg_utils.mongo.models import Command, Parameter, Request, System, Choices
 from brewtils.errors import ModelValidationError
@@ -17,7 +25,17 @@ def config_mock():
             "ssl_enabled": False,
             "url_prefix": None,
             "ca_cert": None,
-        }
+        },
+        validator={
+            "catalog": {"ttl": 10},
+            "choices": {
+                "cache": {"max_size": 10, "ttl": 0, "stale_ttl": 0, "prewarm": False},
+                "max_workers": 2,
+                "timeout": 30,
+                "breaker": {"failure_threshold": 2, "reset_timeout": 30},
+                "bulkhead": {"max_concurrent": 2},
+            },
+        },
     )
 
 
@@ -28,6 +46,13 @@ def system_find(monkeypatch):
     return find_mock
 
 
+@pytest.fixture
+def command_load(monkeypatch):
+    load_mock = Mock()
+    monkeypatch.setattr(CachedSystem, "load_for_command", load_mock)
+    return load_mock
+
+
 @pytest.fixture
 def validator(monkeypatch, config_mock):
     monkeypatch.setattr("bartender.config", config_mock)
@@ -79,25 +104,90 @@ class TestSessionConfig(object):
     def test_no_verify(self, validator):
         assert validator._session.verify is False
 
+    def test_http_pool(self, monkeypatch, config_mock):
+        monkeypatch.setattr("bartender.config", config_mock)
+        pool_mock = Mock()
+        monkeypatch.setattr("bartender.http_pool", pool_mock)
+
+        validator = RequestValidator()
+        pool_mock.mount.assert_has_calls(
+            [
+                call(validator._session, retries=False),
+                call(validator._client._easy_client.client.session, retries=False),
+            ]
+        )
+
+    def test_blackholed_lookup_single_attempt(self, monkeypatch, config_mock):
+        config_mock.validator.choices.timeout = 0.5
+        monkeypatch.setattr("bartender.config", config_mock)
+        monkeypatch.setattr("bartender.http_pool", HttpPool(retries=3))
+        validator = RequestValidator()
+
+        attempts = []
+
+        def blackholed(address, timeout=None, **kwargs):
+            attempts.append(address)
+            time.sleep(timeout)
+            raise socket.timeout()
+
+        monkeypatch.setattr("urllib3.util.connection.create_connection", blackholed)
+        command = Mock(
+            parameters=[
+                make_param(
+                    key="p",
+                    optional=False,
+                    choices=Choices(type="url", value="http://blackholed"),
+                )
+            ]
+        )
+
+        start = time.time()
+        with pytest.raises(ModelValidationError):
+            validator.get_and_validate_parameters(
+                make_request(parameters={"p": "a"}), command
+            )
+
+        assert len(attempts) == 1
+        assert time.time() - start < 2 * config_mock.validator.choices.timeout
+
 
 class TestValidateRequest(object):
-    def test_success(self, validator, system_find, bg_system, bg_request):
+    def test_success(self, validator, system_find, command_load, bg_system, bg_request):
         system_find.return_value = bg_system
+        command_load.return_value = CachedSystem.from_system(bg_system)
         assert validator.validate_request(bg_request) == bg_request
 
 
 class TestGetAndValidateSystem(object):
-    def test_success(self, validator, system_find, bg_system, bg_request):
+    def test_success(self, validator, command_load, bg_system, bg_request):
+        command_load.return_value = CachedSystem.from_system(bg_system)
+
+        system = validator.get_and_validate_system(bg_request)
+        assert system.name == bg_system.name
+        assert system.version == bg_system.version
+        assert system.instance_names == set(bg_system.instance_names)
+        command_load.assert_called_once_with(
+            bg_request.system, bg_request.system_version, bg_request.command
+        )
+
+    def test_catalog_used(
+        self, validator, system_find, command_load, bg_system, bg_request
+    ):
         system_find.return_value = bg_system
-        assert validator.get_and_validate_system(bg_request) == bg_system
+        validator.catalog.get(bg_system.name, bg_system.version)
+
+        validator.get_and_validate_system(bg_request)
+        validator.get_and_validate_system(bg_request)
+        assert system_find.call_count == 1
+        assert command_load.called is False
 
-    def test_missing_system(self, validator, system_find, bg_request):
-        system_find.return_value = None
+    def test_missing_system(self, validator, command_load, bg_request):
+        command_load.return_value = None
         with pytest.raises(ModelValidationError):
             validator.get_and_validate_system(bg_request)
 
-    def test_invalid_instance(self, validator, system_find, bg_system, bg_request):
-        system_find.return_value = bg_system
+    def test_invalid_instance(self, validator, command_load, bg_system, bg_request):
+        command_load.return_value = CachedSystem.from_system(bg_system)
         bg_request.instance_name = "INVALID"
 
         with pytest.raises(ModelValidationError):
@@ -125,6 +215,20 @@ class TestGetAndValidateCommandForSystem(object):
         )
         assert validator.get_and_validate_command_for_system(bg_request) == bg_command
 
+    def test_cached_system(self, validator, bg_system, bg_request, bg_command):
+        command = validator.get_and_validate_command_for_system(
+            bg_request, system=CachedSystem.from_system(bg_system)
+        )
+        assert command.name == bg_command.name
+        assert command.command_type == bg_command.command_type
+
+    def test_cached_system_missing_command(self, validator, bg_system, bg_request):
+        bg_request.command = "BAD"
+        with pytest.raises(ModelValidationError):
+            validator.get_and_validate_command_for_system(
+                bg_request, system=CachedSystem.from_system(bg_system)
+            )
+
     def test_command_type(self, validator, bg_system, bg_request):
         bg_request.command_type = None
 
@@ -210,7 +314,8 @@ class TestGetAndValidateParameters(object):
         validate_mock.side_effect = lambda w, x, y, z: w
 
         validator.get_and_validate_parameters(req, command)
-        validate_mock.assert_called_once_with("value1", command_parameter, command, req)
+        validate_mock.assert_called_once_with("value1", ANY, command, req)
+        assert validate_mock.call_args[0][1].key == command_parameter.key
 
     @patch(
         "bartender.request_validator.RequestValidator._validate_parameter_based_on_type"
@@ -224,9 +329,8 @@ class TestGetAndValidateParameters(object):
         validate_mock.side_effect = lambda w, x, y, z: w
 
         validator.get_and_validate_parameters(req, command)
-        validate_mock.assert_called_once_with(
-            "default_value", command_parameter, command, req
-        )
+        validate_mock.assert_called_once_with("default_value", ANY, command, req)
+        assert validate_mock.call_args[0][1].key == command_parameter.key
 
     @patch(
         "bartender.request_validator.RequestValidator._validate_parameter_based_on_type"
@@ -241,12 +345,10 @@ class TestGetAndValidateParameters(object):
 
         validator.get_and_validate_parameters(req, command)
         validate_mock.assert_has_calls(
-            [
-                call(1, command_parameter, command, req),
-                call(2, command_parameter, command, req),
-            ],
-            any_order=True,
+            [call(1, ANY, command, req), call(2, ANY, command, req)], any_order=True
         )
+        for validate_call in validate_mock.call_args_list:
+            assert validate_call[0][1].key == command_parameter.key
 
     def test_update_and_validate_parameter_extract_parameter_multi_not_list(
         self, validator
@@ -639,6 +741,7 @@ class TestValidateChoices(object):
         validator.get_and_validate_parameters(req, command)
         mock_client.send_bg_request.assert_called_with(
             _command="c2",
+            _timeout=30,
             _system_name="s1",
             _system_version="1",
             _instance_name="i1",
@@ -676,6 +779,7 @@ class TestValidateChoices(object):
         validator.get_and_validate_parameters(req, command)
         mock_client.send_bg_request.assert_called_with(
             _command="c2",
+            _timeout=30,
             _system_name="s1",
             _system_version="1",
             _instance_name=req.instance_name,
@@ -805,7 +909,7 @@ class TestValidateChoices(object):
         command = Mock(parameters=[command_parameter])
 
         validator.get_and_validate_parameters(req, command)
-        session_mock.get.assert_called_with("http://localhost", params={})
+        session_mock.get.assert_called_with("http://localhost", params={}, timeout=30)
 
     def test_validate_command_choices_dict_value(self, validator):
         mock_client = Mock()
@@ -838,6 +942,7 @@ class TestValidateChoices(object):
         validator.get_and_validate_parameters(request, command)
         mock_client.send_bg_request.assert_called_with(
             _command="command_name",
+            _timeout=30,
             _system_name="foo",
             _system_version="0.0.1",
             _instance_name="default",
@@ -891,6 +996,7 @@ class TestValidateChoices(object):
         validator.get_and_validate_parameters(request, command)
         mock_client.send_bg_request.assert_called_with(
             _command="command_name",
+            _timeout=30,
             _system_name="foo",
             _system_version="0.0.1",
             _instance_name="instance_name",
@@ -921,6 +1027,7 @@ class TestValidateChoices(object):
         validator.get_and_validate_parameters(request, command)
         mock_client.send_bg_request.assert_called_with(
             _command="command_name",
+            _timeout=30,
             _system_name="foo",
             _system_version="0.0.1",
             _instance_name="instance_name",
@@ -1000,3 +1107,492 @@ class TestValidateChoices(object):
 
         with pytest.raises(ModelValidationError):
             validator.get_and_validate_parameters(request, command)
+
+
+class TestGetPlan(object):
+    def test_cached_command(self, validator, bg_system):
+        command = CachedSystem.from_system(bg_system).commands[0]
+        assert validator.get_plan(command) is validator.get_plan(command)
+
+    def test_uncached_command(self, validator, bg_command):
+        assert validator.get_plan(bg_command) is not validator.get_plan(bg_command)
+
+    def test_max_plans(self, validator, bg_system):
+        validator.MAX_PLANS = 1
+        command = CachedSystem.from_system(bg_system).commands[0]
+
+        validator.get_plan(command)
+        validator.get_plan(command._replace(fingerprint="other"))
+        assert list(validator._plans) == ["other"]
+
+
+class TestValidateRequests(object):
+    def test_shared_system_lookup(self, validator, system_find, bg_system, bg_request):
+        system_find.return_value = bg_system
+        requests = [bg_request, copy.deepcopy(bg_request)]
+
+        validated, failures = validator.validate_requests(requests)
+        assert validated == requests
+        assert failures == {}
+        system_find.assert_called_once_with(bg_system.name, bg_system.version)
+
+    def test_failure_isolated(self, validator, system_find, bg_system, bg_request):
+        system_find.return_value = bg_system
+        bad_request = copy.deepcopy(bg_request)
+        bad_request.id = "bad_id"
+        bad_request.instance_name = "INVALID"
+
+        validated, failures = validator.validate_requests([bad_request, bg_request])
+        assert validated == [bg_request]
+        assert isinstance(failures["bad_id"], ModelValidationError)
+
+
+class TestChoicesCache(object):
+    @pytest.fixture
+    def url_command(self):
+        return Mock(
+            parameters=[
+                Parameter(
+                    key="key1",
+                    optional=False,
+                    choices=Choices(
+                        type="url", value="http://localhost", details={"cache_ttl": 60}
+                    ),
+                )
+            ]
+        )
+
+    def test_per_parameter_ttl(self, validator, url_command):
+        session_mock = Mock()
+        session_mock.get.return_value.text = '["value"]'
+        validator._session = session_mock
+
+        req = Request(system="foo", command="command1", parameters={"key1": "value"})
+        validator.get_and_validate_parameters(req, url_command)
+        validator.get_and_validate_parameters(req, url_command)
+        assert session_mock.get.call_count == 1
+
+    def test_different_arguments(self, validator):
+        mock_client = Mock()
+        mock_client.send_bg_request.return_value.output = '["1"]'
+        validator._client = mock_client
+
+        command = Mock(
+            parameters=[
+                make_param(key="p1", choices=Mock(type="static", value=["a", "b"])),
+                make_param(
+                    key="p2",
+                    optional=False,
+                    choices=Choices(
+                        type="command", value="c2(p=${p1})", details={"cache_ttl": 60}
+                    ),
+                ),
+            ]
+        )
+
+        for p1 in ("a", "b", "a"):
+            validator.get_and_validate_parameters(
+                make_request(parameters={"p1": p1, "p2": "1"}), command
+            )
+        assert mock_client.send_bg_request.call_count == 2
+
+    def test_warm_choices(self, validator, url_command):
+        validator._choices_prewarm = True
+        validator._choices_pool = Mock()
+        validator.catalog = Mock()
+        validator.catalog.get.return_value = Mock(
+            instance_names=frozenset(["i1"]), commands=[url_command]
+        )
+
+        validator.warm_choices("system", "1.0.0")
+        validator._choices_pool.submit.assert_called_once_with(
+            validator._warm_choices, ("url", "http://localhost", "{}"), ANY, 60
+        )
+
+    def test_warm_choices_loads(self, validator, url_command):
+        validator._choices_prewarm = True
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["value"]'
+        validator.catalog = Mock()
+        validator.catalog.get.return_value = Mock(
+            instance_names=frozenset(["i1"]), commands=[url_command]
+        )
+
+        validator.warm_choices("system", "1.0.0")
+        validator._choices_pool.shutdown(wait=True)
+        assert len(validator._choices_cache) == 1
+        assert validator._choices_busy == 0
+
+    def test_warm_choices_deduplicated(self, validator, url_command):
+        validator._choices_prewarm = True
+        validator._choices_pool = Mock()
+        validator.catalog = Mock()
+        validator.catalog.get.return_value = Mock(
+            instance_names=frozenset(["i1", "i2", "i3"]),
+            commands=[
+                url_command,
+                Mock(
+                    parameters=[
+                        Parameter(
+                            key="key2",
+                            choices=Choices(
+                                type="url", value="http://localhost?i=${instance_name}"
+                            ),
+                        )
+                    ]
+                ),
+            ],
+        )
+
+        validator.warm_choices("system", "1.0.0")
+        assert validator._choices_pool.submit.call_count == 4
+
+    def test_warm_choices_error(self, validator):
+        validator._choices_cache = Mock()
+        validator._choices_cache.get.side_effect = ValueError("lookup failed")
+
+        validator._warm_choices(("url", "http://localhost", "{}"), Mock(), None)
+
+    def test_warm_choices_skips_dependent(self, validator):
+        validator._choices_prewarm = True
+        validator._choices_pool = Mock()
+        validator.catalog = Mock()
+        validator.catalog.get.return_value = Mock(
+            instance_names=frozenset(["i1"]),
+            commands=[
+                Mock(
+                    parameters=[
+                        Parameter(
+                            key="key1",
+                            choices=Choices(type="command", value="c2(p=${p1})"),
+                        )
+                    ]
+                )
+            ],
+        )
+
+        validator.warm_choices("system", "1.0.0")
+        assert not validator._choices_pool.submit.called
+
+    def test_warm_choices_disabled(self, validator):
+        validator.catalog = Mock()
+
+        validator.warm_choices("system", "1.0.0")
+        assert not validator.catalog.get.called
+
+
+class TestPrefetchChoices(object):
+    @pytest.fixture
+    def command(self):
+        return Mock(
+            parameters=[
+                make_param(
+                    key="p%d" % i,
+                    optional=False,
+                    choices=Choices(type="url", value="http://localhost/%d" % i),
+                )
+                for i in range(2)
+            ]
+        )
+
+    @pytest.fixture
+    def request_(self):
+        return make_request(parameters={"p0": "a", "p1": "b"})
+
+    def test_concurrent(self, validator, command, request_):
+        calls = []
+        overlapped = []
+        both_started = threading.Event()
+
+        def get(address, params=None, timeout=None):
+            calls.append(address)
+            if len(calls) == 2:
+                both_started.set()
+
+            # Only returns True if the other lookup is running at the same time
+            overlapped.append(both_started.wait(5))
+            return Mock(text='["a", "b"]')
+
+        validator._session = Mock(get=Mock(side_effect=get))
+
+        assert validator.get_and_validate_parameters(request_, command) == {
+            "p0": "a",
+            "p1": "b",
+        }
+        assert overlapped == [True, True]
+
+    def test_lookup_error(self, validator, command, request_):
+        validator._session = Mock()
+        validator._session.get.side_effect = ValueError("lookup failed")
+
+        with pytest.raises(ValueError):
+            validator.get_and_validate_parameters(request_, command)
+
+    def test_invalid_value(self, validator, command, request_):
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["a"]'
+
+        with pytest.raises(ModelValidationError):
+            validator.get_and_validate_parameters(request_, command)
+
+    def test_single_lookup(self, validator, request_):
+        validator._choices_pool = Mock()
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["a"]'
+        command = Mock(
+            parameters=[
+                make_param(
+                    key="p0",
+                    optional=False,
+                    choices=Choices(type="url", value="http://localhost"),
+                ),
+                make_param(key="p1"),
+            ]
+        )
+
+        validator.get_and_validate_parameters(request_, command)
+        assert validator._choices_pool.submit.called is False
+
+    def test_first_lookup_inline(self, validator, command, request_):
+        threads = {}
+
+        def get(address, params=None, timeout=None):
+            threads[address] = threading.current_thread()
+            return Mock(text='["a", "b"]')
+
+        validator._session = Mock(get=Mock(side_effect=get))
+
+        validator.get_and_validate_parameters(request_, command)
+        assert threads["http://localhost/0"] is threading.current_thread()
+        assert threads["http://localhost/1"] is not threading.current_thread()
+
+    def test_pool_busy(self, validator, command, request_):
+        validator._choices_pool = Mock()
+        validator._choices_busy = validator._choices_workers
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["a", "b"]'
+
+        validator.get_and_validate_parameters(request_, command)
+        assert validator._choices_pool.submit.called is False
+        assert validator._session.get.call_count == 2
+
+    def test_pool_thread_released(self, validator, command, request_):
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["a", "b"]'
+
+        validator.get_and_validate_parameters(request_, command)
+        validator._choices_pool.shutdown(wait=True)
+        assert validator._choices_busy == 0
+
+    def test_shutdown(self, validator):
+        validator._choices_pool = Mock()
+
+        validator.shutdown()
+        validator._choices_pool.shutdown.assert_called_once_with(wait=False)
+
+
+class TestGuardedChoices(object):
+    @pytest.fixture
+    def command(self):
+        return Mock(
+            parameters=[
+                make_param(
+                    key="p0",
+                    optional=False,
+                    choices=Choices(type="url", value="http://localhost/choices"),
+                )
+            ]
+        )
+
+    @pytest.fixture
+    def request_(self):
+        return make_request(parameters={"p0": "a"})
+
+    def test_timeout(self, validator, command, request_):
+        validator._session = Mock()
+        validator._session.get.side_effect = requests.exceptions.Timeout
+
+        with pytest.raises(ModelValidationError) as ex:
+            validator.get_and_validate_parameters(request_, command)
+        assert "timed out" in str(ex.value)
+
+    def test_parameter_timeout(self, validator, request_):
+        validator._session = Mock()
+        validator._session.get.return_value.text = '["a"]'
+        command = Mock(
+            parameters=[
+                make_param(
+                    key="p0",
+                    optional=False,
+                    choices=Choices(
+                        type="url", value="http://localhost", details={"timeout": 5}
+                    ),
+                )
+            ]
+        )
+
+        validator.get_and_validate_parameters(request_, command)
+        validator._session.get.assert_called_once_with(
+            "http://localhost", params={}, timeout=5
+        )
+
+    def test_circuit_open(self, validator, command, request_):
+        validator._session = Mock()
+        validator._session.get.side_effect = requests.exceptions.ConnectionError
+
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectionError):
+                validator.get_and_validate_parameters(request_, command)
+
+        with pytest.raises(ModelValidationError) as ex:
+            validator.get_and_validate_parameters(request_, command)
+        assert "unavailable" in str(ex.value)
+        assert validator._session.get.call_count == 2
+
+    def test_circuit_counts_attempts(self, monkeypatch, config_mock, command, request_):
+        monkeypatch.setattr("bartender.config", config_mock)
+        monkeypatch.setattr("bartender.http_pool", HttpPool(retries=3))
+        validator = RequestValidator()
+
+        attempts = []
+
+        def refused(address, timeout=None, **kwargs):
+            attempts.append(address)
+            raise socket.error("Connection refused")
+
+        monkeypatch.setattr("urllib3.util.connection.create_connection", refused)
+
+        # The breaker opens after failure_threshold attempts, not lookups
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectionError):
+                validator.get_and_validate_parameters(request_, command)
+        assert len(attempts) == 2
+
+        with pytest.raises(ModelValidationError) as ex:
+            validator.get_and_validate_parameters(request_, command)
+        assert "unavailable" in str(ex.value)
+        assert len(attempts) == 2
+
+    def test_invalid_response_not_failure(self, validator, request_):
+        mock_client = Mock()
+        mock_client.send_bg_request.return_value.output = "[]"
+        validator._client = mock_client
+        command = Mock(
+            parameters=[
+                make_param(
+                    key="p0",
+                    optional=False,
+                    choices=Choices(type="command", value="c2"),
+                )
+            ]
+        )
+
+        for _ in range(3):
+            with pytest.raises(ModelValidationError) as ex:
+                validator.get_and_validate_parameters(request_, command)
+            assert "empty list" in str(ex.value)
+
+    def test_bulkhead_full(self, validator, command, request_):
+        validator._choices_guard._get("localhost")[1].acquire()
+        validator._choices_guard._get("localhost")[1].acquire()
+
+        with pytest.raises(ModelValidationError) as ex:
+            validator.get_and_validate_parameters(request_, command)
+        assert "in progress" in str(ex.value)
+
+
+class TestMultiValues(object):
+    @pytest.mark.parametrize(
+        "param_type,values,expected",
+        [
+            ("Integer", list(range(10000)), list(range(10000))),
+            ("Float", [1, 2.5], [1.0, 2.5]),
+            ("String", ["a", "b"], ["a", "b"]),
+        ],
+    )
+    def test_bulk_conversion(self, validator, param_type, values, expected):
+        command = Mock(
+            parameters=[
+                Parameter(key="p1", type=param_type, multi=True, optional=False)
+            ]
+        )
+        req = make_request(parameters={"p1": values})
+
+        with patch.object(validator, "_validate_parameter_based_on_type") as type_mock:
+            assert validator.get_and_validate_parameters(req, command) == {
+                "p1": expected
+            }
+            assert type_mock.called is False
+
+    @pytest.mark.parametrize(
+        "param_type,values,nullable",
+        [("Integer", [1, "a"], False), ("Any", [1, None], False)],
+    )
+    def test_bulk_conversion_fails(self, validator, param_type, values, nullable):
+        command = Mock(
+            parameters=[
+                Parameter(
+                    key="p1",
+                    type=param_type,
+                    multi=True,
+                    optional=False,
+                    nullable=nullable,
+                )
+            ]
+        )
+        req = make_request(parameters={"p1": values})
+
+        with pytest.raises(ModelValidationError):
+            validator.get_and_validate_parameters(req, command)
+
+    def test_large_static_choices(self, validator):
+        allowed = list(range(10000))
+        command = Mock(
+            parameters=[
+                Parameter(
+                    key="p1",
+                    type="Integer",
+                    multi=True,
+                    optional=False,
+                    choices=Choices(type="static", value=allowed),
+                )
+            ]
+        )
+        req = make_request(parameters={"p1": list(reversed(allowed))})
+
+        params = validator.get_and_validate_parameters(req, command)
+        assert params["p1"] == list(reversed(allowed))
+
+    def test_first_invalid_choice_named(self, validator):
+        command = Mock(
+            parameters=[
+                Parameter(
+                    key="p1",
+                    type="Integer",
+                    multi=True,
+                    optional=False,
+                    choices=Choices(type="static", value=[1, 2, 3]),
+                )
+            ]
+        )
+        req = make_request(parameters={"p1": [1, 4, 5]})
+
+        with pytest.raises(ModelValidationError) as ex:
+            validator.get_and_validate_parameters(req, command)
+        assert "Value '4'" in str(ex.value)
+
+    def test_unhashable_choices(self, validator):
+        command = Mock(
+            parameters=[
+                Parameter(
+                    key="p1",
+                    type="Dictionary",
+                    multi=True,
+                    optional=False,
+                    choices=Choices(type="static", value=[{"value": {"a": 1}}]),
+                )
+            ]
+        )
+        req = make_request(parameters={"p1": [{"a": 1}]})
+
+        assert validator.get_and_validate_parameters(req, command) == {"p1": [{"a": 1}]}
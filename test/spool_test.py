@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from mock import Mock, call, patch
+from pika.exceptions import AMQPConnectionError, UnroutableError
+
+from bartender.errors import SpoolFullError
+from bartender.spool import PublishSpool, SpoolReplayer
+
+
+class PublishSpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = PublishSpool(self.directory, segment_size=200)
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.directory)
+
+    def _segments(self, spool):
+        return sorted(name for name in os.listdir(spool.path) if name.endswith(".seg"))
+
+    def test_append_peek_consume(self):
+        self.spool.append(u"first ☃", {"routing_key": "a", "confirm": True})
+        self.spool.append(b"\x00second", {"routing_key": "b"})
+
+        self.assertEqual(2, len(self.spool))
+        self.assertEqual(
+            [
+                (u"first ☃", {"routing_key": "a", "confirm": True}),
+                (b"\x00second", {"routing_key": "b"}),
+            ],
+            self.spool.peek(10),
+        )
+
+        self.spool.consume(1)
+        self.assertEqual([(b"\x00second", {"routing_key": "b"})], self.spool.peek(10))
+
+        self.spool.consume(1)
+        self.assertEqual([], self.spool.peek(10))
+        self.assertEqual(0, self.spool.stats()["bytes"])
+
+    def test_segments_rotated_and_removed(self):
+        for index in range(10):
+            self.spool.append("message %d" % index, {"routing_key": "key"})
+        self.assertGreater(len(self._segments(self.spool)), 1)
+
+        self.spool.consume(10)
+        self.assertEqual(1, len(self._segments(self.spool)))
+
+    def test_recover(self):
+        for index in range(10):
+            self.spool.append("message %d" % index, {"routing_key": "key"})
+        self.spool.consume(4)
+        self.spool.close()
+
+        self.spool = PublishSpool(self.directory, segment_size=200)
+        self.assertEqual(6, len(self.spool))
+        self.assertEqual("message 4", self.spool.peek(1)[0][0])
+
+        # New messages go after the recovered ones
+        self.spool.append("message 10", {"routing_key": "key"})
+        self.assertEqual(
+            ["message %d" % index for index in range(4, 11)],
+            [message for message, _ in self.spool.peek(10)],
+        )
+
+    def test_recover_torn_write(self):
+        self.spool.append("whole", {"routing_key": "key"})
+        self.spool.close()
+
+        last = os.path.join(self.spool.path, self._segments(self.spool)[-1])
+        with open(last, "ab") as segment_file:
+            segment_file.write(b"\x00\x00\x00\x01\x00")
+
+        self.spool = PublishSpool(self.directory, segment_size=200)
+        self.assertEqual([("whole", {"routing_key": "key"})], self.spool.peek(10))
+
+        self.spool.append("next", {"routing_key": "key"})
+        self.assertEqual(2, len(self.spool.peek(10)))
+
+    def test_peek_corrupt(self):
+        self.spool.append("good", {})
+        self.spool.append("bad", {})
+        record = self.spool._records[1]
+        with open(self.spool._segment_path(record.segment), "r+b") as segment_file:
+            segment_file.seek(record.end - 1)
+            segment_file.write(b"X")
+
+        # Messages before the corrupt one are still handed back
+        self.assertEqual([("good", {})], self.spool.peek(10))
+
+        self.spool.consume(1)
+        with self.assertRaises(ValueError):
+            self.spool.peek(10)
+
+    def test_slot_per_process(self):
+        other = PublishSpool(self.directory)
+        try:
+            self.assertNotEqual(self.spool.path, other.path)
+        finally:
+            other.close()
+
+    def test_full(self):
+        spool = PublishSpool(self.directory, max_size=100)
+        try:
+            spool.append("x" * 10, {})
+            with self.assertRaises(SpoolFullError):
+                spool.append("x" * 100, {})
+        finally:
+            spool.close()
+
+    def test_stats(self):
+        self.assertEqual(
+            {"messages": 0, "bytes": 0, "oldest_age": 0}, self.spool.stats()
+        )
+
+        self.spool.append("message", {})
+        stats = self.spool.stats()
+        self.assertEqual(1, stats["messages"])
+        self.assertGreater(stats["bytes"], len("message"))
+        self.assertGreaterEqual(stats["oldest_age"], 0)
+
+    def test_wait(self):
+        self.assertFalse(self.spool.wait(0))
+        self.spool.append("message", {})
+        self.assertTrue(self.spool.wait(0))
+
+
+class SpoolReplayerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = PublishSpool(self.directory)
+        self.publish = Mock()
+        self.replayer = SpoolReplayer(self.spool, self.publish, retry_interval=0)
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.directory)
+
+    def test_replay(self):
+        self.spool.append("one", {"routing_key": "a"})
+        self.spool.append("two", {"routing_key": "b"})
+
+        self.assertEqual(2, self.replayer._replay(self.spool.peek(10)))
+        self.publish.assert_has_calls(
+            [call("one", routing_key="a"), call("two", routing_key="b")]
+        )
+
+    def test_replay_broker_down(self):
+        self.publish.side_effect = [None, AMQPConnectionError]
+        messages = [("one", {}), ("two", {}), ("three", {})]
+
+        self.assertEqual(1, self.replayer._replay(messages))
+
+    def test_replay_confirm_timeout(self):
+        self.publish.side_effect = [None, FutureTimeoutError]
+        messages = [("one", {}), ("two", {}), ("three", {})]
+
+        self.assertEqual(1, self.replayer._replay(messages))
+
+    def test_replay_error_dropped(self):
+        self.publish.side_effect = [ValueError, None]
+
+        self.assertEqual(2, self.replayer._replay([("one", {}), ("two", {})]))
+
+    def test_replay_refused_dropped(self):
+        self.publish.side_effect = [UnroutableError([]), None]
+
+        self.assertEqual(2, self.replayer._replay([("one", {}), ("two", {})]))
+
+    def test_run(self):
+        self.spool.append("one", {"routing_key": "a"})
+        self.spool.append("two", {"routing_key": "b"})
+
+        # Broker is down for the first attempt
+        self.publish.side_effect = [AMQPConnectionError, None, None]
+        self.replayer.stopped = lambda: self.publish.call_count == 3
+
+        self.replayer.run()
+        self.assertEqual(0, len(self.spool))
+        self.assertEqual(3, self.publish.call_count)
+
+    def test_run_corrupt_message_dropped(self):
+        self.spool.append("one", {"routing_key": "a"})
+        self.spool.append("two", {"routing_key": "b"})
+        self.replayer.stopped = lambda: not len(self.spool)
+
+        with patch.object(
+            self.spool, "peek", side_effect=[ValueError("bad"), [("two", {})]]
+        ):
+            self.replayer.run()
+
+        self.publish.assert_called_once_with("two")
+
+    def test_run_read_error_retried(self):
+        self.spool.append("one", {"routing_key": "a"})
+        self.replayer.stopped = lambda: self.publish.called
+
+        with patch.object(self.spool, "peek", side_effect=[IOError, [("one", {})]]):
+            self.replayer.run()
+
+        self.assertEqual(0, len(self.spool))
+        self.publish.assert_called_once_with("one")
+
+    def test_stop(self):
+        self.replayer.stop()
+        self.assertTrue(self.replayer.stopped())
+        self.assertTrue(self.spool.wait(0))
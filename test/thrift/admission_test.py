@@ -0,0 +1,55 @@
+import pytest
+from mock import patch
+
+from bartender.thrift.admission import AdmissionQueue, SERVER_BUSY, server_busy
+
+
+@pytest.fixture
+def admission():
+    return AdmissionQueue(max_depth=2, max_wait=10)
+
+
+class TestAdmissionQueue(object):
+    def test_try_enter(self, admission):
+        assert admission.try_enter() is True
+        assert admission.try_enter() is True
+        assert admission.try_enter() is False
+
+        stats = admission.stats()
+        assert stats["depth"] == 2
+        assert stats["admitted"] == 2
+        assert stats["rejected"] == 1
+
+    def test_unbounded(self):
+        admission = AdmissionQueue()
+
+        for _ in range(1000):
+            assert admission.try_enter() is True
+
+    @patch("bartender.thrift.admission.time")
+    def test_start(self, time_mock, admission):
+        time_mock.time.return_value = 105
+        admission.try_enter()
+        admission.try_enter()
+
+        assert admission.start(100) is True
+        assert admission.start(90) is False
+
+        stats = admission.stats()
+        assert stats["depth"] == 0
+        assert stats["expired"] == 1
+        assert stats["average_wait"] == 10
+        assert stats["longest_wait"] == 15
+
+    @patch("bartender.thrift.admission.time")
+    def test_start_no_deadline(self, time_mock):
+        admission = AdmissionQueue()
+        time_mock.time.return_value = 1000
+        admission.try_enter()
+
+        assert admission.start(0) is True
+
+    def test_server_busy(self):
+        exc = server_busy("queue full")
+        assert exc.type == SERVER_BUSY
+        assert "queue full" in exc.message
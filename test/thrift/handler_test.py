@@ -1,13 +1,24 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 import mongoengine
 import pika.spec
-from mock import MagicMock, Mock, PropertyMock, patch, call
+from bson import ObjectId
+from mock import ANY, MagicMock, Mock, PropertyMock, patch, call
 from pika.exceptions import UnroutableError
+from pymongo.errors import BulkWriteError
 from pyrabbit2.http import HTTPError
 
 import bg_utils
-from bartender.thrift.handler import BartenderHandler
+import bartender
+from bartender import encoding
+from bartender.fair_scheduler import FairScheduler
+from bartender.raw_request import RawRequest
+from bartender.thrift.handler import BartenderHandler, ForwardingHandler
+from bartender.thrift.server import make_server
 from brewtils.errors import ModelValidationError
 
 
@@ -17,37 +28,60 @@ class BartenderHandlerTest(unittest.TestCase):
         self.clients = MagicMock()
         self.plugin_manager = Mock()
         self.request_validator = Mock()
+        self.request_validator.catalog.get_for_command.return_value = None
 
         self.handler = BartenderHandler(
             self.registry, self.clients, self.plugin_manager, self.request_validator
         )
         self.handler.parser = Mock()
 
-    @patch(
-        "bg_utils.mongo.models.Request.find_or_none",
-        Mock(side_effect=mongoengine.ValidationError),
-    )
+        self.publish_kwargs = dict(
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
+        )
+
+        self.collection = Mock()
+        self.collection.update_one.return_value.matched_count = 1
+        patcher = patch(
+            "bg_utils.mongo.models.Request._get_collection",
+            Mock(return_value=self.collection),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_process_request_bad_request(self):
         self.assertRaises(
-            bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "id"
+            bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "bad_id"
         )
 
-    @patch("bg_utils.mongo.models.Request.find_or_none", Mock(return_value=None))
+    @patch("bartender.thrift.handler.RawRequest.find", Mock(return_value=None))
     def test_process_request_none(self):
         self.assertRaises(
             bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "id"
         )
 
-    @patch("bg_utils.mongo.models.Request.find_or_none", Mock())
+    @patch("bartender.thrift.handler.RawRequest.find", Mock())
+    def test_process_request_invalid_field(self):
+        self.request_validator.validate_request.return_value.validate.side_effect = (
+            mongoengine.ValidationError
+        )
+        self.assertRaises(
+            bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "id"
+        )
+
+    @patch("bartender.thrift.handler.RawRequest.find", Mock())
     def test_process_request_bad_backend(self):
         self.request_validator.validate_request = Mock(side_effect=ModelValidationError)
         self.assertRaises(
             bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "id"
         )
 
-    @patch("bg_utils.mongo.models.Request.find_or_none")
+    @patch("bartender.thrift.handler.RawRequest.find")
     def test_process_request(self, find_mock):
-        request = Mock()
+        request = MagicMock()
+        request.parent = None
         find_mock.return_value = request
         self.request_validator.validate_request.return_value = request
 
@@ -55,21 +89,443 @@ class BartenderHandlerTest(unittest.TestCase):
         find_mock.assert_called_once_with("id")
         self.clients["pika"].publish_request.assert_called_once_with(
             request,
+            content_type=None,
             confirm=True,
             mandatory=True,
             delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
         )
 
-    @patch("bg_utils.mongo.models.Request.find_or_none")
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_scheduled(self, find_mock):
+        request = MagicMock(system="system")
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.handler.scheduler = MagicMock()
+
+        self.handler.processRequest("id")
+        self.handler.scheduler.slot.assert_called_once_with("system")
+        self.assertTrue(self.handler.scheduler.slot.return_value.__exit__.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_throttled(self, find_mock):
+        find_mock.return_value = Mock(system="system")
+        find_mock.return_value.parent = None
+        self.handler.scheduler = FairScheduler(max_concurrent=1, max_wait=0.01)
+        self.handler.scheduler.acquire("system")
+
+        with self.assertRaises(bg_utils.bg_thrift.PublishException) as ctx:
+            self.handler.processRequest("id")
+        self.assertIn("waiting to process", ctx.exception.message)
+        self.assertFalse(self.request_validator.validate_request.called)
+        self.assertFalse(self.clients["pika"].publish_request.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
     def test_process_request_fail(self, find_mock):
-        request = Mock()
+        request = MagicMock()
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.clients["pika"].publish_request.side_effect = UnroutableError("Nope")
+
+        self.assertRaises(
+            bg_utils.bg_thrift.PublishException, self.handler.processRequest, "id"
+        )
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_partial_update(self, find_mock):
+        request = RawRequest(
+            {
+                "_id": ObjectId("5c8a1ac3f6ba5e0011b3b8b1"),
+                "system": "system",
+                "system_version": "1.0.0",
+                "instance_name": "default",
+                "command": "command",
+                "status": "CREATED",
+                "parameters": {"message": "hi"},
+                "comment": "left alone",
+            }
+        )
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+
+        self.handler.processRequest("id")
+        (query, update), _ = self.collection.update_one.call_args
+        self.assertEqual({"_id": request.id, "status": "CREATED"}, query)
+        self.assertEqual({"parameters", "updated_at"}, set(update["$set"].keys()))
+        self.assertEqual({"message": "hi"}, update["$set"]["parameters"])
+        self.clients["pika"].publish_request.assert_called_once_with(
+            request,
+            content_type=None,
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
+        )
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_content_type(self, find_mock):
+        request = MagicMock(
+            system="system",
+            system_version="1.0.0",
+            command="command",
+            instance_name="default",
+        )
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.request_validator.catalog.get_for_command.return_value = Mock(
+            content_types={"default": "application/msgpack"}
+        )
+
+        self.handler.processRequest("id")
+        self.request_validator.catalog.get_for_command.assert_called_once_with(
+            "system", "1.0.0", "command", "default"
+        )
+        _, kwargs = self.clients["pika"].publish_request.call_args
+        self.assertEqual("application/msgpack", kwargs["content_type"])
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_with_parent(self, find_mock):
+        raw_request = Mock()
+        raw_request.parent = ObjectId()
+        raw_request.to_model.return_value = MagicMock()
+        self.request_validator.validate_request.side_effect = lambda request: request
+        find_mock.return_value = raw_request
+
+        self.handler.processRequest("id")
+        self.request_validator.validate_request.assert_called_once_with(
+            raw_request.to_model.return_value
+        )
+        self.assertFalse(raw_request.serialize.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_status_changed(self, find_mock):
+        request = MagicMock(status="CREATED")
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.collection.update_one.return_value.matched_count = 0
+
+        self.handler.processRequest("id")
+        self.assertFalse(self.clients["pika"].publish_request.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_recently_published(self, find_mock):
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = True
+
+        self.handler.processRequest("id")
+        self.assertFalse(find_mock.called)
+        self.assertFalse(self.clients["pika"].publish_request.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_already_claimed(self, find_mock):
+        find_mock.return_value = MagicMock()
+        find_mock.return_value.parent = None
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = False
+        self.handler.publish_filter.claim.return_value = False
+
+        self.handler.processRequest("id")
+        self.handler.publish_filter.claim.assert_called_once_with(
+            find_mock.return_value.id
+        )
+        self.assertFalse(self.request_validator.validate_request.called)
+        self.assertFalse(self.clients["pika"].publish_request.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_claim_published(self, find_mock):
+        request = MagicMock()
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = False
+        self.handler.publish_filter.published.side_effect = ValueError
+
+        self.handler.processRequest("id")
+        self.assertTrue(self.clients["pika"].publish_request.called)
+        self.handler.publish_filter.published.assert_called_once_with(request.id)
+        self.assertFalse(self.handler.publish_filter.release.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_claim_released(self, find_mock):
+        request = MagicMock()
+        request.parent = None
         find_mock.return_value = request
         self.request_validator.validate_request.return_value = request
         self.clients["pika"].publish_request.side_effect = UnroutableError("Nope")
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = False
 
         self.assertRaises(
             bg_utils.bg_thrift.PublishException, self.handler.processRequest, "id"
         )
+        self.handler.publish_filter.release.assert_called_once_with(request.id)
+        self.assertFalse(self.handler.publish_filter.published.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_status_changed_not_recorded(self, find_mock):
+        request = MagicMock(status="CREATED")
+        request.parent = None
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.collection.update_one.return_value.matched_count = 0
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = False
+
+        self.handler.processRequest("id")
+        self.assertFalse(self.handler.publish_filter.published.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_outbox(self, find_mock):
+        request = RawRequest(
+            {
+                "_id": ObjectId("5c8a1ac3f6ba5e0011b3b8b1"),
+                "system": "system",
+                "system_version": "1.0.0",
+                "instance_name": "default",
+                "command": "command",
+                "status": "CREATED",
+                "parameters": {"message": "hi"},
+            }
+        )
+        find_mock.return_value = request
+        self.request_validator.validate_request.return_value = request
+        self.handler.outbox = Mock()
+
+        self.handler.processRequest("id")
+        (request_id, status, fields), _ = self.handler.outbox.add.call_args
+        self.assertEqual(request.id, request_id)
+        self.assertEqual("CREATED", status)
+        self.assertEqual({"parameters", "updated_at"}, set(fields.keys()))
+        self.assertFalse(self.collection.update_one.called)
+        self.assertFalse(self.clients["pika"].publish_request.called)
+
+    @patch("bartender.thrift.handler.RawRequest.find")
+    def test_process_request_outbox_invalid(self, find_mock):
+        find_mock.return_value = MagicMock()
+        find_mock.return_value.parent = None
+        self.request_validator.validate_request.return_value.validate.side_effect = (
+            mongoengine.ValidationError
+        )
+        self.handler.outbox = Mock()
+
+        self.assertRaises(
+            bg_utils.bg_thrift.InvalidRequest, self.handler.processRequest, "id"
+        )
+        self.assertFalse(self.handler.outbox.add.called)
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests(self, request_mock):
+        good = MagicMock(id="5c8a1ac3f6ba5e0011b3b8b1")
+        invalid = MagicMock(id="5c8a1ac3f6ba5e0011b3b8b2")
+        unpublished = MagicMock(id="5c8a1ac3f6ba5e0011b3b8b3")
+        missing_id = "5c8a1ac3f6ba5e0011b3b8b4"
+
+        request_mock.objects.return_value = [good, invalid, unpublished]
+        request_mock._get_collection.return_value.bulk_write.return_value = Mock(
+            matched_count=2
+        )
+        self.request_validator.validate_requests.return_value = (
+            [good, unpublished],
+            {str(invalid.id): ModelValidationError("bad")},
+        )
+        self.clients["pika"].publish_requests.return_value = {
+            str(good.id): None,
+            str(unpublished.id): UnroutableError("Nope"),
+        }
+
+        # All for the same System, so processed as a single batch
+        for request in (good, invalid, unpublished):
+            request.system = "system"
+
+        results = self.handler._process_requests(
+            [good.id, invalid.id, unpublished.id, missing_id, "not_an_id"]
+        )
+
+        request_mock.objects.assert_called_once_with(
+            id__in=[good.id, invalid.id, unpublished.id, missing_id]
+        )
+        self.assertEqual(
+            1, request_mock._get_collection.return_value.bulk_write.call_count
+        )
+        self.clients["pika"].publish_requests.assert_called_once_with(
+            [good, unpublished],
+            content_types={str(good.id): None, str(unpublished.id): None},
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
+        )
+        self.assertEqual("", results[good.id])
+        self.assertEqual("bad", results[invalid.id])
+        self.assertIn("publishing", results[unpublished.id])
+        self.assertIn(missing_id, results[missing_id])
+        self.assertIn("not_an_id", results["not_an_id"])
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_bulk_write_error(self, request_mock):
+        good = MagicMock(id="5c8a1ac3f6ba5e0011b3b8b1")
+        unsaved = MagicMock(id="5c8a1ac3f6ba5e0011b3b8b2")
+
+        request_mock.objects.return_value = [good, unsaved]
+        request_mock._get_collection.return_value.bulk_write.side_effect = BulkWriteError(
+            {"nMatched": 1, "writeErrors": [{"index": 1, "errmsg": "write failed"}]}
+        )
+        self.request_validator.validate_requests.return_value = ([good, unsaved], {})
+        self.clients["pika"].publish_requests.return_value = {str(good.id): None}
+
+        good.system = unsaved.system = "system"
+
+        results = self.handler._process_requests([good.id, unsaved.id])
+        self.clients["pika"].publish_requests.assert_called_once_with(
+            [good],
+            content_types={str(good.id): None},
+            confirm=True,
+            mandatory=True,
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            spool=True,
+        )
+        self.assertEqual("", results[good.id])
+        self.assertEqual("write failed", results[unsaved.id])
+
+    def _batch(self, request_mock, count=2, system="system"):
+        requests = [
+            MagicMock(
+                id="5c8a1ac3f6ba5e0011b3b8b%d" % i,
+                system=system,
+                status="CREATED",
+                instance_name="default",
+            )
+            for i in range(count)
+        ]
+
+        request_mock.objects.return_value = requests
+        request_mock._get_collection.return_value.bulk_write.return_value = Mock(
+            matched_count=count
+        )
+        self.request_validator.validate_requests.side_effect = lambda r: (r, {})
+        self.clients["pika"].publish_requests.side_effect = lambda r, **kw: dict(
+            (str(request.id), None) for request in r
+        )
+
+        return requests
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_status_changed(self, request_mock):
+        unchanged, cancelled = self._batch(request_mock)
+        collection = request_mock._get_collection.return_value
+        collection.bulk_write.return_value = Mock(matched_count=1)
+        collection.find.return_value = [{"_id": unchanged.id}]
+
+        results = self.handler._process_requests([unchanged.id, cancelled.id])
+        (operations,), _ = collection.bulk_write.call_args
+        self.assertEqual(
+            {"_id": unchanged.id, "status": "CREATED"}, operations[0]._filter
+        )
+        self.clients["pika"].publish_requests.assert_called_once_with(
+            [unchanged], content_types=ANY, **self.publish_kwargs
+        )
+        self.assertEqual({unchanged.id: "", cancelled.id: ""}, results)
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_outbox(self, request_mock):
+        requests = self._batch(request_mock)
+        self.handler.outbox = Mock()
+
+        results = self.handler._process_requests([r.id for r in requests])
+        self.assertEqual(
+            [call(r.id, "CREATED", ANY) for r in requests],
+            self.handler.outbox.add.call_args_list,
+        )
+        self.assertFalse(request_mock._get_collection.return_value.bulk_write.called)
+        self.assertFalse(self.clients["pika"].publish_requests.called)
+        self.assertEqual(["", ""], list(results.values()))
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_content_types(self, request_mock):
+        requests = self._batch(request_mock)
+        self.request_validator.catalog.get_for_command.return_value = Mock(
+            content_types={"default": encoding.MSGPACK}
+        )
+
+        self.handler._process_requests([r.id for r in requests])
+        self.clients["pika"].publish_requests.assert_called_once_with(
+            requests,
+            content_types=dict((r.id, encoding.MSGPACK) for r in requests),
+            **self.publish_kwargs
+        )
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_publish_filter(self, request_mock):
+        recent, taken, failed, good = self._batch(request_mock, count=4)
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.side_effect = (
+            lambda request_id: request_id == recent.id
+        )
+        self.handler.publish_filter.claim.side_effect = (
+            lambda request_id: request_id != taken.id
+        )
+        request_mock.objects.return_value = [taken, failed, good]
+        self.clients["pika"].publish_requests.side_effect = None
+        self.clients["pika"].publish_requests.return_value = {
+            failed.id: UnroutableError("Nope"),
+            good.id: None,
+        }
+
+        results = self.handler._process_requests(
+            [recent.id, taken.id, failed.id, good.id]
+        )
+        request_mock.objects.assert_called_once_with(
+            id__in=[taken.id, failed.id, good.id]
+        )
+        self.request_validator.validate_requests.assert_called_once_with([failed, good])
+        self.handler.publish_filter.release.assert_called_once_with(failed.id)
+        self.handler.publish_filter.published.assert_called_once_with(good.id)
+        self.assertEqual("", results[recent.id])
+        self.assertEqual("", results[taken.id])
+        self.assertIn("publishing", results[failed.id])
+        self.assertEqual("", results[good.id])
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_error_releases_claims(self, request_mock):
+        requests = self._batch(request_mock)
+        self.handler.publish_filter = Mock()
+        self.handler.publish_filter.recently_published.return_value = False
+        self.request_validator.validate_requests.side_effect = ValueError("oops")
+
+        results = self.handler._process_requests([r.id for r in requests])
+        self.assertEqual(
+            [call(r.id) for r in requests],
+            self.handler.publish_filter.release.call_args_list,
+        )
+        self.assertEqual(["oops", "oops"], list(results.values()))
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_scheduled(self, request_mock):
+        requests = self._batch(request_mock, count=3)
+        requests[2].system = "other"
+        self.handler.scheduler = MagicMock()
+
+        self.handler._process_requests([r.id for r in requests])
+        self.assertEqual(
+            [call("system"), call("other")], self.handler.scheduler.slot.call_args_list
+        )
+        self.assertEqual(2, self.request_validator.validate_requests.call_count)
+
+    @patch("bartender.thrift.handler.Request")
+    def test_process_requests_throttled(self, request_mock):
+        requests = self._batch(request_mock)
+        self.handler.scheduler = FairScheduler(max_concurrent=1, max_wait=0.01)
+        self.handler.scheduler.acquire("system")
+
+        results = self.handler._process_requests([r.id for r in requests])
+        self.assertFalse(self.request_validator.validate_requests.called)
+        for request in requests:
+            self.assertIn("waiting to process", results[request.id])
 
     @patch("bartender.config", Mock())
     @patch("bartender.thrift.handler.get_routing_key", Mock(return_value="a"))
@@ -85,6 +541,20 @@ class BartenderHandlerTest(unittest.TestCase):
         self.assertEqual("INITIALIZING", instance_mock.status)
         self.assertEqual(2, self.clients["pika"].setup_queue.call_count)
         self.assertTrue(self.clients["pika"].start.called)
+        self.assertTrue(self.request_validator.catalog.invalidate.called)
+
+    @patch("bartender.config", Mock())
+    @patch("bartender.thrift.handler.get_routing_key", Mock(return_value="a"))
+    @patch("bartender.thrift.handler.get_routing_keys", Mock(return_value=["b"]))
+    @patch("bartender.thrift.handler.BartenderHandler._get_system", Mock())
+    @patch("bartender.thrift.handler.BartenderHandler._get_instance")
+    def test_initialize_instance_content_type(self, get_instance_mock):
+        bartender.config.amq.content_types = [encoding.MSGPACK]
+        instance_mock = Mock(metadata={"content_types": [encoding.MSGPACK]})
+        get_instance_mock.return_value = instance_mock
+
+        self.handler.initializeInstance("id")
+        self.assertEqual(encoding.MSGPACK, instance_mock.queue_info["content_type"])
 
     @patch("bartender.thrift.handler.BartenderHandler._get_instance", Mock())
     @patch("bartender.thrift.handler.BartenderHandler._get_plugin_from_instance_id")
@@ -150,6 +620,9 @@ class BartenderHandlerTest(unittest.TestCase):
 
         self.handler.reloadSystem("id")
         self.plugin_manager.reload_system.assert_called_once_with("name", "0.0.1")
+        self.request_validator.catalog.invalidate.assert_called_once_with(
+            "name", "0.0.1"
+        )
 
     @patch("bartender.thrift.handler.System")
     def test_reload_exception(self, system_mock):
@@ -190,6 +663,9 @@ class BartenderHandlerTest(unittest.TestCase):
             ]
         )
         self.assertTrue(fake_system.deep_delete.called)
+        self.request_validator.catalog.invalidate.assert_called_once_with(
+            "name", "0.0.1"
+        )
 
     @patch("bartender.thrift.handler.sleep", Mock())
     @patch("bartender.config")
@@ -390,3 +866,53 @@ class BartenderHandlerTest(unittest.TestCase):
         self.assertRaises(
             bg_utils.bg_thrift.InvalidSystem, self.handler._get_system, Mock()
         )
+
+
+class ForwardingHandlerTest(unittest.TestCase):
+    @patch(
+        "bartender.config",
+        Mock(thrift=Mock(max_workers=1, min_workers=1, keep_alive=60, grow_wait=0)),
+    )
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ipc_socket = os.path.join(self.tmp_dir, "thrift.sock")
+
+        self.main_handler = Mock()
+        self.main_handler.stopInstance.return_value = "stopped"
+        self.main_handler.reloadSystem.side_effect = bg_utils.bg_thrift.InvalidSystem(
+            "", "Couldn't find system"
+        )
+
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend,
+            self.main_handler,
+            unix_socket=self.ipc_socket,
+        )
+        self.server.start()
+        for _ in range(100):
+            if os.path.exists(self.ipc_socket):
+                break
+            time.sleep(0.01)
+
+        self.clients = MagicMock()
+        self.handler = ForwardingHandler(
+            self.ipc_socket, self.clients, Mock(), scheduler=Mock()
+        )
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join(5)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_forwarded(self):
+        self.assertEqual("stopped", self.handler.stopInstance("id"))
+        self.main_handler.stopInstance.assert_called_once_with("id")
+
+    def test_forwarded_exception(self):
+        with self.assertRaises(bg_utils.bg_thrift.InvalidSystem):
+            self.handler.reloadSystem("id")
+
+    def test_not_forwarded(self):
+        self.handler.clearQueue("queue")
+        self.clients["pyrabbit"].clear_queue.assert_called_once_with("queue")
+        self.assertFalse(self.main_handler.clearQueue.called)
@@ -0,0 +1,246 @@
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import ANY, MagicMock, Mock, call, patch
+from thriftpy2.rpc import make_client
+from yapconf import YapconfSpec
+
+import bartender
+import bg_utils
+from bartender.errors import ConfigurationError
+from bartender.specification import SPECIFICATION
+from bartender.thrift.handler import ForwardingHandler
+from bartender.thrift.processes import ThriftProcessPool, ThriftSupervisor
+
+
+class ThriftSupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.make_handler = Mock()
+        self.supervisor = ThriftSupervisor(
+            2, self.make_handler, ipc_socket="/tmp/ipc.sock", service=Mock()
+        )
+        self.supervisor.POLL_INTERVAL = 0
+        self.supervisor.PROCESS_TIMEOUT = 0
+
+    @patch("bartender.thrift.processes.socket", Mock(spec=[]))
+    def test_no_reuse_port(self):
+        with self.assertRaises(ConfigurationError):
+            ThriftSupervisor(2, self.make_handler)
+
+    def test_default_ipc_socket(self):
+        supervisor = ThriftSupervisor(2, self.make_handler)
+        self.assertIn(str(os.getpid()), supervisor.ipc_socket)
+
+    def test_replacement(self):
+        replacement = self.supervisor.replacement()
+
+        self.assertIsNot(self.supervisor, replacement)
+        self.assertEqual(2, replacement.processes)
+        self.assertEqual("/tmp/ipc.sock", replacement.ipc_socket)
+        self.assertEqual(self.supervisor.server_kwargs, replacement.server_kwargs)
+
+    @patch("bartender.thrift.processes.signal", Mock())
+    @patch("bartender.thrift.processes.os")
+    def test_run_waits_to_begin(self, os_mock):
+        os_mock.getppid.side_effect = [self.supervisor.parent_pid] * 2 + [1]
+
+        self.supervisor.run()
+        self.assertFalse(os_mock.fork.called)
+
+    @patch("bartender.thrift.processes.signal", Mock())
+    @patch("bartender.thrift.processes.os")
+    def test_run_restarts_dead_process(self, os_mock):
+        os_mock.getppid.side_effect = [self.supervisor.parent_pid] * 2 + [1]
+        os_mock.fork.side_effect = [10, 11, 12]
+        os_mock.waitpid.side_effect = lambda pid, options: (
+            (pid, 9) if pid == 10 else (0, 0)
+        )
+        self.supervisor.begin()
+
+        self.supervisor.run()
+        self.assertEqual(3, os_mock.fork.call_count)
+        # The survivors are stopped when the supervisor is
+        self.assertEqual(
+            [call(12, ANY), call(11, ANY)], os_mock.kill.call_args_list[:2]
+        )
+
+    def test_sigterm_stops(self):
+        self.supervisor._on_sigterm(None, None)
+        self.assertTrue(self.supervisor._stopping)
+
+
+class ThriftProcessPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = Mock()
+        self.supervisor = Mock(
+            pid=123,
+            ipc_socket="/tmp/ipc.sock",
+            server_kwargs={"service": Mock(), "pools": {"admin": 1}},
+            PROCESS_TIMEOUT=0,
+        )
+        self.pool = ThriftProcessPool(self.supervisor, self.handler)
+
+    @patch("bartender.thrift.processes.make_server")
+    def test_run_begins(self, make_server_mock):
+        self.pool.stopped = Mock(side_effect=[False, False, True])
+        self.pool.wait = Mock()
+
+        self.pool.run()
+        self.supervisor.begin.assert_called_once_with()
+        self.assertFalse(self.supervisor.start.called)
+        make_server_mock.assert_called_once_with(
+            self.pool.server_kwargs["service"],
+            self.handler,
+            unix_socket="/tmp/ipc.sock",
+            pools={"admin": 1},
+            method_pools=None,
+        )
+        make_server_mock.return_value.start.assert_called_once_with()
+
+    @patch("bartender.thrift.processes.make_server", Mock())
+    def test_run_starts_supervisor(self):
+        self.supervisor.pid = None
+        self.pool.stopped = Mock(side_effect=[False, False, True])
+        self.pool.wait = Mock()
+
+        self.pool.run()
+        self.supervisor.start.assert_called_once_with()
+
+    @patch("bartender.thrift.processes.make_server", Mock())
+    def test_run_replaces_dead_supervisor(self):
+        self.supervisor.is_alive.return_value = False
+        self.pool.stopped = Mock(side_effect=[False, False, True])
+        self.pool.wait = Mock()
+
+        self.pool.run()
+        replacement = self.supervisor.replacement.return_value
+        self.assertIs(replacement, self.pool.supervisor)
+        replacement.start.assert_called_once_with()
+        replacement.begin.assert_called_once_with()
+
+    @patch("bartender.thrift.processes.os")
+    def test_stop(self, os_mock):
+        self.supervisor.is_alive.side_effect = [True, False]
+        self.pool._ipc_server = Mock(WORKER_TIMEOUT=0)
+
+        self.pool.stop()
+        self.assertTrue(self.pool.stopped())
+        self.supervisor.terminate.assert_called_once_with()
+        self.pool._ipc_server.stop.assert_called_once_with()
+        os_mock.unlink.assert_called_once_with("/tmp/ipc.sock")
+
+
+class ThriftProcessServeTest(unittest.TestCase):
+    def setUp(self):
+        self.config = bartender.config
+        bartender.config = YapconfSpec(SPECIFICATION).load_config()
+        bartender.config.thrift.min_workers = 1
+
+        # Every process has to bind the same, known, port
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        self.port = probe.getsockname()[1]
+        probe.close()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.main_handler = Mock()
+        self.main_handler.startInstance.side_effect = lambda instance_id: str(
+            os.getpid()
+        )
+
+        self.supervisor = ThriftSupervisor(
+            2,
+            self._make_handler,
+            ipc_socket=os.path.join(self.tmp_dir, "thrift.sock"),
+            service=bg_utils.bg_thrift.BartenderBackend,
+            host="127.0.0.1",
+            port=self.port,
+        )
+        self.supervisor.POLL_INTERVAL = 0.1
+        self.supervisor.start()
+
+        self.pool = ThriftProcessPool(self.supervisor, self.main_handler)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+        self.pool.join(5)
+        shutil.rmtree(self.tmp_dir)
+        bartender.config = self.config
+
+    @staticmethod
+    def _make_handler(ipc_socket):
+        handler = ForwardingHandler(ipc_socket, MagicMock(), Mock(), scheduler=Mock())
+        handler.getVersion = lambda: str(os.getpid())
+        return handler
+
+    def _call(self, method, *args):
+        deadline = time.time() + 10
+        while True:
+            try:
+                client = make_client(
+                    bg_utils.bg_thrift.BartenderBackend, "127.0.0.1", self.port
+                )
+                break
+            except Exception:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        try:
+            return getattr(client, method)(*args)
+        finally:
+            client.close()
+
+    def test_serve(self):
+        # Calls are served by the child processes
+        pids = set(self._call("getVersion") for _ in range(20))
+        self.assertNotIn(str(os.getpid()), pids)
+
+        # But plugin lifecycle calls come back to this one
+        self.assertEqual(str(os.getpid()), self._call("startInstance", "id"))
+
+    def test_restart_while_logging_locked(self):
+        pids = set(self._call("getVersion") for _ in range(20))
+
+        # A thread of this process holds the logging lock, which a process forked
+        # from here would never be able to take
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_logging_lock():
+            logging._acquireLock()
+            try:
+                locked.set()
+                release.wait(30)
+            finally:
+                logging._releaseLock()
+
+        holder = threading.Thread(target=hold_logging_lock)
+        holder.start()
+        try:
+            locked.wait(5)
+            for pid in pids:
+                os.kill(int(pid), signal.SIGKILL)
+
+            # The replacements are forked by the supervisor, so they start anyway
+            deadline = time.time() + 20
+            while True:
+                try:
+                    pid = self._call("getVersion")
+                    if pid not in pids:
+                        break
+                except Exception:
+                    pass
+
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.1)
+        finally:
+            release.set()
+            holder.join(5)
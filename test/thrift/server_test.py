@@ -1,10 +1,32 @@
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import time
 import unittest
 from concurrent.futures import Future
+from threading import Event, Thread
 
-from mock import ANY, Mock, patch
+from mock import ANY, MagicMock, Mock, patch
+from thriftpy2.rpc import make_client
+from thriftpy2.thrift import TApplicationException
 
-from bartender.thrift.server import BartenderThriftServer, make_server
-from thriftpy2.transport import TServerSocket, TSSLServerSocket
+import bg_utils
+from bartender.thrift.admission import SERVER_BUSY
+from bartender.thrift.server import (
+    _Connection,
+    BartenderThriftServer,
+    make_server,
+    PROTOCOLS,
+    TRANSPORTS,
+    WrappedTProcessor,
+)
+from thriftpy2.transport import TServerSocket, TSSLServerSocket, TTransportException
+
+CERT_FILE = os.path.join(os.path.dirname(__file__), "server.pem")
+
+THRIFT_CONFIG = {"max_workers": 1, "min_workers": 1, "keep_alive": 60, "grow_wait": 0}
 
 
 class ThriftServerTest(unittest.TestCase):
@@ -12,11 +34,12 @@ class ThriftServerTest(unittest.TestCase):
         self.timeout_mock = Mock()
 
         self.processor_mock = Mock()
+        self.processor_mock.process_in.return_value = ("ping", 7, Mock(), Mock())
         self.trans_mock = Mock()
         self.pool_mock = Mock()
 
         with patch("bartender.config") as config_mock:
-            config_mock.thrift.max_workers = 25
+            config_mock.thrift = Mock(**dict(THRIFT_CONFIG, max_workers=25))
             self.server = BartenderThriftServer(self.processor_mock, self.trans_mock)
             self.server.pool = self.pool_mock
 
@@ -52,46 +75,57 @@ class ThriftServerTest(unittest.TestCase):
     @patch(
         "bartender.thrift.server.BartenderThriftServer.stopped", Mock(return_value=True)
     )
-    def test_serve_already_stopped(self):
+    @patch("bartender.thrift.server.selectors")
+    def test_serve_already_stopped(self, selectors_mock):
         self.server.serve()
         self.trans_mock.listen.assert_called_once_with()
         self.assertFalse(self.trans_mock.accept.called)
+        selectors_mock.DefaultSelector.return_value.close.assert_called_once_with()
 
-    @patch(
-        "bartender.thrift.server.BartenderThriftServer.stopped",
-        Mock(side_effect=[False, True]),
-    )
-    def test_serve(self):
-        trans_input = Mock()
-        self.trans_mock.accept.return_value = trans_input
+    @patch("bartender.thrift.server.selectors")
+    def test_serve_logs_stats(self, selectors_mock):
+        selectors_mock.DefaultSelector.return_value.select.return_value = []
+        self.server.stopped = Mock(side_effect=[False, True])
+        self.server.log_stats = Mock()
+        self.server.stats_interval = 60
+        self.server._stats_logged = time.time() - 61
 
-        logger_mock = Mock()
-        self.server.logger = logger_mock
+        self.server.serve()
+        self.server.log_stats.assert_called_once_with()
+
+    @patch("bartender.thrift.server.selectors")
+    def test_serve_stats_disabled(self, selectors_mock):
+        selectors_mock.DefaultSelector.return_value.select.return_value = []
+        self.server.stopped = Mock(side_effect=[False, True])
+        self.server.log_stats = Mock()
+        self.server._stats_logged = 0
 
         self.server.serve()
-        self.trans_mock.accept.assert_called_once_with()
-        self.pool_mock.submit.assert_called_once_with(ANY, trans_input)
-        self.assertFalse(logger_mock.exception.called)
+        self.assertFalse(self.server.log_stats.called)
 
-    @patch(
-        "bartender.thrift.server.BartenderThriftServer.stopped",
-        Mock(side_effect=[False, True]),
-    )
-    def test_serve_exception(self):
+    def test_accept_parks_connection(self):
+        self.server.selector = Mock()
+        client = Mock()
+        self.trans_mock.accept.return_value = client
+
+        self.server._accept()
+        self.server.selector.register.assert_called_once_with(client.sock, ANY, ANY)
+        self.assertFalse(self.pool_mock.submit.called)
+
+    def test_accept_exception(self):
+        self.server.selector = Mock()
         self.trans_mock.accept.side_effect = ValueError
 
         logger_mock = Mock()
         self.server.logger = logger_mock
 
-        self.server.serve()
-        self.trans_mock.accept.assert_called_once_with()
+        self.server._accept()
         self.assertTrue(logger_mock.exception.called)
 
     @patch(
-        "bartender.thrift.server.BartenderThriftServer.stopped",
-        Mock(side_effect=[False, True, True]),
+        "bartender.thrift.server.BartenderThriftServer.stopped", Mock(return_value=True)
     )
-    def test_serve_exit_exception(self):
+    def test_accept_exit_exception(self):
         error = OSError()
         error.errno = 22
         self.trans_mock.accept.side_effect = error
@@ -99,21 +133,575 @@ class ThriftServerTest(unittest.TestCase):
         logger_mock = Mock()
         self.server.logger = logger_mock
 
-        self.server.serve()
-        self.trans_mock.accept.assert_called_once_with()
+        self.server._accept()
         self.assertFalse(logger_mock.exception.called)
 
+    def test_accept_tcp_nodelay(self):
+        self.server.selector = Mock()
+        self.server.tcp_nodelay = True
+        client = Mock()
+        client.sock.family = socket.AF_INET
+        self.trans_mock.accept.return_value = client
+
+        self.server._accept()
+        client.sock.setsockopt.assert_called_once_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+
+    def test_accept_tcp_nodelay_unix_socket(self):
+        self.server.selector = Mock()
+        self.server.tcp_nodelay = True
+        client = Mock()
+        client.sock.family = socket.AF_UNIX
+        self.trans_mock.accept.return_value = client
+
+        self.server._accept()
+        self.assertFalse(client.sock.setsockopt.called)
+
+    def test_dispatch(self):
+        self.server.selector = Mock()
+        connection = Mock()
+
+        self.server._dispatch(connection)
+        self.server.selector.unregister.assert_called_once_with(connection.sock)
+        self.pool_mock.submit.assert_called_once_with(ANY, connection, ANY)
+        self.assertEqual(1, self.server.admission.depth)
+
+    def test_dispatch_queue_full(self):
+        self.server.selector = Mock()
+        self.server.admission.max_depth = 1
+        self.server.admission.try_enter()
+
+        connection = Mock()
+        connection.iprot.read_message_begin.return_value = ("processRequest", 1, 7)
+
+        self.server._dispatch(connection)
+        self.assertFalse(self.pool_mock.submit.called)
+        self.assertFalse(self.server.selector.unregister.called)
+        self.processor_mock.send_exception.assert_called_once_with(
+            connection.oprot, "processRequest", ANY, 7
+        )
+        self.assertEqual(
+            SERVER_BUSY, self.processor_mock.send_exception.call_args[0][2].type
+        )
+
+    def test_dispatch_queue_full_disconnect(self):
+        self.server.selector = Mock()
+        self.server.admission.max_depth = 1
+        self.server.admission.try_enter()
+
+        connection = Mock()
+        sock = connection.sock
+        connection.iprot.read_message_begin.side_effect = TTransportException
+
+        self.server._dispatch(connection)
+        self.server.selector.unregister.assert_called_once_with(sock)
+        connection.close.assert_called_once_with()
+
+    def test_process_returns_connection(self):
+        connection = Mock(pending=Mock(return_value=False))
+
+        self.server.admission.try_enter()
+
+        self.server._process(connection, time.time())
+        self.processor_mock.process_in.assert_called_once_with(connection.iprot)
+        self.processor_mock.process_out.assert_called_once_with(
+            connection.oprot, *self.processor_mock.process_in.return_value
+        )
+        self.assertIs(self.server._returned.get_nowait(), connection)
+        self.assertFalse(connection.close.called)
+
+    def test_process_drains_pending(self):
+        connection = Mock(pending=Mock(side_effect=[True, False]))
+        self.server.admission.try_enter()
+
+        self.server._process(connection, time.time())
+        self.assertEqual(self.processor_mock.process_out.call_count, 2)
+
+    def test_process_disconnect(self):
+        connection = Mock()
+        self.processor_mock.process_in.side_effect = TTransportException
+        self.server.admission.try_enter()
+
+        self.server._process(connection, time.time())
+        connection.close.assert_called_once_with()
+        self.assertTrue(self.server._returned.empty())
+
+    def test_process_expired(self):
+        connection = Mock(pending=Mock(return_value=False))
+        connection.iprot.read_message_begin.return_value = ("processRequest", 1, 7)
+        self.server.admission.max_wait = 1
+        self.server.admission.try_enter()
+
+        self.server._process(connection, time.time() - 5)
+        self.assertFalse(self.processor_mock.process_in.called)
+        self.assertTrue(self.processor_mock.send_exception.called)
+        self.assertIs(self.server._returned.get_nowait(), connection)
+
+    def test_process_hands_off(self):
+        connection = Mock(pending=Mock(return_value=True))
+        admin_pool = Mock()
+        self.server.method_pools = {"ping": admin_pool}
+        self.server.admission.try_enter()
+
+        self.server._process(connection, time.time())
+        self.assertFalse(self.processor_mock.process_out.called)
+        self.assertTrue(self.server._returned.empty())
+        admin_pool.submit.assert_called_once_with(self.server._run, connection, ANY)
+
+        # The handed off call responds, then returns the connection itself
+        connection.pending.return_value = False
+        respond = admin_pool.submit.call_args[0][2]
+        self.server._run(connection, respond)
+        self.processor_mock.process_out.assert_called_once_with(
+            connection.oprot, *self.processor_mock.process_in.return_value
+        )
+        self.assertIs(self.server._returned.get_nowait(), connection)
+
+    def test_method_pools(self):
+        with patch("bartender.config") as config_mock:
+            config_mock.thrift = Mock(**THRIFT_CONFIG)
+            server = BartenderThriftServer(
+                self.processor_mock,
+                self.trans_mock,
+                pools={"admin": 1},
+                method_pools={"clearQueue": "admin", "ping": "missing"},
+            )
+
+        self.assertEqual(["admin"], list(server.class_pools))
+        self.assertEqual(
+            {"clearQueue": server.class_pools["admin"]}, server.method_pools
+        )
+
+    def test_requeue(self):
+        self.server.selector = Mock()
+        connection = Mock()
+        self.server._returned.put(connection)
+
+        self.server._requeue()
+        self.server.selector.register.assert_called_once_with(
+            connection.sock, ANY, connection
+        )
+
+    @patch("bartender.thrift.server.time")
+    def test_close_idle(self, time_mock):
+        time_mock.time.return_value = 100
+        self.server.idle_timeout = 30
+        self.server.selector = Mock()
+
+        idle = Mock(spec=_Connection, last_active=60)
+        active = Mock(spec=_Connection, last_active=90)
+        self.server.selector.get_map.return_value = {
+            1: Mock(fileobj="idle", data=idle),
+            2: Mock(fileobj="active", data=active),
+        }
+
+        self.server._close_idle()
+        self.server.selector.unregister.assert_called_once_with("idle")
+        idle.close.assert_called_once_with()
+        self.assertFalse(active.close.called)
+
+    def test_close_idle_disabled(self):
+        self.server.selector = Mock()
+
+        self.server._close_idle()
+        self.assertFalse(self.server.selector.get_map.called)
+
+
+class MultiplexedServeTest(unittest.TestCase):
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def setUp(self):
+        self.handler = Mock()
+        self.handler.startInstance.side_effect = lambda instance_id: instance_id
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend, self.handler, port=0
+        )
+        self.server.start()
+
+        for _ in range(100):
+            if self.server.selector is not None:
+                break
+            time.sleep(0.01)
+        self.port = self.server.trans.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join(5)
+
+    def test_more_connections_than_workers(self):
+        clients = [
+            make_client(bg_utils.bg_thrift.BartenderBackend, "127.0.0.1", self.port)
+            for _ in range(3)
+        ]
+        try:
+            for _ in range(2):
+                for index, client in enumerate(clients):
+                    self.assertEqual(str(index), client.startInstance(str(index)))
+        finally:
+            for client in clients:
+                client.close()
+
+
+class AdmissionServeTest(unittest.TestCase):
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def setUp(self):
+        self.started = Event()
+        self.release = Event()
+
+        def start_instance(instance_id):
+            self.started.set()
+            self.release.wait(5)
+            return instance_id
+
+        handler = Mock()
+        handler.startInstance.side_effect = start_instance
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend, handler, port=0, queue_depth=1
+        )
+        self.server.start()
+
+        for _ in range(100):
+            if self.server.selector is not None:
+                break
+            time.sleep(0.01)
+        self.port = self.server.trans.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.release.set()
+        self.server.stop()
+        self.server.join(5)
+
+    def _client(self):
+        return make_client(bg_utils.bg_thrift.BartenderBackend, "127.0.0.1", self.port)
+
+    def test_busy(self):
+        clients = [self._client() for _ in range(3)]
+        threads = [
+            Thread(target=client.startInstance, args=("id",)) for client in clients[:2]
+        ]
+        try:
+            threads[0].start()
+            self.assertTrue(self.started.wait(5))
+
+            threads[1].start()
+            for _ in range(100):
+                if self.server.admission.depth:
+                    break
+                time.sleep(0.01)
+
+            with self.assertRaises(TApplicationException) as ctx:
+                clients[2].startInstance("id")
+            self.assertEqual(SERVER_BUSY, ctx.exception.type)
+            self.assertEqual(1, self.server.admission.stats()["rejected"])
+        finally:
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+            for client in clients:
+                client.close()
+
+
+class MethodPoolServeTest(unittest.TestCase):
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def setUp(self):
+        self.started = Event()
+        self.release = Event()
+
+        def clear_all_queues():
+            self.started.set()
+            self.release.wait(5)
+
+        handler = Mock()
+        handler.clearAllQueues.side_effect = clear_all_queues
+        handler.ping.return_value = None
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend,
+            handler,
+            port=0,
+            pools={"admin": 1},
+            method_pools={"clearAllQueues": "admin"},
+        )
+        self.server.start()
+
+        for _ in range(100):
+            if self.server.selector is not None:
+                break
+            time.sleep(0.01)
+        self.port = self.server.trans.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.release.set()
+        self.server.stop()
+        self.server.join(5)
+
+    def test_admin_call_does_not_block_hot_path(self):
+        admin, hot = [
+            make_client(bg_utils.bg_thrift.BartenderBackend, "127.0.0.1", self.port)
+            for _ in range(2)
+        ]
+        thread = Thread(target=admin.clearAllQueues)
+        try:
+            thread.start()
+            self.assertTrue(self.started.wait(5))
+
+            # The only hot path worker is free even though the admin call runs
+            hot.ping()
+            self.assertTrue(thread.is_alive())
+        finally:
+            self.release.set()
+            thread.join(5)
+            admin.close()
+            hot.close()
+
+
+class StalledCallServeTest(unittest.TestCase):
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def setUp(self):
+        handler = Mock()
+        handler.ping.return_value = None
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend, handler, port=0, client_timeout=200
+        )
+        self.server.start()
+
+        for _ in range(100):
+            if self.server.selector is not None:
+                break
+            time.sleep(0.01)
+        self.port = self.server.trans.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join(5)
+
+    def test_partial_call_frees_worker(self):
+        stalled = socket.create_connection(("127.0.0.1", self.port))
+        client = make_client(
+            bg_utils.bg_thrift.BartenderBackend, "127.0.0.1", self.port, timeout=5000
+        )
+        try:
+            # Start of a message header, then nothing. This takes the only worker.
+            stalled.sendall(b"\x80\x01")
+            for _ in range(100):
+                if self.server.futures:
+                    break
+                time.sleep(0.01)
+
+            client.ping()
+
+            stalled.settimeout(5)
+            self.assertEqual(b"", stalled.recv(1))
+        finally:
+            stalled.close()
+            client.close()
+
+
+class WrappedTProcessorTest(unittest.TestCase):
+    def setUp(self):
+        self.processor = WrappedTProcessor(
+            "baseEx",
+            bg_utils.bg_thrift.BaseException,
+            bg_utils.bg_thrift.BartenderBackend,
+            Mock(),
+        )
+        self.oprot = Mock()
+
+    def test_process_out(self):
+        result = Mock(oneway=False)
+        self.processor.send_result = Mock()
+
+        self.processor.process_out(self.oprot, "getVersion", 1, result, lambda: "1.0")
+        self.assertEqual("1.0", result.success)
+        self.processor.send_result.assert_called_once_with(
+            self.oprot, "getVersion", result, 1
+        )
+
+    def test_process_out_unknown_method(self):
+        error = TApplicationException(TApplicationException.UNKNOWN_METHOD)
+        self.processor.send_exception = Mock()
+
+        self.processor.process_out(self.oprot, "bad", 1, error, None)
+        self.processor.send_exception.assert_called_once_with(
+            self.oprot, "bad", error, 1
+        )
+
+
+class TLSServeTest(unittest.TestCase):
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def setUp(self):
+        handler = Mock()
+        handler.startInstance.side_effect = lambda instance_id: instance_id
+        self.server = make_server(
+            bg_utils.bg_thrift.BartenderBackend,
+            handler,
+            port=0,
+            cert_file=CERT_FILE,
+            handshake_timeout=0.5,
+        )
+        self.server.SELECT_TIMEOUT = 0.1
+        self.server.start()
+
+        for _ in range(100):
+            if self.server.selector is not None:
+                break
+            time.sleep(0.01)
+        self.port = self.server.trans.sock.getsockname()[1]
+
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join(5)
+
+    def _wait_for(self, condition):
+        for _ in range(200):
+            if condition():
+                break
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_slow_handshake_does_not_block_others(self):
+        stalled = socket.create_connection(("127.0.0.1", self.port))
+        client = make_client(
+            bg_utils.bg_thrift.BartenderBackend,
+            "127.0.0.1",
+            self.port,
+            ssl_context=self.context,
+        )
+        try:
+            self.assertEqual("id", client.startInstance("id"))
+
+            # The stalled client is dropped once its handshake times out
+            stalled.settimeout(5)
+            self.assertEqual(b"", stalled.recv(1))
+            self.assertEqual(1, self.server.tls_stats["timed_out"])
+        finally:
+            client.close()
+            stalled.close()
+
+    @unittest.skipUnless(hasattr(ssl, "TLSVersion"), "Needs Python 3.7+")
+    def test_session_resumption(self):
+        self.context.maximum_version = ssl.TLSVersion.TLSv1_2
+
+        first = self.context.wrap_socket(
+            socket.create_connection(("127.0.0.1", self.port))
+        )
+        second = self.context.wrap_socket(
+            socket.create_connection(("127.0.0.1", self.port)), session=first.session
+        )
+        try:
+            self.assertTrue(second.session_reused)
+            self._wait_for(lambda: self.server.tls_stats["handshakes"] == 2)
+            self.assertEqual(1, self.server.tls_stats["resumed"])
+        finally:
+            first.close()
+            second.close()
+
+
+class WireFormatServeTest(unittest.TestCase):
+    def _round_trip(self, transport, protocol):
+        handler = Mock()
+        handler.startInstance.side_effect = lambda instance_id: instance_id
+        handler.getQueueInfo.return_value = bg_utils.bg_thrift.QueueInfo("q", 3)
+
+        with patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG))):
+            server = make_server(
+                bg_utils.bg_thrift.BartenderBackend,
+                handler,
+                port=0,
+                transport=transport,
+                protocol=protocol,
+            )
+        server.start()
+        try:
+            for _ in range(100):
+                if server.selector is not None:
+                    break
+                time.sleep(0.01)
+
+            client = make_client(
+                bg_utils.bg_thrift.BartenderBackend,
+                "127.0.0.1",
+                server.trans.sock.getsockname()[1],
+                trans_factory=TRANSPORTS[transport](),
+                proto_factory=PROTOCOLS[protocol](),
+            )
+            try:
+                self.assertEqual("id", client.startInstance("id"))
+                info = client.getQueueInfo("system", "1.0.0", "default")
+                self.assertEqual(("q", 3), (info.name, info.size))
+            finally:
+                client.close()
+        finally:
+            server.stop()
+            server.join(5)
+
+    def test_framed_binary(self):
+        self._round_trip("framed", "binary")
+
+    def test_buffered_compact(self):
+        self._round_trip("buffered", "compact")
+
+    def test_framed_compact(self):
+        self._round_trip("framed", "compact")
+
 
 class MakeServerTest(unittest.TestCase):
-    @patch("bartender.config", Mock(thrift=Mock(max_workers=1)))
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
     def test_make_server_no_cert(self):
         server = make_server(Mock(), Mock())
         self.assertIsInstance(server.trans, TServerSocket)
         self.assertNotIsInstance(server.trans, TSSLServerSocket)
 
-    @patch("bartender.config", Mock(thrift=Mock(max_workers=1)))
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
     @patch("thriftpy2.transport.sslsocket.os", Mock())
-    @patch("thriftpy2.transport.sslsocket.create_thriftpy_context", Mock())
+    @patch("thriftpy2.transport.sslsocket.create_thriftpy_context", MagicMock())
     def test_make_server_with_cert(self):
         server = make_server(Mock(), Mock(), cert_file=Mock())
         self.assertIsInstance(server.trans, TSSLServerSocket)
+
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def test_make_server_wire_format(self):
+        server = make_server(Mock(), Mock(), transport="framed", protocol="compact")
+        self.assertIsInstance(server.itrans_factory, TRANSPORTS["framed"])
+        self.assertIsInstance(server.iprot_factory, PROTOCOLS["compact"])
+
+    def test_make_server_unknown_wire_format(self):
+        with self.assertRaises(ValueError):
+            make_server(Mock(), Mock(), transport="http")
+        with self.assertRaises(ValueError):
+            make_server(Mock(), Mock(), protocol="json")
+
+    def test_make_server_session_tickets(self):
+        with patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG))):
+            with_tickets = make_server(Mock(), Mock(), cert_file=CERT_FILE)
+            without_tickets = make_server(
+                Mock(), Mock(), cert_file=CERT_FILE, session_tickets=False
+            )
+
+        self.assertFalse(with_tickets.trans.ssl_context.options & ssl.OP_NO_TICKET)
+        self.assertTrue(without_tickets.trans.ssl_context.options & ssl.OP_NO_TICKET)
+
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def test_make_server_backlog(self):
+        server = make_server(Mock(), Mock(), backlog=512)
+        self.assertEqual(512, server.trans.backlog)
+        self.assertTrue(server.tcp_nodelay)
+
+    @patch("bartender.config", Mock(thrift=Mock(**THRIFT_CONFIG)))
+    def test_make_server_unix_socket(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "thrift.sock")
+            open(path, "w").close()
+
+            server = make_server(Mock(), Mock(), unix_socket=path)
+            server.trans.listen()
+            try:
+                self.assertEqual(path, server.trans.sock.getsockname())
+            finally:
+                server.trans.close()
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,98 @@
+import pytest
+from mock import Mock
+
+from bartender.catalog import CachedSystem
+from bartender.validation_plan import (
+    COERCERS,
+    ParameterPlan,
+    ValidationPlan,
+    collapse_choices,
+    fingerprint,
+)
+from bg_utils.mongo.models import Choices, Parameter
+from brewtils.errors import ModelValidationError
+
+
+class TestParameterPlan(object):
+    @pytest.mark.parametrize(
+        "param_type,expected", [("String", "STRING"), ("integer", "INTEGER")]
+    )
+    def test_coerce(self, param_type, expected):
+        plan = ParameterPlan(Parameter(key="p1", type=param_type))
+        assert plan.coerce is COERCERS[expected]
+
+    def test_unknown_type(self):
+        plan = ParameterPlan(Mock(key="p1", type="UH OH THIS IS BAD", parameters=[]))
+        assert plan.coerce is None
+
+    def test_regex_compiled(self):
+        plan = ParameterPlan(Parameter(key="p1", optional=False, regex=r"^Hi.*"))
+        assert plan.regex.match("Hi World!")
+
+    def test_regex_optional_not_compiled(self):
+        plan = ParameterPlan(Parameter(key="p1", optional=True, regex=r"^Hi.*"))
+        assert plan.regex is None
+
+    def test_regex_invalid(self):
+        with pytest.raises(ModelValidationError):
+            ParameterPlan(Parameter(key="p1", optional=False, regex=r"("))
+
+    def test_sub_plan(self):
+        plan = ParameterPlan(
+            Parameter(
+                key="p1",
+                type="Dictionary",
+                parameters=[Parameter(key="nested", type="String")],
+            )
+        )
+        assert plan.sub_plan.valid_keys == ["nested"]
+
+    def test_static_choices(self):
+        plan = ParameterPlan(
+            Parameter(key="p1", choices=Choices(type="static", value=["a", "b"]))
+        )
+        assert plan.allowed == (["a", "b"], frozenset(["a", "b"]))
+
+    @pytest.mark.parametrize(
+        "choices",
+        [
+            None,
+            Choices(type="static", value={"a": ["b"]}),
+            Choices(type="url", value="http://localhost"),
+        ],
+    )
+    def test_no_static_choices(self, choices):
+        plan = ParameterPlan(Parameter(key="p1", choices=choices))
+        assert plan.allowed is None
+
+
+class TestCollapseChoices(object):
+    def test_values(self):
+        assert collapse_choices(["a", {"value": "b", "text": "B"}]) == (
+            ["a", "b"],
+            frozenset(["a", "b"]),
+        )
+
+    def test_unhashable(self):
+        assert collapse_choices([["a"], "b"]) == ([["a"], "b"], None)
+
+
+class TestValidationPlan(object):
+    def test_keys(self):
+        plan = ValidationPlan([Parameter(key="p1"), Parameter(key="p2")])
+        assert plan.valid_keys == ["p1", "p2"]
+        assert plan.valid_key_set == frozenset(["p1", "p2"])
+
+
+class TestFingerprint(object):
+    def test_stable(self, bg_system):
+        first = CachedSystem.from_system(bg_system).commands[0]
+        second = CachedSystem.from_system(bg_system).commands[0]
+        assert first.fingerprint == second.fingerprint
+        assert first.fingerprint == fingerprint(first.parameters)
+
+    def test_changes(self, bg_system):
+        before = CachedSystem.from_system(bg_system).commands[0]
+        bg_system.commands[0].parameters[0].maximum = 1000
+        after = CachedSystem.from_system(bg_system).commands[0]
+        assert before.fingerprint != after.fingerprint